@@ -3,7 +3,7 @@ import prompts
 import os
 import subprocess
 import utils
-from config import LLM_CONFIG
+from config import DIGEST_CONFIG, EXECUTION_CONFIG, LLM_CONFIG, RETRIEVAL_CONFIG
 import re
 import requests
 from duckduckgo_search import DDGS
@@ -12,6 +12,27 @@ from pdb import set_trace
 import argparse
 import json
 from bs4 import BeautifulSoup
+import notebook_utils
+from source_index import SourceIndex
+from vector_store import VectorStore
+from digest import SourceDigester
+from env_snapshot import EnvironmentSnapshot
+from package_resolver import PackageResolver, is_package_name
+from code_runner import CodeRunner, format_error_report, format_usage, input_fingerprints
+from preflight import preflight_check
+from cache_utils import content_hash
+from file_explorer import format_size
+from rate_limit import get_scheduler, request_topic
+from literature import (
+    ArxivClient,
+    PubMedClient,
+    SemanticScholarClient,
+    get_arxiv_client,
+    get_pubmed_client,
+    get_semantic_scholar_client,
+    normalize_arxiv_id,
+    semantic_scholar_id,
+)
 
 # add persistent context memory
 
@@ -104,7 +125,7 @@ class PrincipalInvestigatorAgent:
                     if self.verbose:
                         print("PI: Browsing Agent provided the following sources:")
                         # set_trace()
-                        print(sources[:1000])
+                        print(sources.preview(1000))
                         print("------------------------------------")
 
                     # The PI agent will now plan the next steps and print the plan to screen
@@ -281,15 +302,16 @@ class PrincipalInvestigatorAgent:
             # Step 1: Execute the code
             print("\n CodeExecutorAgent: Executing code...")
             execution_result = self.code_executor_agent.execute_code(code)
+            error_report = self.code_executor_agent.last_error_report
             
-            # Check if execution was successful
-            if "failed" not in execution_result.lower() and "User declined" not in execution_result:
+            # Check if execution was successful (decided by the executor, not by words in the output)
+            if self.code_executor_agent.last_execution_succeeded:
                 print("Code executed successfully!")
                 failure_attempts_since_user_prompt = 0
                 
                 # Step 2: Review the successful execution
                 print("\n CodeReviewerAgent: Reviewing successful execution...")
-                review_feedback = self.code_reviewer_agent.review_code(code, execution_result)
+                review_feedback = self.code_reviewer_agent.review_code(code, execution_result, error_report)
                 
                 # Ask user if they're satisfied
                 print(f"\n Code Review Feedback:")
@@ -319,7 +341,7 @@ class PrincipalInvestigatorAgent:
                 
                 # Step 3: Review the failed execution
                 print("\n CodeReviewerAgent: Reviewing failed execution...")
-                review_feedback = self.code_reviewer_agent.review_code(code, execution_result)
+                review_feedback = self.code_reviewer_agent.review_code(code, execution_result, error_report)
 
                 combined_sections = [
                     f"Code Executor Feedback:\n{executor_feedback}",
@@ -368,6 +390,11 @@ class BrowsingAgent:
 
     def browse(self, topic, pdf_content="", link_content="", files_dir_content=""):
         print(f"********* Browsing Agent: Gathering information for topic '{topic}' from source links, pdfs, directories, huggingface notebooks etc")
+        # tag outbound requests with the topic so concurrent topics share each domain fairly
+        with request_topic(topic):
+            return self._browse(topic, pdf_content, link_content, files_dir_content)
+
+    def _browse(self, topic, pdf_content="", link_content="", files_dir_content=""):
 
         results = {
             # "PubMed": self.search_pubmed(topic),
@@ -380,22 +407,23 @@ class BrowsingAgent:
             link_content = self.process_links(self.links)
 
         # Combine all sources (pubmed, duckduckgo, etc., and not PDFs or links)
-        sources = []
+        # as (name, content, pinned) entries; pinned entries are listings that always go into prompts in full
+        entries = []
         for source_name, source_results in results.items():
             if source_results:
-                sources.append(f"{source_name}:\n{source_results}")
+                entries.append((source_name, str(source_results), False))
        
         # Add PDF content if available
         if pdf_content:
-            sources.append(f"PDF Content:\n{pdf_content}")
+            entries.append(("PDF Content", pdf_content, False))
     
         # Add link content if available
         if link_content:
-            sources.append(f"Link Content:\n{link_content}")
+            entries.append(("Link Content", link_content, False))
     
         # Add files directory content if available
         if files_dir_content:
-            sources.append(f"Files Directory Content:\n{files_dir_content}")
+            entries.append(("Files Directory Content", files_dir_content, True))
         
         # Add current directory information to help with file path decisions
         try:
@@ -403,16 +431,17 @@ class BrowsingAgent:
             current_dir = os.getcwd()
             files_in_current_dir = []
             
-            # List files in current directory
-            for item in os.listdir(current_dir):
-                if os.path.isfile(item):
-                    files_in_current_dir.append(item)
+            # List files in current directory (one scandir call; DirEntry already knows the file type)
+            with os.scandir(current_dir) as dir_entries:
+                for item in dir_entries:
+                    if item.is_file():
+                        files_in_current_dir.append(item.name)
             
             current_dir_info = f"Current Working Directory: {current_dir}\n"
             current_dir_info += f"Files in current directory:\n"
             current_dir_info += "\n".join(files_in_current_dir)
             
-            sources.append(f"Current Directory Information:\n{current_dir_info}")
+            entries.append(("Current Directory Information", current_dir_info, True))
             
             if self.verbose:
                 print(f"Added current directory information with {len(files_in_current_dir)} files")
@@ -421,20 +450,42 @@ class BrowsingAgent:
             if self.verbose:
                 print(f"Could not get current directory information: {e}")
 
-        formatted_sources = "\n\n".join(sources)
         # set_trace()
 
-        if self.verbose:# print full content of each source
-            for source in sources:
-                print(f"Full content of {source[:100]}...")
-                print(source[100:])
+        if self.verbose:  # a preview of each source; the full text can be megabytes
+            for name, content, pinned in entries:
+                print(f"Preview of {name} ({len(content):,} characters):")
+                print(content[:500] + ("..." if len(content) > 500 else ""))
                 print("--------------------------------")
-        
+
+        # Sources are spooled to disk and handed around as lazily loaded Source handles;
+        # with retrieval enabled each prompt only receives the passages relevant to its task
+        index = SourceIndex(retrieval=RETRIEVAL_CONFIG["enabled"])
+        for name, content, pinned in entries:
+            index.add_source(name, name, content, pinned=pinned)
+        del entries
+
         if self.verbose:
             print("Browsing Agent: Sources gathered:")
-            print(formatted_sources[:1000])
-        
-        return formatted_sources
+            print(index.summary())
+            print(index.preview(1000))
+
+        # Embeddings are stored by content hash, so chunks seen in earlier runs are not re-embedded
+        if RETRIEVAL_CONFIG["enabled"] and RETRIEVAL_CONFIG["semantic"]:
+            try:
+                embedded = index.enable_semantic(VectorStore())
+                if self.verbose:
+                    print(f"Browsing Agent: Semantic retrieval enabled over {embedded} chunks")
+            except Exception as e:
+                print(f"Browsing Agent: Could not embed sources, using BM25 retrieval only: {e}")
+
+        # Digest the corpus once; every prompt of the run then reads the digest instead of the raw sources
+        if DIGEST_CONFIG["enabled"]:
+            digest = SourceDigester(verbose=self.verbose).digest_index(index)
+            if self.verbose:
+                print(f"Browsing Agent: Source digest ({len(digest):,} chars):")
+                print(digest[:1000])
+        return index
 
     def process_links(self, links):
         """Process multiple URLs and extract their content"""
@@ -442,19 +493,29 @@ class BrowsingAgent:
             return ""
         
         link_contents = []
+        # Semantic Scholar pages are rendered by JavaScript; their papers come from the API in one batch request
+        s2_links = [link for link in links if semantic_scholar_id(link)]
+        if s2_links:
+            print(f"Browsing Agent: Fetching {len(s2_links)} Semantic Scholar papers")
+            link_contents.append(self.extract_semantic_scholar_contents(s2_links))
         for link in links:
+            if link in s2_links:
+                continue
             try:
                 print(f"Browsing Agent: Accessing link: {link}")
                 
                 # Special handling for HuggingFace notebook URLs
                 if "huggingface.co" in link and ".ipynb" in link:
                     content = self.extract_huggingface_notebook(link)
+                elif link.endswith(".ipynb"):
+                    # other remote or local notebooks are streamed the same way
+                    content = self.extract_notebook(link)
                 else:
                     # Regular web scraping
                     headers = {
                         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
                     }
-                    response = requests.get(link, headers=headers, timeout=10)
+                    response = get_scheduler().get(link, headers=headers, timeout=10)
                     
                     if response.status_code == 200:
                         soup = BeautifulSoup(response.content, 'html.parser')
@@ -496,107 +557,81 @@ class BrowsingAgent:
 
     def extract_huggingface_notebook(self, url):
         """Extract content from HuggingFace notebook URLs"""
+        # Convert blob URL to raw URL
+        raw_url = url.replace("/blob/", "/resolve/")
+        print(f"Extracting HuggingFace notebook from: {raw_url}")
+        return self.extract_notebook(url, raw_url, label="HuggingFace Jupyter Notebook")
+
+    def extract_notebook(self, url, raw_url=None, label="Jupyter Notebook"):
+        """
+        Extract markdown, code and (summarized) outputs from a remote or local .ipynb file.
+        The notebook is streamed cell by cell, so large embedded images are never loaded.
+        """
+        if raw_url is None:
+            raw_url = url
+            if "github.com" in url and "/blob/" in url:
+                raw_url = url.replace("github.com", "raw.githubusercontent.com").replace("/blob/", "/")
         try:
-            # Convert blob URL to raw URL
-            raw_url = url.replace("/blob/", "/resolve/")
-            
-            print(f"Extracting HuggingFace notebook from: {raw_url}")
-            response = requests.get(raw_url, timeout=10)
-            
-            if response.status_code == 200:
-                # Parse the notebook JSON
-                notebook = json.loads(response.text)
-                
-                content = f"URL: {url}\n"
-                content += "HuggingFace Jupyter Notebook Content:\n"
-                content += "=" * 50 + "\n"
-                
-                # Extract text and code from notebook cells
-                for i, cell in enumerate(notebook.get('cells', []), 1):
-                    cell_type = cell.get('cell_type', 'unknown')
-                    
-                    if cell_type == 'markdown':
-                        # Extract markdown text
-                        source = ''.join(cell.get('source', []))
-                        content += f"\n--- Markdown Cell {i} ---\n{source}\n"
-                        
-                    elif cell_type == 'code':
-                        # Extract code
-                        source = ''.join(cell.get('source', []))
-                        content += f"\n--- Code Cell {i} ---\n{source}\n"
-                        
-                        # Extract output if available
-                        outputs = cell.get('outputs', [])
-                        if outputs:
-                            content += f"\n--- Output {i} ---\n"
-                            for output in outputs:
-                                if output.get('output_type') == 'stream':
-                                    content += ''.join(output.get('text', []))
-                                elif output.get('output_type') == 'execute_result':
-                                    content += ''.join(output.get('data', {}).get('text/plain', []))
-                
-                return content
-            else:
-                return f"URL: {url}\nFailed to access HuggingFace notebook - Status code: {response.status_code}"
-                
+            content = f"URL: {url}\n"
+            content += f"{label} Content:\n"
+            content += "=" * 50 + "\n"
+            content += notebook_utils.notebook_to_text(raw_url, style="sections")
+            return content
+        except requests.HTTPError as e:
+            return f"URL: {url}\nFailed to access {label} - Status code: {e.response.status_code}"
         except Exception as e:
-            return f"URL: {url}\nError extracting HuggingFace notebook: {str(e)}"
+            return f"URL: {url}\nError extracting {label}: {str(e)}"
 
     def search_duckduckgo(self, query, max_results=5):
-        try:
+        def run_search():
             with DDGS() as ddgs:
-                results = ddgs.text(query)
-                return [res["href"] for res in list(results)[:max_results]]
+                return list(ddgs.text(query))[:max_results]
+
+        try:
+            return [res["href"] for res in get_scheduler().call("duckduckgo.com", run_search)]
         except Exception as e:
             print(f"DuckDuckGo search error: {e}")
             return []
 
     def search_pubmed(self, query, max_results=5):
         try:
-            url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-            params = {
-                "db": "pubmed",
-                "term": query,
-                "retmode": "json",
-                "retmax": max_results
-            }
-            res = requests.get(url, params=params)
-            ids = res.json()["esearchresult"]["idlist"]
-            return [f"https://pubmed.ncbi.nlm.nih.gov/{pid}/" for pid in ids]
+            found = get_pubmed_client().search(query, max_results=max_results, use_history=False)
+            return [f"https://pubmed.ncbi.nlm.nih.gov/{pid}/" for pid in found["ids"]]
         except Exception as e:
             print(f"PubMed search error: {e}")
             return []
 
     def search_arxiv(self, query, max_results=5):
         try:
-            base_url = "http://export.arxiv.org/api/query"
-            params = {
-                "search_query": f"all:{query}",
-                "start": 0,
-                "max_results": max_results
-            }
-            response = requests.get(base_url, params=params)
-            root = ET.fromstring(response.content)
-            return [entry.find("{http://www.w3.org/2005/Atom}id").text for entry in root.findall("{http://www.w3.org/2005/Atom}entry")]
+            return [paper["url"] for paper in get_arxiv_client().search(query, max_results=max_results)]
         except Exception as e:
             print(f"arXiv search error: {e}")
             return []
 
     def search_semantic_scholar(self, query, max_results=5):
         try:
-            url = f"https://api.semanticscholar.org/graph/v1/paper/search"
-            params = {
-                "query": query,
-                "limit": max_results,
-                "fields": "title,url"
-            }
-            res = requests.get(url, params=params)
-            data = res.json()
-            return [paper["url"] for paper in data.get("data", [])]
+            papers = get_semantic_scholar_client().search(query, max_results=max_results)
+            return [paper["url"] for paper in papers if paper.get("url")]
         except Exception as e:
             print(f"Semantic Scholar search error: {e}")
             return []
 
+    def extract_semantic_scholar_contents(self, urls):
+        """Fetch titles, abstracts and citation counts of several Semantic Scholar paper URLs with one /paper/batch request"""
+        ids = {url: semantic_scholar_id(url) for url in urls}
+        try:
+            papers = {paper["paperId"]: paper for paper in get_semantic_scholar_client().fetch([i for i in ids.values() if i])}
+            content = ""
+            for url, paper_id in ids.items():
+                if paper_id in papers:
+                    content += SemanticScholarClient.format_paper(papers[paper_id])
+                else:
+                    content += f"\n[Semantic Scholar Paper]\n{url}\nCould not find paper details.\n"
+            return content
+        except Exception as e:
+            print(f"Error fetching Semantic Scholar content: {e}")
+            return "".join(f"\n[Semantic Scholar Paper]\n{url}\nCould not fetch Semantic Scholar content.\n" for url in urls)
+
     def fetch_special_url_content(self, sources):
         """
         Attempts to fetch content from URLs that might require special handling
@@ -614,6 +649,19 @@ class BrowsingAgent:
             r"eutils\.ncbi\.nlm\.nih\.gov/entrez/eutils/esearch\.fcgi"
         ]
 
+        # PubMed articles are fetched together in batched efetch requests instead of one request per match
+        pubmed_matches = re.findall(r"pubmed\.ncbi\.nlm\.nih\.gov/[^/]+", enhanced_sources)
+        if pubmed_matches:
+            enhanced_sources += self.extract_pubmed_contents(pubmed_matches)
+        # same for arXiv: one id_list query covers every abstract URL
+        arxiv_matches = re.findall(r"arxiv\.org/abs/[^/\s]+", enhanced_sources)
+        if arxiv_matches:
+            enhanced_sources += self.extract_arxiv_contents(arxiv_matches)
+        # and for Semantic Scholar: one /paper/batch request
+        s2_matches = re.findall(r"semanticscholar\.org/paper/[^\s\"'<>)]+", enhanced_sources)
+        if s2_matches:
+            enhanced_sources += self.extract_semantic_scholar_contents(list(dict.fromkeys(s2_matches)))
+
         for pattern in url_patterns:
             matches = re.findall(pattern, enhanced_sources)
             for match in matches:
@@ -624,9 +672,9 @@ class BrowsingAgent:
                 elif "raw.githubusercontent.com" in match:
                     enhanced_sources += self.extract_github_content(match)
                 elif "arxiv.org" in match:
-                    enhanced_sources += self.extract_arxiv_content(match)
+                    continue  # already fetched in a batch above
                 elif "pubmed.ncbi.nlm.nih.gov" in match:
-                    enhanced_sources += self.extract_pubmed_content(match)
+                    continue  # already fetched in a batch above
                 elif "duckduckgo.com" in match:
                     enhanced_sources += self.extract_duckduckgo_content(match)
                 elif "eutils.ncbi.nlm.nih.gov" in match:
@@ -644,15 +692,14 @@ class BrowsingAgent:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = requests.get(resolve_url, headers=headers, timeout=10)
+            # Try to parse as Jupyter notebook, streaming it instead of downloading it whole
+            if url.endswith('.ipynb'):
+                return self.parse_jupyter_notebook(resolve_url)
+            
+            response = get_scheduler().get(resolve_url, headers=headers, timeout=10)
             if response.status_code == 200:
                 content = response.text
-                
-                # Try to parse as Jupyter notebook
-                if url.endswith('.ipynb'):
-                    return self.parse_jupyter_notebook(content)
-                else:
-                    return content[:2000] + "..." if len(content) > 2000 else content
+                return content[:2000] + "..." if len(content) > 2000 else content
             else:
                 print(f"Failed to fetch HuggingFace content: {response.status_code}")
                 return None
@@ -672,7 +719,7 @@ class BrowsingAgent:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = requests.get(raw_url, headers=headers, timeout=10)
+            response = get_scheduler().get(raw_url, headers=headers, timeout=10)
             if response.status_code == 200:
                 content = response.text
                 return content[:2000] + "..." if len(content) > 2000 else content
@@ -692,7 +739,7 @@ class BrowsingAgent:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = requests.get(url, headers=headers, timeout=10)
+            response = get_scheduler().get(url, headers=headers, timeout=10)
             if response.status_code == 200:
                 soup = BeautifulSoup(response.content, 'html.parser')
                 text_content = soup.get_text()
@@ -707,80 +754,67 @@ class BrowsingAgent:
 
 
     def parse_jupyter_notebook(self, content):
-        """Parse Jupyter notebook content"""
+        """Parse Jupyter notebook content (JSON text, a local path or a raw URL), streaming it cell by cell"""
         try:
-            notebook = json.loads(content)
-            cells = notebook.get('cells', [])
-            
-            extracted_text = []
-            for i, cell in enumerate(cells):
-                cell_type = cell.get('cell_type', '')
-                source = cell.get('source', [])
-                
-                if isinstance(source, list):
-                    text = ''.join(source)
-                else:
-                    text = str(source)
-                
-                if cell_type == 'markdown':
-                    extracted_text.append(f"## Cell {i+1} (Markdown)\n{text}\n")
-                elif cell_type == 'code':
-                    extracted_text.append(f"## Cell {i+1} (Code)\n```python\n{text}\n```\n")
-            
-            return '\n'.join(extracted_text)
+            return notebook_utils.notebook_to_text(content, include_outputs=False)
         except Exception as e:
             print(f"Error parsing notebook: {e}")
             return content
 
     def extract_arxiv_content(self, url):
+        return self.extract_arxiv_contents([url])
+
+    def extract_arxiv_contents(self, urls):
+        """Fetch the abstracts of several arXiv URLs with a single (cached) id_list query"""
         try:
-            base_url = "http://export.arxiv.org/api/query"
-            params = {
-                "search_query": f"all:{url.split('/')[-1]}", # Assuming the last part of the URL is the ID
-                "start": 0,
-                "max_results": 1 # Fetch only one result
-            }
-            response = requests.get(base_url, params=params)
-            root = ET.fromstring(response.content)
-            entry = root.find("{http://www.w3.org/2005/Atom}entry")
-            if entry:
-                title = entry.find("{http://www.w3.org/2005/Atom}title").text
-                summary = entry.find("{http://www.w3.org/2005/Atom}summary").text
-                return f"\n[ArXiv Paper]\n{url}\n{title}\n{summary}\n"
-            else:
-                return f"\n[ArXiv Paper]\n{url}\nCould not find paper summary.\n"
+            papers = {paper["id"]: paper for paper in get_arxiv_client().fetch(urls)}
+            content = ""
+            for url in dict.fromkeys(urls):
+                paper = papers.get(normalize_arxiv_id(url))
+                if paper:
+                    content += ArxivClient.format_paper(paper)
+                else:
+                    content += f"\n[ArXiv Paper]\n{url}\nCould not find paper summary.\n"
+            return content
         except Exception as e:
             print(f"Error fetching ArXiv content: {e}")
-            return f"\n[ArXiv Paper]\n{url}\nCould not fetch ArXiv content.\n"
+            return "".join(f"\n[ArXiv Paper]\n{url}\nCould not fetch ArXiv content.\n" for url in urls)
 
     def extract_pubmed_content(self, url):
+        return self.extract_pubmed_contents([url])
+
+    def extract_pubmed_contents(self, urls):
+        """Fetch the abstracts of several PubMed URLs/PMIDs in batched efetch requests"""
+        pmids = []
+        for url in urls:
+            pid = url.rstrip("/").split("/")[-1]
+            if pid.isdigit() and pid not in pmids:
+                pmids.append(pid)
+        if not pmids:
+            return "".join(f"\n[PubMed Article]\n{url}\nCould not find article summary.\n" for url in urls)
         try:
-            url = url.replace("pubmed.ncbi.nlm.nih.gov", "eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi")
-            params = {
-                "db": "pubmed",
-                "term": url.split("/")[-1], # Assuming the last part of the URL is the ID
-                "retmode": "json",
-                "retmax": 1
-            }
-            res = requests.get(url, params=params)
-            data = res.json()
-            if data.get("esearchresult", {}).get("idlist"):
-                pid = data["esearchresult"]["idlist"][0]
-                return f"\n[PubMed Article]\n{url}\nCould not find article summary.\n"
-            else:
-                return f"\n[PubMed Article]\n{url}\nCould not find article summary.\n"
+            articles = get_pubmed_client().fetch_abstracts(pmids)
+            found = {article["pmid"] for article in articles}
+            content = "".join(PubMedClient.format_article(article) for article in articles)
+            for pid in pmids:
+                if pid not in found:
+                    content += f"\n[PubMed Article]\nhttps://pubmed.ncbi.nlm.nih.gov/{pid}/\nCould not find article summary.\n"
+            return content
         except Exception as e:
             print(f"Error fetching PubMed content: {e}")
-            return f"\n[PubMed Article]\n{url}\nCould not fetch PubMed content.\n"
+            return "".join(f"\n[PubMed Article]\n{url}\nCould not fetch PubMed content.\n" for url in urls)
 
     def extract_duckduckgo_content(self, url):
-        try:
+        def run_search():
             with DDGS() as ddgs:
-                results = ddgs.text(url)
-                if results:
-                    return f"\n[DuckDuckGo Search]\n{url}\n{results[0]['body']}\n"
-                else:
-                    return f"\n[DuckDuckGo Search]\n{url}\nCould not find search results.\n"
+                return list(ddgs.text(url))
+
+        try:
+            results = get_scheduler().call("duckduckgo.com", run_search)
+            if results:
+                return f"\n[DuckDuckGo Search]\n{url}\n{results[0]['body']}\n"
+            else:
+                return f"\n[DuckDuckGo Search]\n{url}\nCould not find search results.\n"
         except Exception as e:
             print(f"Error fetching DuckDuckGo content: {e}")
             return f"\n[DuckDuckGo Search]\n{url}\nCould not fetch DuckDuckGo content.\n"
@@ -876,11 +910,141 @@ class CodeWriterAgent:
 
 # Code Executor Agent
 class CodeExecutorAgent:
-    def __init__(self, verbose=True, conda_env_path=None):
+    def __init__(self, verbose=True, conda_env_path=None, fork_server=None):
         self.verbose = verbose
         self.plan = None  # gets the plan from PI agent (self.code_writer_agent.plan = plan)
         self.conda_env_path = conda_env_path
-        
+        self.fork_server = fork_server  # None uses EXECUTION_CONFIG["fork_server"]
+        self.code_runner = None  # CodeRunner for the environment's interpreter, created on first execution
+        self.last_usage = None  # code_runner.Usage of the latest run (wall/CPU time, peak RSS)
+        self.last_execution_succeeded = False
+        self.last_error_report = None  # structured outcome of the latest execution (ExecutionResult.error_report)
+        self._execution_memo = {}  # execution key -> result of a successful run of that code
+        self._env_snapshot = None  # EnvironmentSnapshot, refreshed after installs or when the env changes on disk
+        self.env_time_saved = 0.0  # seconds of environment probing avoided by reusing the snapshot
+        self.package_resolver = PackageResolver()
+        self._llm_package_answers = {}  # module -> package suggested by the LLM, cached once its install worked
+
+    def _get_environment_snapshot(self, refresh=False):
+        """
+        Return the cached EnvironmentSnapshot of the conda environment (or of the system
+        Python when no environment is given), probing the interpreter only on first use.
+        When the env changed on disk the distribution index is refreshed incrementally.
+        Returns None if the environment cannot be used.
+        """
+        snapshot = self._env_snapshot
+        if snapshot is not None and not refresh:
+            if snapshot.is_stale():
+                snapshot.refresh()
+            snapshot.uses += 1
+            self.env_time_saved += snapshot.probe_seconds
+            return snapshot
+
+        self._env_snapshot = None
+        if self.conda_env_path and not self._verify_conda_environment():
+            return None
+        try:
+            self._env_snapshot = EnvironmentSnapshot.probe(self._get_python_executable(), self.conda_env_path)
+        except Exception as e:
+            print(f"Error probing conda environment: {e}")
+            return None
+        self._env_snapshot.uses = 1
+        return self._env_snapshot
+
+    def _refresh_environment(self):
+        """Update the distribution index after packages were installed"""
+        if self._env_snapshot is not None:
+            added, removed = self._env_snapshot.refresh()
+            if self.verbose and (added or removed):
+                print(f"Environment index updated: added {added}, removed {removed}")
+        if self.code_runner is not None:
+            self.code_runner.restart()  # the warm interpreter still has the old packages imported
+
+    def _get_code_runner(self, python_executable):
+        """CodeRunner for `python_executable`, kept across executions so a fork server stays warm"""
+        if self.code_runner is None or self.code_runner.python_executable != python_executable:
+            if self.code_runner is not None:
+                self.code_runner.close()
+            self.code_runner = CodeRunner(python_executable, fork_server=self.fork_server)
+        return self.code_runner
+
+    def _run_details(self, result):
+        """
+        Resource usage of the run (so reviewers can also judge performance) and the
+        files it wrote to its run directory, as lines for the execution result.
+        """
+        self.last_usage = getattr(result, "usage", None)
+        lines = [f"Resource usage: {format_usage(self.last_usage)}"] if self.last_usage else []
+        if getattr(result, "run_dir", None):
+            files = ", ".join(f"{path} ({format_size(size)})" for path, size in result.artifacts[:20])
+            more = f", ... and {len(result.artifacts) - 20} more" if len(result.artifacts) > 20 else ""
+            lines.append(f"Run directory: {result.run_dir}" + (f" (files written: {files}{more})" if files else ""))
+        return "\n".join(lines)
+
+    def _execution_key(self, cleaned_code):
+        """
+        Hash of the code, the input files it reads (size and mtime, see input_fingerprints)
+        and the environment fingerprint: equal keys mean re-running the code would redo the same work.
+        """
+        snapshot = self._get_environment_snapshot()
+        env = [snapshot.python_executable, list(snapshot.fingerprint)] if snapshot else [self._get_python_executable()]
+        return content_hash(json.dumps([cleaned_code, input_fingerprints(cleaned_code), env]))
+
+    def _preflight(self, cleaned_code):
+        """
+        Static checks before running the code (preflight.preflight_check). Missing modules go
+        through the usual install flow first. Returns the failure result when blocking problems
+        remain, None when the code can run; warnings (e.g. missing input files) are printed
+        before the run confirmation, where the user can still decide to run the code.
+        """
+        snapshot = self._get_environment_snapshot()
+        python_executable = self._get_python_executable()
+        report = preflight_check(cleaned_code, snapshot, python_executable)
+        if report.missing_modules:
+            print(f"Pre-flight check: modules missing from the environment: {report.missing_modules}")
+            if self._install_missing_modules(report.missing_modules):
+                report = preflight_check(cleaned_code, self._get_environment_snapshot(), python_executable)
+        if report.ok:
+            if self.verbose:
+                print(f"Pre-flight check passed ({report.seconds:.2f}s)" + ("" if report.checked else "; syntax newer than this interpreter, not analyzed"))
+            return None
+        if not report.blocking:
+            print("Pre-flight check warnings (the code can still be run, e.g. if these files are created first):")
+            print(report.format())
+            return None
+        print("Pre-flight check failed, the code was not run:")
+        print(report.format())
+        self.last_error_report = {"status": "preflight_failed", "issues": [issue._asdict() for issue in report.issues],
+                                  "missing_modules": report.missing_modules}
+        return f"Execution failed (pre-flight check, the code was not run):\n{report.format()}"
+
+    def _install_missing_modules(self, modules):
+        """
+        Install what provides the missing `modules` in the environment (names resolved
+        locally first, then by the LLM). Returns True if packages were installed.
+        """
+        # Check which packages are actually missing
+        actually_missing = []
+        for package in modules:
+            if not self._check_package_installed(package):
+                actually_missing.append(package)
+            else:
+                print(f"Package '{package}' is already installed")
+        if not actually_missing:
+            print("All detected packages are already installed. The error might be due to import issues.")
+            return False
+
+        print(f"Packages that need installation: {actually_missing}")
+        packages_to_install = self._resolve_package_names_with_llm(actually_missing)
+
+        # Install packages in conda environment
+        if not self._install_packages_in_conda(packages_to_install):
+            return False
+        for mod, package in self._llm_package_answers.items():
+            self.package_resolver.remember(mod, package)
+        self._llm_package_answers = {}
+        return True
+
     def _verify_conda_environment(self):
         """Verify that the conda environment exists and is accessible"""
         if not self.conda_env_path:
@@ -909,6 +1073,8 @@ class CodeExecutorAgent:
     
     def _get_python_version(self):
         """Get the Python version from the conda environment"""
+        if self._env_snapshot is not None:
+            return self._env_snapshot.python_version
         try:
             python_executable = self._get_python_executable()
             result = subprocess.run(
@@ -928,6 +1094,13 @@ class CodeExecutorAgent:
     
     def _get_conda_env_info(self):
         """Get information about the conda environment"""
+        snapshot = self._get_environment_snapshot() if self.conda_env_path else None
+        if snapshot is not None:
+            return {
+                'python_version': snapshot.python_version,
+                'site_packages': snapshot.site_packages[0] if snapshot.site_packages else "",
+                'python_executable': snapshot.python_executable
+            }
         try:
             # Get the conda environment's site-packages directory
             python_executable = self._get_python_executable()
@@ -989,6 +1162,9 @@ class CodeExecutorAgent:
     
     def _list_installed_packages(self):
         """List all installed packages in the conda environment"""
+        snapshot = self._get_environment_snapshot() if self.conda_env_path else None
+        if snapshot is not None:
+            return snapshot.format_packages()
         try:
             pip_executable = self._get_pip_executable()
             result = subprocess.run(
@@ -1008,9 +1184,13 @@ class CodeExecutorAgent:
             return ""
     
     def _check_package_installed(self, package_name):
-        """Check if a specific package is installed"""
-        installed_packages = self._list_installed_packages()
-        return package_name.lower() in installed_packages.lower()
+        """Check if a module (or distribution) of that name is installed, using the environment's distribution index"""
+        snapshot = self._get_environment_snapshot()
+        if snapshot is not None:
+            return snapshot.has_module(package_name) or snapshot.has_distribution(package_name)
+        # no index: compare against the package column of `pip list`
+        installed = {line.split()[0].lower() for line in self._list_installed_packages().splitlines()[2:] if line.strip()}
+        return package_name.split(".")[0].lower() in installed
     
     def _install_packages_in_conda(self, packages):
         """Install packages in the conda environment"""
@@ -1077,6 +1257,7 @@ class CodeExecutorAgent:
             
             if result.returncode == 0:
                 print(f"Successfully installed packages: {clean_packages}")
+                self._refresh_environment()
                 return True
             else:
                 print(f"Failed to install packages: {result.stderr}")
@@ -1140,7 +1321,14 @@ class CodeExecutorAgent:
             
             return False
         
-    def execute_code(self, code):
+    def execute_code(self, code, force=False):
+        """
+        Run the code block in `code` and return the execution result text. A successful
+        result is memoized: executing identical code again with unchanged inputs and
+        environment returns it without running anything, unless force=True.
+        """
+        self.last_execution_succeeded = False
+        self.last_error_report = None
         if self.verbose:
             print("********** Code Executor Agent: executing code")
             
@@ -1148,20 +1336,21 @@ class CodeExecutorAgent:
             if self.conda_env_path:
                 print(f"Specified conda environment: {self.conda_env_path}")
                 
-                # Verify the environment exists and is accessible
-                if self._verify_conda_environment():
-                    # Get environment information
-                    env_info = self._get_conda_env_info()
-                    if env_info:
-                        print(f"Python version: {env_info['python_version']}")
-                        print(f"Python executable: {env_info['python_executable']}")
-                        print(f"Site-packages: {env_info['site_packages']}")
-                    
-                    # List installed packages
-                    print("\n=== Currently Installed Packages ===")
-                    installed_packages = self._list_installed_packages()
-                    print(installed_packages)  # Show full output
-                    print("=" * 50)
+                # Verify the environment and get its information (probed once, reused until it changes)
+                snapshot = self._get_environment_snapshot()
+                if snapshot:
+                    print(f"Python version: {snapshot.python_version}")
+                    print(f"Python executable: {snapshot.python_executable}")
+                    print(f"Site-packages: {snapshot.site_packages[0] if snapshot.site_packages else ''}")
+
+                    if snapshot.uses > 1:
+                        print(f"Environment unchanged: {len(snapshot.distributions)} installed packages "
+                              f"(snapshot reused, {self.env_time_saved:.1f}s of environment probing saved so far)")
+                    else:
+                        # List installed packages
+                        print("\n=== Currently Installed Packages ===")
+                        print(snapshot.format_packages())  # Show full output
+                        print("=" * 50)
                 else:
                     print("Conda environment verification failed. Using system Python.")
             else:
@@ -1179,6 +1368,18 @@ class CodeExecutorAgent:
 
         executed_code = cleaned_code
 
+        memo_key = self._execution_key(cleaned_code) if EXECUTION_CONFIG["memoize"] else None
+        if memo_key in self._execution_memo and not force:
+            print("Identical code with unchanged inputs and environment already ran successfully; reusing its result.")
+            self.last_execution_succeeded = True
+            self.last_error_report = {"status": "ok", "memoized": True}
+            return self._execution_memo[memo_key]
+
+        if EXECUTION_CONFIG["preflight"]:
+            preflight_failure = self._preflight(cleaned_code)
+            if preflight_failure:
+                return preflight_failure
+
         # print extracted code and ask for user confirmation
         print("\n========= Extracted code ========= \n")
         print(" *********** Code starts here (no non-code elements should be below this) ***********")
@@ -1196,97 +1397,59 @@ class CodeExecutorAgent:
             return feedback_msg
 
         try:
-            # save the cleaned code to a temporary file
-            temp_file = "temp_code.py"
-            with open(temp_file, "w") as f:
-                f.write(cleaned_code)
-
             # Get the appropriate Python executable
             python_executable = self._get_python_executable()
             
             # execute the code using the conda environment's Python
             print(f"\nExecuting the code using: {python_executable}\n")
-            result = subprocess.run(
-                [python_executable, temp_file], capture_output=True, text=True
-            )
-
-            # print standard output
-            print("\n=== Execution Output ===")
-            print(result.stdout)
-
-            # print standard error if any
-            if result.stderr:
-                print("\n=== Execution Errors ===")
-                print(result.stderr)
+            code_runner = self._get_code_runner(python_executable)
+            if code_runner.live_output:
+                print("\n=== Execution Output (live) ===")
+            # each run gets its own directory (script, working directory, output, artifacts)
+            result = code_runner.run_code(cleaned_code)
+
+            if not code_runner.live_output:
+                # print standard output
+                print("\n=== Execution Output ===")
+                print(result.stdout)
+
+                # print standard error if any
+                if result.stderr:
+                    print("\n=== Execution Errors ===")
+                    print(result.stderr)
+            print(self._run_details(result))
 
             # check if the execution failed due to missing packages
             if result.returncode != 0:
-                missing_packages = self._detect_missing_packages(result.stderr)
+                # modules from "No module named ..." lines anywhere in the output, also beyond the captured part
+                missing_packages = result.scan.missing_modules or self._detect_missing_packages(result.stderr)
                 if missing_packages:
                     print(f"Missing packages detected: {missing_packages}")
-                    
-                    # Check which packages are actually missing
-                    actually_missing = []
-                    for package in missing_packages:
-                        if not self._check_package_installed(package):
-                            actually_missing.append(package)
-                        else:
-                            print(f"Package '{package}' is already installed")
-                    
-                    if actually_missing:
-                        print(f"Packages that need installation: {actually_missing}")
-                        packages_to_install = self._resolve_package_names_with_llm(actually_missing)
-                        
-                        # Install packages in conda environment
-                        if self._install_packages_in_conda(packages_to_install):
-                            # Ask user again before retrying execution
-                            user_retry = input("\nPackages were installed in conda environment. Do you want to retry executing the code? (y/n): ").strip().lower()
-                            if user_retry != "y":
-                                reason = input("You declined to retry running the improved code. Why? (optional feedback): ").strip()
-                                feedback_msg = f"Execution skipped after fix: User declined to run improved code."
-                                if reason:
-                                    feedback_msg += f" Feedback: {reason}"
-                                print("User opted not to retry the code.")
-                                return feedback_msg
-
-                            # Proceed with re-execution
-                            print("\nRetrying execution after package installation...\n")
-                            result = subprocess.run([python_executable, temp_file], capture_output=True, text=True)
-                    else:
-                        print("All detected packages are already installed. The error might be due to import issues.")
-
+                    if self._install_missing_modules(missing_packages):
+                        # Ask user again before retrying execution
+                        user_retry = input("\nPackages were installed in conda environment. Do you want to retry executing the code? (y/n): ").strip().lower()
+                        if user_retry != "y":
+                            reason = input("You declined to retry running the improved code. Why? (optional feedback): ").strip()
+                            feedback_msg = f"Execution skipped after fix: User declined to run improved code."
+                            if reason:
+                                feedback_msg += f" Feedback: {reason}"
+                            print("User opted not to retry the code.")
+                            return feedback_msg
+
+                        # Proceed with re-execution
+                        print("\nRetrying execution after package installation...\n")
+                        result = code_runner.run_code(cleaned_code)
+
+            # classified in one pass while the output streamed in (code_runner.ERROR_PATTERNS and
+            # the traceback parser), including output dropped from the capture
+            error_report = result.error_report()
+            self.last_error_report = error_report
             if result.returncode == 0:
-                # Check if the output contains error messages in both stdout and stderr
-                stdout_text = result.stdout.lower()
-                stderr_text = result.stderr.lower() if result.stderr else ""
-                
-                error_indicators = [
-                    'error', 'failed', 'exception', 'traceback', 'module not found',
-                    'no module named', 'import error', 'syntax error', 'typeerror',
-                    'valueerror', 'attributeerror', 'keyerror', 'indexerror',
-                    'file not found', 'permission denied', 'timeout', 'connection error',
-                    'not found at', 'does not exist', 'cannot find', 'missing file'
-                ]
-                
-                # Check for logging error patterns (e.g., "ERROR - Error: file not found")
-                logging_error_patterns = [
-                    r'error.*error:',  # Matches "ERROR - Error:"
-                    r'error.*not found',  # Matches "ERROR - file not found"
-                    r'error.*failed',  # Matches "ERROR - operation failed"
-                ]
+                has_error_in_stdout = result.scan.errors["stdout"] > 0
+                has_error_in_stderr = result.scan.errors["stderr"] > 0 or result.scan.tracebacks > 0
+                has_logging_error = result.scan.logging_error
                 
-                has_error_in_stdout = any(indicator in stdout_text for indicator in error_indicators)
-                has_error_in_stderr = any(indicator in stderr_text for indicator in error_indicators)
-                
-                # Check for logging error patterns in stderr
-                has_logging_error = False
-                if result.stderr:
-                    for pattern in logging_error_patterns:
-                        if re.search(pattern, result.stderr, re.IGNORECASE):
-                            has_logging_error = True
-                            break
-                
-                if has_error_in_stdout or has_error_in_stderr or has_logging_error:
+                if error_report["status"] == "error_in_output":
                     print("Execution failed (detected error in output):")
                     if result.stdout:
                         print("=== Standard Output ===")
@@ -1315,6 +1478,7 @@ class CodeExecutorAgent:
                     print(" EXECUTION FAILED (ERROR IN OUTPUT) - USER FEEDBACK REQUESTED")
                     print("="*60)
                     error_summary = ""
+                    error_summary += f"{format_error_report(error_report)}\n"
                     if has_error_in_stdout:
                         error_summary += f"Errors in stdout: {result.stdout}\n"
                     if has_error_in_stderr:
@@ -1324,15 +1488,21 @@ class CodeExecutorAgent:
                     
                     print(f"Error summary: {error_summary}")
                     response_parts = [f"Execution failed (error in output):\n{error_summary.strip()}"]
+                    response_parts.append(self._run_details(result))
                     response_parts.append("User feedback: No feedback collected for this failure.")
                     if llm_reasoning:
                         response_parts.append(f"Code Executor Feedback:\n{llm_reasoning}")
-                    return "\n\n".join(response_parts)
+                    return "\n\n".join(part for part in response_parts if part)
                 else:
                     print("Execution succeeded:")
+                    self.last_execution_succeeded = True
                     if result.stdout:
                         print(result.stdout)
-                    return result.stdout
+                    details = self._run_details(result)
+                    response = f"{result.stdout}\n\n{details}" if details else result.stdout
+                    if memo_key is not None:
+                        self._execution_memo[memo_key] = response
+                    return response
             else:
                 print("Execution failed:")
                 print(result.stderr)
@@ -1353,10 +1523,14 @@ class CodeExecutorAgent:
                     llm_reasoning = ""
                 
                 response_parts = [f"Execution failed:\n{result.stderr}"]
+                error_text = format_error_report(error_report)
+                if error_text:
+                    response_parts.append(f"Error report:\n{error_text}")
+                response_parts.append(self._run_details(result))
                 response_parts.append("User feedback: No feedback collected for this failure.")
                 if llm_reasoning:
                     response_parts.append(f"Code Executor Feedback:\n{llm_reasoning}")
-                return "\n\n".join(response_parts)
+                return "\n\n".join(part for part in response_parts if part)
                     
         except Exception as e:
             print("Execution failed with exception:")
@@ -1545,17 +1719,27 @@ class CodeExecutorAgent:
 
     def _resolve_package_names_with_llm(self, missing_modules):
         """
-        Detect missing packages from the error message.
+        Map missing modules to pip package names. Names are resolved locally first
+        (environment index, known mismatches, earlier answers); the LLM is only
+        asked about the modules that are still unknown.
         """
+        resolved, unresolved = self.package_resolver.resolve_many(missing_modules, self._env_snapshot)
         resolved_packages = []
+        for mod, (package, source) in resolved.items():
+            print(f"Resolved missing module '{mod}' -> '{package}' ({source})")
+            resolved_packages.append(package)
 
-        for mod in missing_modules:
+        self._llm_package_answers = {}
+        for mod in unresolved:
             prompt = prompts.get_package_resolution_prompt(mod)
 
             print(f"Asking LLM: What to install for missing module '{mod}'...")
             try:
                 response = query_llm(prompt).strip()
                 resolved_packages.append(response)
+                answer = response.split("</think>")[-1].strip()
+                if is_package_name(answer):
+                    self._llm_package_answers[mod] = answer
             except Exception as e:
                 print(f"LLM failed to resolve package for '{mod}': {e}")
                 
@@ -1595,16 +1779,21 @@ class CodeReviewerAgent:
         self.verbose = verbose
         self.plan = None  # gets the plan from PI agent (self.code_writer_agent.plan = plan)
         
-    def review_code(self, code, execution_result):
+    def review_code(self, code, execution_result, error_report=None):
+        """
+        Analyze the execution result and propose a fix. `error_report` is the executor's
+        structured outcome (CodeExecutorAgent.last_error_report: exception type, frames,
+        failing line, missing modules), given to the LLM next to the raw result.
+        """
         if self.verbose:
             print(f"********** Code Reviewer Agent: reviewing code based on {execution_result[:100]}...")
         
         # Use LLM to analyze the execution result and determine the appropriate fix
-        analysis_prompt = prompts.get_code_reviewer_analysis_prompt(code, execution_result)
+        analysis_prompt = prompts.get_code_reviewer_analysis_prompt(code, execution_result, error_report)
         analysis = query_llm(analysis_prompt, temperature=LLM_CONFIG["temperature"]["review"])
         
         # Use the analysis to create a targeted fix prompt
-        fix_prompt = prompts.get_code_reviewer_fix_prompt(code, execution_result, analysis)
+        fix_prompt = prompts.get_code_reviewer_fix_prompt(code, execution_result, analysis, error_report)
         
         return query_llm(fix_prompt, temperature=LLM_CONFIG["temperature"]["review"])
 
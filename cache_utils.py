@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from config import CACHE_DIR
+
+
+def content_hash(data):
+    """SHA-256 hex digest of a str or bytes object"""
+    if isinstance(data, str):
+        data = data.encode("utf-8", errors="replace")
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 hex digest of a file's content, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JsonCache:
+    """
+    Small persistent key -> JSON value cache, one file per key under CACHE_DIR/<namespace>.
+    Entries older than `ttl` seconds are treated as missing (ttl=None keeps them forever).
+    """
+
+    def __init__(self, namespace, ttl=None, cache_dir=None):
+        self.directory = os.path.join(cache_dir or CACHE_DIR, namespace)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(str(key).encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                self.misses += 1
+                return default
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            self.hits += 1
+            return value
+        except (OSError, ValueError):
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with self.lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)  # atomic, so concurrent readers never see a partial file
+
+    def get_many(self, keys):
+        """Return ({key: value} for cached keys, [keys that are missing])"""
+        found, missing = {}, []
+        for key in keys:
+            value = self.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        return found, missing
@@ -0,0 +1,924 @@
+import ast
+import codecs
+import json
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from config import EXECUTION_CONFIG
+from preflight import file_arguments
+
+try:
+    import resource
+except ImportError:  # not available on Windows: no limits, no rusage
+    resource = None
+
+Usage = namedtuple("Usage", ["wall_time", "user_time", "system_time", "max_rss_mb", "timed_out"])
+
+# What marks an output line as an error report, compiled into one case-sensitive regex
+# (one search per chunk). Lines are matched by their shape rather than by words
+# anywhere in them, so "0 errors", "mean squared error: 0.2" or "timeout=30" are not failures.
+ERROR_PATTERNS = {
+    "traceback": r"^Traceback \(most recent call last\):",
+    # "ValueError: ...", "numpy.linalg.LinAlgError: ...", "KeyboardInterrupt"
+    "exception": r"^(?:[A-Za-z_]\w*\.)*[A-Z]\w*(?:Error|Exception|Interrupt)(?::|$)",
+    # logging levels: "ERROR:root:...", "2024-01-01 10:00:00 - ERROR - ...", "[CRITICAL] ..."
+    "logged": r"\[(?:ERROR|CRITICAL|FATAL)\]|\b(?:ERROR|CRITICAL|FATAL) ?[-:|]",
+    # messages of scripts that catch an error and carry on ("Failed to converge ..., using best estimate" is not one)
+    "message": r"^\s*(?:Error|Fatal error)(?: ?[:!-]| (?:\w+ing|in|while|during|occurred|when)\b)|^\s*(?:FAILED\b|Failed:)",
+    # printed OSErrors ("[Errno 2] No such file or directory: 'x.csv'"), command-line tools
+    # ("cat: x.csv: No such file or directory") and printed ImportErrors ("No module named 'scanpy'")
+    "os_error": r"\[Errno \d+\]|^(?:\S[^:\n]*: )+(?:No such file or directory|Permission denied)$|^\s*(?:No module named '|File not found: )",
+}
+_ERROR_RE = re.compile("|".join(f"(?P<{kind}>{pattern})" for kind, pattern in ERROR_PATTERNS.items()), re.MULTILINE)
+# literal words every pattern contains: the re module scans a literal alternation many times faster,
+# so chunks are searched for these and _ERROR_RE only runs on the lines they occur in
+_TRIGGER_RE = re.compile(
+    r"Error|Exception|Interrupt|ERROR|CRITICAL|FATAL|Fatal|Failed|FAILED|Traceback|Errno|o such file|ermission denied|ile not found|o module named"
+)
+_MISSING_MODULE_RE = re.compile(r"No module named '?([\w.]+)'?")
+TRACEBACK_HEADER = "Traceback (most recent call last):"
+
+
+class ExecutionResult(subprocess.CompletedProcess):
+    """subprocess.CompletedProcess plus the resource usage, output scan and kill reason of the run"""
+
+    def __init__(self, args, returncode, stdout, stderr, usage=None, scan=None, killed=None):
+        super().__init__(args, returncode, stdout, stderr)
+        self.usage = usage
+        self.scan = scan  # OutputScanner
+        self.killed = killed  # None, "timeout", "traceback" or "server_exit"
+        self.run_dir = None  # RunSandbox directory, if it was kept
+        self.artifacts = []  # (relative path, size) of files the script wrote to its run directory
+        self.exit_note = ""  # why the run was killed (timeout, traceback kill, signal), "" if it exited by itself
+
+    def error_report(self):
+        """
+        OutputScanner.report() of the run plus its status (ok, failed, killed or error_in_output)
+        and kill reason. A run killed at the timeout gets a TimeoutError exception entry.
+        """
+        report = self.scan.report(self.args[-1]) if self.scan is not None else {
+            "exception": None, "frames": [], "failing_line": None, "missing_modules": [], "tracebacks": 0,
+            "error_lines": {}, "error_kinds": {},
+        }
+        if self.killed:
+            status = "killed"
+        elif self.returncode != 0:
+            status = "failed"
+        elif report["tracebacks"] or report["error_lines"]:
+            status = "error_in_output"
+        else:
+            status = "ok"
+        if self.killed == "timeout" and report["exception"] is None:
+            report["exception"] = {"type": "TimeoutError", "message": self.exit_note.split(": ", 1)[-1], "chained_from": []}
+        return dict(report, status=status, returncode=self.returncode, killed=self.killed, exit_note=self.exit_note)
+
+
+class RunSandbox:
+    """
+    Private directory of one execution under EXECUTION_CONFIG["runs_dir"]: the script
+    (named after the unique run id), the captured output and run record and, when
+    run_cwd is "sandbox", the script's working directory with the files it wrote.
+    Directories are created with mkdtemp, so concurrent executions never share one.
+    """
+
+    OWN_FILES = ("stdout.txt", "stderr.txt", "run.json")
+
+    def __init__(self, runs_dir=None):
+        runs_dir = runs_dir or EXECUTION_CONFIG["runs_dir"]
+        os.makedirs(runs_dir, exist_ok=True)
+        self.path = os.path.abspath(tempfile.mkdtemp(prefix=time.strftime("run_%Y%m%d_%H%M%S_"), dir=runs_dir))
+        self.run_id = os.path.basename(self.path)
+        self.script = os.path.join(self.path, f"{self.run_id}.py")
+
+    def write_script(self, code):
+        with open(self.script, "w", encoding="utf-8") as f:
+            f.write(code)
+        return self.script
+
+    def link_inputs(self, code, project_dir=None):
+        """
+        Symlink into the run directory the top-level entries of the relative paths
+        named in `code` ("data.csv", "data/x.csv" -> data), so that a script running
+        in its run directory still finds inputs given relative to the project directory.
+        """
+        project_dir = os.path.abspath(project_dir or os.getcwd())
+        for path in literal_paths(code, project_dir):
+            rel_path = os.path.relpath(path, project_dir)
+            if rel_path == "." or rel_path.startswith(".."):
+                continue
+            top = rel_path.split(os.sep)[0]
+            link = os.path.join(self.path, top)
+            if not os.path.lexists(link):
+                try:
+                    os.symlink(os.path.join(project_dir, top), link)
+                except OSError:
+                    continue
+
+    def artifacts(self):
+        """(relative path, size) of the files in the run directory other than the script and the run's own records"""
+        own = {os.path.basename(self.script), *self.OWN_FILES}
+        found = []
+        for directory, subdirs, files in os.walk(self.path):
+            subdirs[:] = [d for d in subdirs if d != "__pycache__"]
+            for name in files:
+                path = os.path.join(directory, name)
+                rel_path = os.path.relpath(path, self.path)
+                if rel_path in own or os.path.islink(path):
+                    continue
+                try:
+                    found.append((rel_path, os.path.getsize(path)))
+                except OSError:
+                    continue
+        return sorted(found)
+
+    def record(self, result):
+        """Store the captured output and a summary of the run next to the script"""
+        for name, text in (("stdout.txt", result.stdout), ("stderr.txt", result.stderr)):
+            with open(os.path.join(self.path, name), "w", encoding="utf-8") as f:
+                f.write(text)
+        with open(os.path.join(self.path, "run.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "run_id": self.run_id,
+                "returncode": result.returncode,
+                "killed": result.killed,
+                "usage": result.usage._asdict() if result.usage else None,
+                "artifacts": result.artifacts,
+            }, f, indent=2)
+
+    def cleanup(self, result, keep=None):
+        """
+        Apply the keep_runs policy: "all" keeps every run directory, "none" removes it,
+        "artifacts" keeps it only if the run failed or wrote files. Returns True if kept.
+        """
+        keep = keep or EXECUTION_CONFIG["keep_runs"]
+        if keep == "all" or (keep == "artifacts" and (result.returncode != 0 or result.artifacts)):
+            return True
+        shutil.rmtree(self.path, ignore_errors=True)
+        return False
+
+
+def format_usage(usage):
+    text = f"wall {usage.wall_time:.1f}s, CPU user {usage.user_time:.1f}s / system {usage.system_time:.1f}s"
+    if usage.max_rss_mb is not None:
+        text += f", peak RSS {usage.max_rss_mb:,.0f} MB"
+    if usage.timed_out:
+        text += ", killed at the wall-clock timeout"
+    return text
+
+
+def _max_rss_mb(ru_maxrss):
+    return ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)  # bytes on macOS, KB elsewhere
+
+
+def literal_paths(code, cwd=None):
+    """
+    String literals of `code` that name existing files or directories (relative ones
+    resolved against `cwd`), as absolute paths. Returns [] for code that does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+    cwd = cwd or os.getcwd()
+    paths = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and 0 < len(node.value) < 1024 and "\n" not in node.value:
+            path = os.path.join(cwd, os.path.expanduser(node.value))
+            if os.path.exists(path):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def input_fingerprints(code, cwd=None, max_files=10000):
+    """
+    (path, size, mtime_ns) of the inputs of `code`: the files its reading calls name
+    (preflight.file_arguments) and the files inside the directories named by its string
+    literals, up to `max_files` per directory. Paths the code writes, and the working
+    directory itself, are left out since the run changes them.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+    cwd = os.path.abspath(cwd or os.getcwd())
+    reads, writes = file_arguments(tree)
+    written = {os.path.abspath(os.path.join(cwd, os.path.expanduser(path))) for path in writes}
+    inputs = {os.path.abspath(os.path.join(cwd, os.path.expanduser(path))) for path in reads}
+    inputs.update(path for path in literal_paths(code, cwd) if os.path.isdir(path))
+    files = set()
+    for path in inputs - written - {cwd}:
+        if os.path.isfile(path):
+            files.add(path)
+        elif os.path.isdir(path):
+            found = []
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(names))
+                if len(found) > max_files:
+                    break
+            files.update(found[:max_files])
+    fingerprints = []
+    for path in sorted(files - written):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        fingerprints.append((path, st.st_size, st.st_mtime_ns))
+    return fingerprints
+
+
+def set_limits(memory_mb=None, cpu_seconds=None):
+    """Apply RLIMIT_AS / RLIMIT_CPU to the current process (called in the child before the script runs)"""
+    if resource is None:
+        return
+    if memory_mb:
+        resource.setrlimit(resource.RLIMIT_AS, (int(memory_mb) * 1024 * 1024,) * 2)
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_seconds), int(cpu_seconds) + 5))  # SIGXCPU, then SIGKILL
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)  # the child leads its own session, so this also stops its subprocesses
+    except AttributeError:  # Windows
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    except OSError:
+        pass
+
+
+class StreamCapture:
+    """
+    Bounded capture of one output stream: the first `head_bytes` and a ring buffer
+    of the last `tail_bytes`; whatever lies between is only counted.
+    """
+
+    def __init__(self, head_bytes, tail_bytes):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = deque()
+        self.tail_size = 0
+        self.total = 0
+
+    def feed(self, data):
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data and self.tail_bytes:
+            self.tail.append(data)
+            self.tail_size += len(data)
+            while len(self.tail) > 1 and self.tail_size - len(self.tail[0]) >= self.tail_bytes:
+                self.tail_size -= len(self.tail.popleft())
+
+    def text(self):
+        tail = b"".join(self.tail)[-self.tail_bytes:] if self.tail_bytes else b""
+        omitted = self.total - len(self.head) - len(tail)
+        marker = f"\n... [{omitted:,} bytes of output omitted] ...\n" if omitted > 0 else ""
+        return self.head.decode("utf-8", errors="replace") + marker + tail.decode("utf-8", errors="replace")
+
+
+class TracebackParser:
+    """
+    Parses Python tracebacks fed line by line into dicts with the exception type and
+    message, the frames (file, line, function, source line) and the exceptions it was
+    chained from ("During handling of the above exception ...").
+    """
+
+    FRAME_RE = re.compile(r'^\s+File "(?P<file>[^"]+)", line (?P<line>\d+)(?:, in (?P<function>.+))?$')
+    EXCEPTION_RE = re.compile(r"^(?P<type>(?:[A-Za-z_]\w*\.)*[A-Za-z_]\w*)(?:: ?(?P<message>.*))?$")
+    CHAIN_MARKERS = ("During handling of the above exception", "The above exception was the direct cause")
+
+    def __init__(self):
+        self.active = False
+        self.frames = []
+        self.chain = []  # types of the earlier exceptions of a chained traceback
+        self.last = None  # the traceback completed last
+
+    def feed_line(self, line):
+        """Returns the parsed traceback when `line` completes one, else None"""
+        if line.startswith(TRACEBACK_HEADER):
+            self.active = True
+            self.frames = []
+            return None
+        if not self.active and line.startswith('  File "') and self.FRAME_RE.match(line):
+            self.active = True  # SyntaxError of the script itself: printed without the header
+            self.frames = []
+        if not self.active:
+            if self.last is not None and line.startswith(self.CHAIN_MARKERS):
+                self.chain = self.last["chained_from"] + [self.last["type"]]
+            elif line.strip():
+                self.chain = []
+            return None
+        if line[:1].isspace() or not line:
+            frame = self.FRAME_RE.match(line)
+            if frame:
+                self.frames.append({"file": frame["file"], "line": int(frame["line"]), "function": frame["function"], "code": None})
+            elif self.frames and self.frames[-1]["code"] is None and line.strip().strip("^~ "):
+                self.frames[-1]["code"] = line.strip()
+            return None
+        self.active = False
+        exception = self.EXCEPTION_RE.match(line)
+        self.last = {
+            "type": exception["type"] if exception else line.split(":")[0],
+            "message": ((exception["message"] if exception else line) or "").strip(),
+            "frames": self.frames,
+            "chained_from": self.chain,
+        }
+        self.chain = []
+        return self.last
+
+
+def parse_traceback(text):
+    """The last traceback in `text` as TracebackParser parses it, or None"""
+    parser = TracebackParser()
+    for line in text.splitlines():
+        parser.feed_line(line)
+    return parser.last
+
+
+class OutputScanner:
+    """
+    Classifies a run's output while it arrives, in one pass: the ERROR_PATTERNS regex
+    over both streams and, on stderr, a TracebackParser for the lines of tracebacks.
+    The whole output is scanned even when only its head and tail are kept; report()
+    gives the outcome as structured data for the agents.
+    """
+
+    def __init__(self):
+        self.decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+        self.partial = {"stdout": "", "stderr": ""}
+        self.errors = {"stdout": 0, "stderr": 0}  # lines matching an error pattern
+        self.error_lines = {"stdout": [], "stderr": []}  # the first few of them
+        self.kinds = {}  # {ERROR_PATTERNS key: matching lines}
+        self.logging_error = False  # an ERROR/CRITICAL log record on stderr
+        self.missing_modules = []
+        self.tracebacks = 0  # complete tracebacks (header, frames and the exception line) on stderr
+        self.parser = TracebackParser()
+
+    @property
+    def traceback(self):
+        """The last complete traceback on stderr (see TracebackParser), or None"""
+        return self.parser.last
+
+    def feed(self, stream, data, final=False):
+        """Scan a chunk of `stream` (complete lines only); returns True if a traceback was completed by it"""
+        text = self.partial[stream] + self.decoders[stream].decode(data, final)
+        cut = len(text) if final else text.rfind("\n") + 1
+        text, self.partial[stream] = text[:cut], text[cut:]
+        if not text:
+            return False
+        # the patterns do not cross line ends, so whole chunks are searched and only lines with a trigger are matched
+        pos = 0
+        while True:
+            trigger = _TRIGGER_RE.search(text, pos)
+            if trigger is None:
+                break
+            start = text.rfind("\n", 0, trigger.start()) + 1
+            end = text.find("\n", trigger.end())
+            end = len(text) if end < 0 else end
+            line = text[start:end]
+            pos = end + 1
+            match = _ERROR_RE.search(line)
+            if match is None:
+                continue
+            self.errors[stream] += 1
+            self.kinds[match.lastgroup] = self.kinds.get(match.lastgroup, 0) + 1
+            if len(self.error_lines[stream]) < 5:
+                self.error_lines[stream].append(line[:300])
+            if match.lastgroup == "logged" and stream == "stderr":
+                self.logging_error = True
+            missing = _MISSING_MODULE_RE.search(line) if match.lastgroup in ("exception", "os_error") else None
+            if missing and missing.group(1) not in self.missing_modules:
+                self.missing_modules.append(missing.group(1))
+        if stream != "stderr" or not (self.parser.active or TRACEBACK_HEADER in text or '  File "' in text):
+            return False
+        completed = False
+        for line in text.splitlines():
+            if self.parser.feed_line(line) is not None:
+                self.tracebacks += 1
+                completed = True
+        return completed
+
+    def report(self, script=None):
+        """
+        Structured outcome: the exception (type, message, chained_from), its frames, the
+        failing line (the innermost frame in `script`, else the innermost frame), missing
+        modules and the first error lines per stream. Frames in `script` are shown as "<script>".
+        """
+        tb = self.traceback
+        frames = []
+        for frame in (tb["frames"] if tb else []):
+            in_script = script is not None and os.path.abspath(frame["file"]) == os.path.abspath(script)
+            frames.append(dict(frame, file="<script>" if in_script else frame["file"]))
+        failing = next((f for f in reversed(frames) if f["file"] == "<script>"), frames[-1] if frames else None)
+        return {
+            "exception": {"type": tb["type"], "message": tb["message"], "chained_from": tb["chained_from"]} if tb else None,
+            "frames": frames,
+            "failing_line": failing,
+            "missing_modules": list(self.missing_modules),
+            "tracebacks": self.tracebacks,
+            "error_lines": {stream: lines for stream, lines in self.error_lines.items() if lines},
+            "error_kinds": dict(self.kinds),
+        }
+
+
+def format_error_report(report, max_frames=8):
+    """Compact text of an OutputScanner.report() or ExecutionResult.error_report() for prompts and execution results"""
+    lines = []
+    if report.get("status") not in (None, "ok"):
+        returncode = f" (exit code {report['returncode']})" if report.get("returncode") is not None else ""
+        lines.append(f"Status: {report['status']}{returncode}")
+    exception = report["exception"]
+    if report.get("exit_note") and not (exception and exception["message"] and exception["message"] in report["exit_note"]):
+        lines.append(report["exit_note"])
+    if exception:
+        lines.append(f"Exception: {exception['type']}: {exception['message']}" if exception["message"] else f"Exception: {exception['type']}")
+        if exception["chained_from"]:
+            lines.append(f"Raised while handling: {', '.join(exception['chained_from'])}")
+    failing = report["failing_line"]
+    if failing:
+        code = f": {failing['code']}" if failing["code"] else ""
+        lines.append(f"Failing line: {failing['file']} line {failing['line']}{code}")
+    if len(report["frames"]) > 1:
+        frames = report["frames"][-max_frames:]
+        lines.append("Frames (most recent call last):")
+        if len(report["frames"]) > max_frames:
+            lines.append(f"  ... {len(report['frames']) - max_frames} earlier frames")
+        lines.extend(f"  {f['file']} line {f['line']}" + (f", in {f['function']}" if f["function"] else "") for f in frames)
+    if report["missing_modules"]:
+        lines.append(f"Missing modules: {', '.join(report['missing_modules'])}")
+    for stream, error_lines in report["error_lines"].items():
+        if not exception or stream == "stdout":
+            lines.append(f"Error lines in {stream}: " + " | ".join(error_lines))
+    return "\n".join(lines)
+
+
+class RunMonitor:
+    """
+    Reads the stdout/stderr pipes of a running script on two threads: bounded
+    capture, live echo to this process' console and incremental scanning. Kills the
+    script's process group at the wall-clock timeout and, with kill_on_traceback,
+    when the script is still alive `traceback_grace` seconds after its main thread
+    died of an uncaught exception (e.g. while non-daemon worker threads keep running).
+    That is reported by the RUNNER_SOURCE wrapper on `event_fd`, not guessed from
+    stderr, so tracebacks printed by handled exceptions (logging.exception) do not count.
+    """
+
+    def __init__(self, pid, stdout_fd, stderr_fd, timeout=None, live=False, kill_on_traceback=False, traceback_grace=2.0,
+                 event_fd=None):
+        self.pid = pid
+        self.fds = {"stdout": stdout_fd, "stderr": stderr_fd}
+        self.event_fd = event_fd
+        self.captures = {
+            name: StreamCapture(EXECUTION_CONFIG["capture_head_bytes"], EXECUTION_CONFIG["capture_tail_bytes"])
+            for name in self.fds
+        }
+        self.scanner = OutputScanner()
+        self.live = live
+        self.kill_on_traceback = kill_on_traceback
+        self.traceback_grace = traceback_grace
+        self.killed = None  # "timeout" or "traceback"
+        self.finished = False
+        self.lock = threading.Lock()
+        self.timers = [threading.Timer(timeout, self.kill, ["timeout"])] if timeout else []
+        self.readers = [threading.Thread(target=self._read, args=(name,), daemon=True) for name in self.fds]
+        if event_fd is not None:
+            self.readers.append(threading.Thread(target=self._read_events, daemon=True))
+        self.began = time.perf_counter()
+        for thread in self.readers + self.timers:
+            thread.daemon = True
+            thread.start()
+
+    def kill(self, reason):
+        with self.lock:
+            if self.killed is None:
+                self.killed = reason
+        _kill_group(self.pid)
+
+    def _read(self, name):
+        fd, capture = self.fds[name], self.captures[name]
+        echo = sys.stdout if name == "stdout" else sys.stderr
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                data = b""
+            with self.lock:
+                capture.feed(data)
+                self.scanner.feed(name, data, final=not data)
+            if self.live and data:
+                echo.write(decoder.decode(data))
+                echo.flush()
+            if not data:
+                break
+
+    def _read_events(self):
+        """Lines the RUNNER_SOURCE wrapper writes to event_fd ("uncaught": the main thread died of an exception)"""
+        while True:
+            try:
+                data = os.read(self.event_fd, 1024)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            with self.lock:
+                if b"uncaught" in data and self.kill_on_traceback and not self.finished:
+                    timer = threading.Timer(self.traceback_grace, self.kill, ["traceback"])
+                    timer.daemon = True
+                    self.timers.append(timer)
+                    timer.start()
+
+    def finish(self):
+        """Called once the script exited; returns its (stdout, stderr) text"""
+        with self.lock:
+            self.finished = True
+            for timer in self.timers:
+                timer.cancel()
+        for reader in self.readers:
+            reader.join(timeout=5)
+        if any(reader.is_alive() for reader in self.readers):
+            _kill_group(self.pid)  # background processes of the script still hold the pipes
+            for reader in self.readers:
+                reader.join()
+        for fd in self.fds.values():
+            os.close(fd)
+        if self.event_fd is not None:
+            os.close(self.event_fd)
+        return self.captures["stdout"].text(), self.captures["stderr"].text()
+
+    def timed_out(self):
+        return self.killed == "timeout"
+
+
+def _exit_note(result, timeout, cpu_seconds, traceback_grace):
+    """Explanation appended to stderr when the run was killed rather than exiting by itself"""
+    if result.killed == "timeout":
+        return f"\nTimeoutError: execution exceeded the {timeout}s wall-clock limit; the process group was killed.\n"
+    if result.killed == "traceback":
+        return f"\nProcess group killed: still running {traceback_grace}s after an uncaught exception in the main thread.\n"
+    if result.killed == "server_exit":
+        return "\nProcess group killed: the fork server exited while the script was running.\n"
+    if result.returncode < 0:
+        name = signal.Signals(-result.returncode).name if -result.returncode in signal.valid_signals() else str(-result.returncode)
+        note = f"\nProcess killed by signal {name}"
+        if name == "SIGXCPU" and cpu_seconds:
+            note += f" (CPU time limit of {cpu_seconds}s exceeded)"
+        return note + ".\n"
+    return ""
+
+
+# runs inside the target interpreter: imports the preload modules once, then forks one child per script.
+# Requests arrive as JSON lines on stdin, the child's stdout/stderr pipe ends over the unix socket in argv[2].
+# Runs a script as __main__ the way `python script.py` does, but reports an uncaught exception
+# of the main thread by writing "uncaught" to an event descriptor. Used by the fork server's
+# children and, with kill_on_traceback, as the launcher of fresh interpreters.
+RUNNER_SOURCE = r"""
+import os, runpy, sys, traceback
+
+
+def run_script(script, event_fd=None):
+    script = os.path.abspath(script)
+    if event_fd is not None:
+        os.set_inheritable(event_fd, False)  # subprocesses of the script must not keep it open
+    sys.argv = [script]
+    sys.path[0] = os.path.dirname(script)
+    if os.getcwd() not in sys.path:
+        sys.path.insert(1, os.getcwd())  # modules of the project directory the script runs in stay importable
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        raise
+    except BaseException as e:
+        # report the traceback from the script's first frame on, as `python script.py` would
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != script:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        sys.stderr.flush()
+        if event_fd is not None:
+            try:
+                os.write(event_fd, b"uncaught\n")
+            except OSError:
+                pass
+        raise SystemExit(1)  # the interpreter still waits for non-daemon threads
+    raise SystemExit(0)
+"""
+
+LAUNCHER_SCRIPT = RUNNER_SOURCE + "\nrun_script(sys.argv[2], int(sys.argv[1]))\n"
+
+SERVER_SCRIPT = RUNNER_SOURCE + r"""
+import importlib, json, socket
+
+if not hasattr(socket, "recv_fds") or not hasattr(os, "waitstatus_to_exitcode"):
+    print(json.dumps({"error": "the fork server needs Python 3.9 or newer"}))
+    raise SystemExit(1)
+preloaded = []
+for name in json.loads(sys.argv[1]):
+    try:
+        importlib.import_module(name)
+        preloaded.append(name)
+    except Exception:
+        pass
+fd_socket = socket.socket(fileno=int(sys.argv[2]))
+# protocol messages go to a private copy of stdout; stray prints end up on stderr
+channel = os.fdopen(os.dup(1), "w", buffering=1)
+os.dup2(2, 1)
+channel.write(json.dumps({"ready": preloaded}) + "\n")
+
+
+def run_child(request, fds):
+    os.setsid()
+    limits = request["limits"]
+    if limits.get("memory_mb") or limits.get("cpu_seconds"):
+        import resource
+        if limits.get("memory_mb"):
+            resource.setrlimit(resource.RLIMIT_AS, (int(limits["memory_mb"]) * 1024 * 1024,) * 2)
+        if limits.get("cpu_seconds"):
+            resource.setrlimit(resource.RLIMIT_CPU, (int(limits["cpu_seconds"]), int(limits["cpu_seconds"]) + 5))
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, 0)
+    for fd, pipe_fd in zip((1, 2), fds):
+        os.dup2(pipe_fd, fd)
+        os.close(pipe_fd)
+    if request["live"]:
+        sys.stdout.reconfigure(line_buffering=True)
+    script = os.path.abspath(request["script"])
+    os.chdir(request["cwd"] or os.path.dirname(script))
+    run_script(script, fds[2])
+
+
+for line in sys.stdin:
+    request = json.loads(line)
+    _, fds, _, _ = socket.recv_fds(fd_socket, 16, 3)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        channel.close()
+        fd_socket.close()
+        run_child(request, fds)  # ends with SystemExit, so the child shuts down like a normal interpreter
+    for fd in fds:
+        os.close(fd)
+    channel.write(json.dumps({"pid": pid}) + "\n")
+    _, status, rusage = os.wait4(pid, 0)
+    channel.write(json.dumps({
+        "returncode": os.waitstatus_to_exitcode(status),
+        "user_time": rusage.ru_utime,
+        "system_time": rusage.ru_stime,
+        "max_rss": rusage.ru_maxrss,
+    }) + "\n")
+"""
+
+
+class ForkServer:
+    """
+    Long-lived interpreter of the target environment that has imported the heavy
+    modules (numpy, pandas, scanpy, ...) once and forks a child for every script, so
+    a run starts without paying for those imports again. Each child starts a new
+    session and runs the script as __main__ in its own directory with stdin from
+    /dev/null. Its stdout/stderr are pipes created here (passed over a unix socket),
+    so they are read while it runs like those of a fresh interpreter, and its exit
+    status and rusage come from wait4. Scripts run one at a time.
+    """
+
+    def __init__(self, python_executable, preload):
+        self.python_executable = python_executable
+        self.lock = threading.Lock()
+        self.socket, server_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            self.process = subprocess.Popen(
+                [python_executable, "-c", SERVER_SCRIPT, json.dumps(list(preload)), str(server_socket.fileno())],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                pass_fds=[server_socket.fileno()],
+                text=True,
+                bufsize=1,
+            )
+        finally:
+            server_socket.close()
+        message = self._receive()
+        if "error" in message:
+            self.close()
+            raise RuntimeError(message["error"])
+        self.preloaded = message["ready"]
+
+    def _receive(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("fork server exited")
+        return json.loads(line)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, script, cwd=None, timeout=None, limits=None, live=False, kill_on_traceback=False, traceback_grace=2.0):
+        """
+        Run `script` in a forked child. Raises OSError/RuntimeError if the server fails
+        before the child is started (nothing ran); if it exits while the child runs, the
+        child's process group is killed and the result has killed="server_exit".
+        """
+        request = {"script": os.path.abspath(script), "cwd": os.path.abspath(cwd or os.getcwd()),
+                   "limits": limits or {}, "live": live}
+        with self.lock:
+            stdout_r, stdout_w = os.pipe()
+            stderr_r, stderr_w = os.pipe()
+            event_r, event_w = os.pipe()
+            try:
+                self.process.stdin.write(json.dumps(request) + "\n")
+                self.process.stdin.flush()
+                socket.send_fds(self.socket, [b"fds"], [stdout_w, stderr_w, event_w])
+                pid = self._receive()["pid"]
+            except (OSError, RuntimeError, ValueError, KeyError):
+                for fd in (stdout_r, stderr_r, event_r):
+                    os.close(fd)
+                raise
+            finally:
+                for fd in (stdout_w, stderr_w, event_w):
+                    os.close(fd)  # the child has its own copies now
+            monitor = RunMonitor(pid, stdout_r, stderr_r, timeout, live, kill_on_traceback, traceback_grace, event_r)
+            try:
+                status = self._receive()
+            except (OSError, RuntimeError, ValueError):
+                # the child is no longer reaped by anyone: stop it rather than let it run on unsupervised
+                _kill_group(pid)
+                status = None
+            wall_time = time.perf_counter() - monitor.began
+        stdout, stderr = monitor.finish()
+        if status is None:
+            usage = Usage(wall_time, 0.0, 0.0, None, False)
+            return ExecutionResult([self.python_executable, script], -signal.SIGKILL, stdout, stderr,
+                                   usage, monitor.scanner, "server_exit")
+        usage = Usage(wall_time, status["user_time"], status["system_time"], _max_rss_mb(status["max_rss"]), monitor.timed_out())
+        return ExecutionResult([self.python_executable, script], status["returncode"], stdout, stderr,
+                               usage, monitor.scanner, monitor.killed)
+
+    def close(self):
+        if self.alive():
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.socket.close()
+
+
+class CodeRunner:
+    """
+    Runs generated scripts in the target interpreter. By default every run is a fresh
+    `python script.py`; with fork_server=True (POSIX only) runs are forked from a warm
+    ForkServer that has the EXECUTION_CONFIG["preload"] modules imported. The server is
+    started on first use, restarted after package installs and replaced by plain
+    subprocess runs if it cannot be used.
+
+    run_code() gives each execution its own RunSandbox, so several can run at the
+    same time (runs through one ForkServer are serialized).
+
+    Every run is its own process group with the EXECUTION_CONFIG wall-clock timeout
+    (the whole group is killed when it expires) and optional RLIMIT_AS / RLIMIT_CPU
+    limits. Output is streamed through a RunMonitor: shown live, scanned for errors
+    as it arrives and kept only as a bounded head and tail. The returned
+    ExecutionResult carries wall time, user/system CPU time and peak RSS from wait4.
+    """
+
+    def __init__(self, python_executable, fork_server=None, preload=None):
+        self.python_executable = python_executable
+        self.use_fork_server = ((EXECUTION_CONFIG["fork_server"] if fork_server is None else fork_server)
+                                and hasattr(os, "fork") and hasattr(socket, "send_fds"))
+        self.preload = EXECUTION_CONFIG["preload"] if preload is None else preload
+        self.timeout = EXECUTION_CONFIG["timeout"]
+        self.limits = {"memory_mb": EXECUTION_CONFIG["memory_limit_mb"], "cpu_seconds": EXECUTION_CONFIG["cpu_time_limit"]}
+        self.live_output = EXECUTION_CONFIG["live_output"]
+        self.kill_on_traceback = EXECUTION_CONFIG["kill_on_traceback"]
+        self.traceback_grace = EXECUTION_CONFIG["traceback_grace"]
+        self.server = None
+        self.server_lock = threading.Lock()  # concurrent runs share one server
+
+    def _get_server(self):
+        with self.server_lock:
+            return self._start_server()
+
+    def _start_server(self):
+        if self.server is None or not self.server.alive():
+            try:
+                self.server = ForkServer(self.python_executable, self.preload)
+                print(f"Started fork server for {self.python_executable} (preloaded: {', '.join(self.server.preloaded) or 'nothing'})")
+            except Exception as e:
+                print(f"Could not start the fork server, running scripts in fresh interpreters: {e}")
+                self.server = None
+                self.use_fork_server = False
+        return self.server
+
+    def run(self, script, cwd=None, timeout=None):
+        """Run `script`; returns an ExecutionResult (a CompletedProcess with text stdout/stderr, .usage and .scan)"""
+        timeout = timeout or self.timeout
+        result = None
+        if self.use_fork_server:
+            server = self._get_server()
+            if server is not None:
+                try:
+                    result = server.run(script, cwd, timeout, self.limits, self.live_output,
+                                        self.kill_on_traceback, self.traceback_grace)
+                except (OSError, RuntimeError, ValueError, KeyError) as e:
+                    # the script was not started, so it can run in a fresh interpreter instead
+                    print(f"Fork server failed ({e}); running scripts in fresh interpreters from now on")
+                    self.restart()
+                    self.use_fork_server = False
+                if result is not None and result.killed == "server_exit":
+                    print("Fork server exited during the run; running scripts in fresh interpreters from now on")
+                    self.restart()
+                    self.use_fork_server = False
+        if result is None:
+            result = self._run_process(script, cwd, timeout)
+        note = _exit_note(result, timeout, self.limits["cpu_seconds"], self.traceback_grace)
+        result.stderr += note
+        result.exit_note = note.strip()
+        return result
+
+    def _run_process(self, script, cwd, timeout):
+        """Fresh `python script`, reaped with wait4 so its resource usage is known"""
+        limits = self.limits if resource is not None and any(self.limits.values()) else None
+        env = dict(os.environ, PYTHONUNBUFFERED="1") if self.live_output else dict(os.environ)
+        # the script lives in its run directory; modules next to its working directory must stay importable
+        run_cwd = os.path.abspath(cwd or os.getcwd())
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (run_cwd, env.get("PYTHONPATH")) if p)
+        # with kill_on_traceback the script is started through LAUNCHER_SCRIPT, which reports uncaught exceptions
+        event_r, event_w = os.pipe() if self.kill_on_traceback else (None, None)
+        command = [self.python_executable, "-c", LAUNCHER_SCRIPT, str(event_w), script] if event_w is not None else [self.python_executable, script]
+        try:
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=cwd,
+                env=env,
+                start_new_session=hasattr(os, "setsid"),
+                preexec_fn=(lambda: set_limits(**limits)) if limits else None,
+                pass_fds=[event_w] if event_w is not None else (),
+            )
+        except Exception:
+            if event_r is not None:
+                os.close(event_r)
+            raise
+        finally:
+            if event_w is not None:
+                os.close(event_w)
+        # the monitor owns (duplicates of) the pipe descriptors from here on
+        monitor = RunMonitor(
+            process.pid, os.dup(process.stdout.fileno()), os.dup(process.stderr.fileno()),
+            timeout, self.live_output, self.kill_on_traceback, self.traceback_grace, event_r,
+        )
+        process.stdout.close()
+        process.stderr.close()
+        if hasattr(os, "wait4"):
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            user_time, system_time, max_rss = rusage.ru_utime, rusage.ru_stime, _max_rss_mb(rusage.ru_maxrss)
+        else:
+            process.wait()
+            user_time, system_time, max_rss = 0.0, 0.0, None
+        wall_time = time.perf_counter() - monitor.began
+        stdout, stderr = monitor.finish()
+        usage = Usage(wall_time, user_time, system_time, max_rss, monitor.timed_out())
+        return ExecutionResult([self.python_executable, script], process.returncode, stdout, stderr, usage, monitor.scanner, monitor.killed)
+
+    def run_code(self, code, timeout=None):
+        """
+        Run source code in a new RunSandbox. The returned ExecutionResult also has
+        run_dir (None if the directory was cleaned up) and artifacts.
+        """
+        sandbox = RunSandbox()
+        script = sandbox.write_script(code)
+        in_sandbox = EXECUTION_CONFIG["run_cwd"] == "sandbox"
+        if in_sandbox:
+            sandbox.link_inputs(code)
+        result = self.run(script, cwd=sandbox.path if in_sandbox else None, timeout=timeout)
+        result.artifacts = sandbox.artifacts()
+        sandbox.record(result)
+        if sandbox.cleanup(result):
+            result.run_dir = sandbox.path
+        return result
+
+    def restart(self):
+        """Stop the fork server (it is started again, with fresh imports, on the next run)"""
+        with self.server_lock:
+            if self.server is not None:
+                self.server.close()
+                self.server = None
+
+    def close(self):
+        self.restart()
@@ -1,3 +1,5 @@
+import os
+
 MAX_ROUNDS = 1
 
 LLM_CONFIG = {
@@ -5,6 +7,10 @@ LLM_CONFIG = {
     # "default_model": "qwen3:8b",
     # "default_model": "gpt-oss:20b",
     "default_model": "deepseek-r1:70b",
+    "embedding_model": "nomic-embed-text",
+    # Ollama servers used for fan-out work (source digests, PDF summaries); the first one is the default
+    "endpoints": [url.strip().rstrip("/") for url in os.environ.get("OLLAMA_HOSTS", "http://localhost:11434").split(",") if url.strip()],
+    "max_concurrency_per_endpoint": 1,  # concurrent generate requests sent to each endpoint
     "temperature": {
         "research": 0.3,
         "coding": 0.2,
@@ -12,4 +18,120 @@ LLM_CONFIG = {
         "execution": 0.1,
         "review": 0.1,
     },
-}
\ No newline at end of file
+}
+
+# NCBI E-utilities: an API key raises the limit from 3 to 10 requests/second
+NCBI_CONFIG = {
+    "api_key": os.environ.get("NCBI_API_KEY"),
+    "email": os.environ.get("NCBI_EMAIL"),
+    "tool": "agentic_lab",
+    "batch_size": 200,  # IDs per efetch/esummary request
+}
+
+# On-disk cache for API responses, digests and extracted text (reused across runs)
+CACHE_DIR = os.environ.get("AGENTIC_LAB_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "agentic_lab"))
+
+# arXiv asks for at most one request every 3 seconds; Semantic Scholar allows ~1 req/s with a key
+LITERATURE_CONFIG = {
+    "arxiv_batch_size": 100,  # IDs per id_list query
+    "semantic_scholar_api_key": os.environ.get("S2_API_KEY"),
+    "semantic_scholar_batch_size": 500,  # IDs per /paper/batch request
+    "cache_ttl_days": 30,
+}
+
+# Limits applied while streaming .ipynb files into prompts (characters)
+NOTEBOOK_CONFIG = {
+    "max_string_chars": 20000,  # longer strings (e.g. base64 images) are cut while reading
+    "max_cell_chars": 20000,
+    "max_total_chars": 200000,
+    "include_outputs": True,
+}
+
+# Outbound HTTP scheduling: sustained requests/second per domain ("default" for unlisted domains)
+HTTP_CONFIG = {
+    "domain_rates": {
+        "default": 2.0,
+        "eutils.ncbi.nlm.nih.gov": 3.0,
+        "export.arxiv.org": 1 / 3.0,
+        "api.semanticscholar.org": 1.0,
+        "duckduckgo.com": 0.5,
+        "huggingface.co": 5.0,
+        "github.com": 5.0,
+        "raw.githubusercontent.com": 5.0,
+    },
+    "max_retries": 4,
+    "backoff_base": 1.0,  # seconds; doubled per attempt with full jitter
+    "backoff_max": 60.0,
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+}
+
+# Retrieval over gathered sources: prompts receive the top_k most relevant chunks instead of everything
+RETRIEVAL_CONFIG = {
+    "enabled": True,
+    "top_k": 8,
+    "chunk_chars": 1200,
+    "chunk_overlap": 150,
+    "semantic": True,  # add embedding (cosine) retrieval on top of BM25 when an Ollama embedding model is available
+    "embedding_batch_size": 64,
+    "query_chars": 2000,  # long queries (e.g. a whole draft) are cut before embedding
+}
+
+# One-time digest of the gathered sources, shared by every prompt of a run (cached by content hash)
+DIGEST_CONFIG = {
+    "enabled": True,
+    "chunk_chars": 12000,  # size of the pieces each source is split into for the map step
+    "reduce_fan_in": 6,  # partial digests merged per reduce call
+    "min_source_chars": 1500,  # shorter sources are used verbatim instead of being summarized
+    "max_digest_chars": 4000,  # cap on the digest of a single source
+    "passages_k": 4,  # raw passages retrieved alongside the digest
+    "temperature": 0.2,
+}
+
+# PDF text extraction is spread over a process pool, across files and across page ranges of large files
+PDF_CONFIG = {
+    "max_workers": None,  # None uses every core
+    "pages_per_task": 16,
+    "cache": True,  # keep extracted page text in CACHE_DIR/pdf_pages.sqlite, keyed by file content hash
+    "clean": True,  # drop running headers/footers, page numbers and the sections below before prompting
+    "drop_sections": ["references", "acknowledgements", "supplementary"],
+}
+
+# Large PDF collections are map-reduce summarized (cached per PDF content hash) instead of inlined in full
+PDF_SUMMARY_CONFIG = {
+    "summarize_above": 3,  # more PDFs than this are summarized
+    "batch_papers": 16,  # papers extracted and summarized together, which bounds memory use
+}
+
+# --files_dir exploration: parallel scandir walk with caps; the LLM sees per-extension/per-directory summaries
+FILES_CONFIG = {
+    "ignore": [".git", ".svn", "__pycache__", ".ipynb_checkpoints", ".snakemake", "node_modules", ".DS_Store", "*.pyc", "*.swp"],
+    "max_depth": 12,
+    "max_files": 200000,  # the walk stops after this many files
+    "max_workers": 8,  # threads issuing scandir/stat calls
+    "listing_files": 200,  # at most this many individual files are listed
+    "samples_per_group": 3,  # sample paths shown per extension and per directory
+    "top_dirs": 30,  # directories shown in the per-directory summary
+    "index": True,  # keep an incremental index in CACHE_DIR/file_index.sqlite; only changed directories are re-listed
+    "verify_files": False,  # also stat files in unchanged directories (catches files rewritten in place)
+    "sniff_files": 40,  # data files (CSV/TSV, MTX, h5ad, parquet, FASTA/VCF, ...) whose headers are sniffed for the report
+}
+
+# Execution of generated code in the target (conda) environment
+EXECUTION_CONFIG = {
+    "fork_server": False,  # fork each run from a warm interpreter with the modules below imported (POSIX only)
+    "preload": ["numpy", "pandas", "scipy", "matplotlib", "anndata", "scanpy"],  # missing modules are skipped
+    "timeout": 3600,  # wall-clock seconds before the run's process group is killed (None: no limit)
+    "memory_limit_mb": None,  # RLIMIT_AS of the script (None: no limit)
+    "cpu_time_limit": None,  # RLIMIT_CPU seconds of the script (None: no limit)
+    "live_output": True,  # show the script's output while it runs
+    "capture_head_bytes": 32 * 1024,  # per stream, the first and last bytes of output are kept for the agents
+    "capture_tail_bytes": 32 * 1024,
+    "kill_on_traceback": False,  # kill the run when it is still alive after printing an uncaught traceback
+    "traceback_grace": 2.0,  # seconds it gets to exit on its own first
+    "runs_dir": "./output_agent/runs",  # every execution gets its own directory here
+    "run_cwd": "project",  # "project": scripts run in the current directory (the script, output and run.json stay in
+    # the run directory); "sandbox": in their run directory, with only the input paths named in the code linked in
+    "keep_runs": "artifacts",  # "all", "artifacts" (runs that failed or wrote files) or "none"
+    "memoize": True,  # reuse the result of a successful run of identical code (same inputs, same environment)
+    "preflight": True,  # check syntax, undefined names, imports and input files before running the code
+}
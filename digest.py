@@ -0,0 +1,146 @@
+import re
+from cache_utils import JsonCache, content_hash
+from config import DIGEST_CONFIG, LLM_CONFIG
+from llm_utils import get_endpoint_pool
+from source_index import chunk_text
+import prompts
+
+# bump when the digest prompts change so that stale digests are not reused
+DIGEST_VERSION = 1
+
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+def _clean(text):
+    return _THINK_RE.sub("", text).strip()
+
+
+def _cap(text, limit):
+    return text if len(text) <= limit else text[:limit] + "\n... [digest truncated]"
+
+
+class SourceDigester:
+    """
+    Map-reduce digest of gathered sources.
+
+    Each source is split into `chunk_chars` pieces, every piece is condensed into a
+    structured digest (key findings, methods, datasets, file paths, packages) and the
+    partial digests are merged `reduce_fan_in` at a time until one remains. The map
+    and reduce calls of a level are sent concurrently through the LLM endpoint pool.
+    Digests are cached on disk by content hash and model, so a corpus is only
+    digested once no matter how many rounds, agents or runs reuse it.
+    """
+
+    def __init__(self, model=None, verbose=True, pool=None):
+        self.model = model or LLM_CONFIG["default_model"]
+        self.verbose = verbose
+        self.pool = pool or get_endpoint_pool()
+        self.chunk_chars = DIGEST_CONFIG["chunk_chars"]
+        self.fan_in = max(2, DIGEST_CONFIG["reduce_fan_in"])
+        self.min_source_chars = DIGEST_CONFIG["min_source_chars"]
+        self.max_digest_chars = DIGEST_CONFIG["max_digest_chars"]
+        self.temperature = DIGEST_CONFIG["temperature"]
+        self.cache = JsonCache("digests")
+
+    def _query_many(self, prompt_list):
+        return [_clean(r) for r in self.pool.map(prompt_list, model=self.model, temperature=self.temperature)]
+
+    def cache_key(self, sha256):
+        return f"{DIGEST_VERSION}:{self.model}:{sha256}"
+
+    def _reduce(self, items):
+        """
+        Merge the partial digests of several documents level by level.
+        `items` maps kind -> list of partial digests; all reduce calls of a level run together.
+        """
+        while any(len(parts) > 1 for parts in items.values()):
+            jobs, slots = [], []
+            for kind, parts in items.items():
+                merged = []
+                for i in range(0, len(parts), self.fan_in):
+                    group = parts[i:i + self.fan_in]
+                    if len(group) == 1:
+                        merged.append(group[0])
+                    else:
+                        jobs.append(prompts.get_source_digest_reduce_prompt(kind, group))
+                        slots.append((kind, len(merged)))
+                        merged.append(None)
+                items[kind] = merged
+            for (kind, position), result in zip(slots, self._query_many(jobs)):
+                items[kind][position] = result
+        return {kind: _cap(parts[0], self.max_digest_chars) if parts else "" for kind, parts in items.items()}
+
+    def digest_texts(self, documents):
+        """
+        Digest several documents at once (not cached). `documents` is a list of
+        (kind, text) with distinct kinds; returns {kind: digest}. The map step of
+        every chunk of every document is submitted to the pool in one batch.
+        """
+        digests, jobs, owners = {}, [], []
+        for kind, text in documents:
+            if len(text) <= self.min_source_chars:
+                digests[kind] = text.strip()
+                continue
+            for s, e in chunk_text(text, self.chunk_chars, 0):
+                jobs.append(prompts.get_source_digest_prompt(kind, text[s:e]))
+                owners.append(kind)
+        partials = {}
+        for kind, result in zip(owners, self._query_many(jobs)):
+            partials.setdefault(kind, []).append(result)
+        digests.update(self._reduce(partials))
+        return digests
+
+    def digest_text(self, kind, text):
+        """Digest one source's text (not cached)"""
+        return self.digest_texts([(kind, text)])[kind]
+
+    def digest_source(self, source):
+        """Digest of one Source handle, from the cache when the same content was digested before"""
+        key = self.cache_key(source.sha256)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached["digest"]
+        if self.verbose:
+            print(f"Digesting {source.kind} ({source.n_tokens:,} tokens)...")
+        digest = self.digest_text(source.kind, source.text())
+        self.cache.set(key, {"kind": source.kind, "origin": source.origin, "digest": digest})
+        return digest
+
+    def digest_index(self, index):
+        """
+        Build the corpus digest for a SourceIndex and attach it with index.set_digest().
+        Pinned sources are rendered verbatim by the index, so they are not digested.
+        """
+        parts = []
+        for source in index.sources:
+            if source.pinned:
+                continue
+            try:
+                digest = self.digest_source(source)
+            except Exception as e:
+                print(f"Could not digest {source.kind}: {e}")
+                continue
+            if digest:
+                parts.append(f"[{source.kind} | {source.origin}]\n{digest}")
+        digest = "\n\n".join(parts)
+        index.set_digest(digest, top_k=DIGEST_CONFIG["passages_k"])
+        return digest
+
+    def summarize_collection(self, summaries):
+        """
+        Overview of a document collection from per-document summaries, reduced
+        hierarchically `reduce_fan_in` summaries at a time and cached by their hash.
+        """
+        if len(summaries) <= 1:
+            return summaries[0] if summaries else ""
+        key = self.cache_key("collection:" + content_hash("\n\n".join(summaries)))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached["digest"]
+        level = list(summaries)
+        while len(level) > 1:
+            groups = [level[i:i + self.fan_in] for i in range(0, len(level), self.fan_in)]
+            results = self._query_many([prompts.get_collection_summary_prompt(g) for g in groups if len(g) > 1])
+            level = [g[0] if len(g) == 1 else results.pop(0) for g in groups]
+        self.cache.set(key, {"kind": "collection", "origin": len(summaries), "digest": level[0]})
+        return level[0]
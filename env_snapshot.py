@@ -0,0 +1,196 @@
+import inspect
+import json
+import os
+import re
+import subprocess
+import time
+from importlib import metadata
+
+DIST_INFO_SUFFIXES = (".dist-info", ".egg-info")
+
+
+def normalize_name(name):
+    """PEP 503 normalized distribution name ("Scikit_Learn" -> "scikit-learn")"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def describe_distribution(dist):
+    """(name, version, top-level import names) of an importlib.metadata Distribution"""
+    top_level = set((dist.read_text("top_level.txt") or "").split())
+    if not top_level:
+        for path in dist.files or []:
+            parts = path.parts
+            if not parts or parts[0] in ("..", "__pycache__") or parts[0].endswith((".dist-info", ".egg-info")):
+                continue
+            if len(parts) > 1:
+                top_level.add(parts[0])
+            elif parts[0].endswith(".py"):
+                top_level.add(parts[0][:-3])
+            elif parts[0].endswith((".so", ".pyd")):
+                top_level.add(parts[0].split(".")[0])
+    return dist.metadata["Name"], dist.version, sorted(name for name in top_level if name.isidentifier())
+
+
+# runs inside the target interpreter; one launch replaces `python --version`, the site-packages probe
+# and `pip list`, and also records each distribution's import names and metadata directory
+PROBE_SCRIPT = "\n".join([
+    "import json, os, site, sys, sysconfig",
+    "from importlib import metadata",
+    inspect.getsource(describe_distribution),
+    r"""
+try:
+    site_packages = site.getsitepackages()
+except AttributeError:  # virtualenvs with an old site.py
+    site_packages = [sysconfig.get_paths()["purelib"]]
+distributions = []
+for dist in metadata.distributions():
+    name, version, top_level = describe_distribution(dist)
+    if name:
+        path = getattr(dist, "_path", None)
+        distributions.append([name, version, top_level, str(path) if path else None])
+print(json.dumps({
+    "executable": sys.executable,
+    "version": sys.version.split()[0],
+    "site_packages": site_packages,
+    "distributions": distributions,
+}))
+""",
+])
+
+
+class EnvironmentSnapshot:
+    """
+    What CodeExecutorAgent needs to know about the target Python environment:
+    interpreter path and version, site-packages directories and an index of the
+    installed distributions (versions and top-level import names). Built by a
+    single probe run inside the interpreter; the fingerprint (mtimes of
+    site-packages and conda-meta) tells when the environment changed on disk,
+    after which refresh() reads only the metadata directories that appeared.
+    """
+
+    def __init__(self, python_executable, env_path, python_version, site_packages, distributions, probe_seconds):
+        self.python_executable = python_executable
+        self.env_path = env_path
+        self.python_version = python_version
+        self.site_packages = site_packages
+        self.probe_seconds = probe_seconds
+        self.uses = 0
+        self.distributions = {}  # {name: version}
+        self.modules = {}  # {top-level import name: [distribution names]}
+        self._normalized = {}  # {normalized name: name}
+        self._dist_dirs = {}  # {metadata directory: name}
+        for name, version, top_level, path in distributions:
+            self._add(name, version, top_level, path)
+        self.fingerprint = self._fingerprint()
+
+    @classmethod
+    def probe(cls, python_executable, env_path=None, timeout=120):
+        began = time.perf_counter()
+        result = subprocess.run(
+            [python_executable, "-c", PROBE_SCRIPT], capture_output=True, text=True, timeout=timeout
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"environment probe failed: {result.stderr.strip()}")
+        info = json.loads(result.stdout.strip().splitlines()[-1])
+        return cls(
+            python_executable,
+            env_path,
+            f"Python {info['version']}",
+            info["site_packages"],
+            info["distributions"],
+            time.perf_counter() - began,
+        )
+
+    def _add(self, name, version, top_level, path=None):
+        if self._normalized.get(normalize_name(name), name) != name:
+            self._remove(self._normalized[normalize_name(name)])
+        self.distributions[name] = version
+        self._normalized[normalize_name(name)] = name
+        for module in top_level:
+            owners = self.modules.setdefault(module, [])
+            if name not in owners:
+                owners.append(name)
+        if path:
+            self._dist_dirs[path] = name
+
+    def _remove(self, name):
+        self.distributions.pop(name, None)
+        self._normalized.pop(normalize_name(name), None)
+        for module in [m for m, owners in self.modules.items() if name in owners]:
+            self.modules[module].remove(name)
+            if not self.modules[module]:
+                del self.modules[module]
+
+    def _metadata_dirs(self):
+        dirs = set()
+        for directory in self.site_packages:
+            try:
+                with os.scandir(directory) as entries:
+                    dirs.update(entry.path for entry in entries if entry.name.endswith(DIST_INFO_SUFFIXES))
+            except OSError:
+                continue
+        return dirs
+
+    def refresh(self):
+        """
+        Bring the index up to date after installs: only metadata directories that
+        appeared in site-packages are read (in this process, the files are plain text),
+        distributions whose directory disappeared are dropped.
+        Returns (added, removed) distribution names.
+        """
+        current = self._metadata_dirs()
+        known = {path for path in self._dist_dirs if os.path.dirname(path) in self.site_packages}
+        removed = []
+        for path in known - current:
+            name = self._dist_dirs.pop(path)
+            if name not in self._dist_dirs.values():
+                self._remove(name)
+                removed.append(name)
+        added = []
+        for path in sorted(current - known):
+            try:
+                name, version, top_level = describe_distribution(metadata.PathDistribution.at(path))
+            except Exception:
+                continue
+            if name:
+                self._add(name, version, top_level, path)
+                added.append(name)
+        self.fingerprint = self._fingerprint()
+        return added, removed
+
+    def has_module(self, module):
+        """True if a distribution provides the top-level package of `module` ("a.b" -> "a")"""
+        return module.split(".")[0] in self.modules
+
+    def has_distribution(self, name):
+        return normalize_name(name) in self._normalized
+
+    def version(self, name):
+        name = self._normalized.get(normalize_name(name))
+        return self.distributions.get(name) if name else None
+
+    def _watched_paths(self):
+        paths = list(self.site_packages)
+        if self.env_path:
+            paths.append(os.path.join(self.env_path, "conda-meta"))  # changes on conda install/remove
+        return paths
+
+    def _fingerprint(self):
+        stamps = []
+        for path in self._watched_paths():
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def is_stale(self):
+        """True when a package was installed or removed since the snapshot was taken"""
+        return self._fingerprint() != self.fingerprint
+
+    def format_packages(self):
+        """Installed distributions in the layout of `pip list`"""
+        width = max([len(name) for name in self.distributions] + [len("Package")])
+        lines = [f"{'Package':<{width}} Version", f"{'-' * width} -------"]
+        lines.extend(f"{name:<{width}} {version}" for name, version in sorted(self.distributions.items(), key=lambda item: item[0].lower()))
+        return "\n".join(lines)
@@ -0,0 +1,225 @@
+import fnmatch
+import os
+import re
+from functools import lru_cache
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config import FILES_CONFIG
+
+FileEntry = namedtuple("FileEntry", ["path", "size", "mtime_ns"])  # path is relative to the scanned root
+
+# compression suffixes that belong to the extension in front of them (".mtx.gz", ".vcf.bgz", ...)
+COMPRESSION_SUFFIXES = {".gz", ".bgz", ".bz2", ".xz", ".zst", ".zip"}
+
+
+def file_extension(path):
+    """Lower-case extension including a compression suffix, e.g. ".tsv.gz"; "(none)" if there is none"""
+    name = path[path.rfind(os.sep) + 1:].lower()
+    dot = name.rfind(".")
+    if dot <= 0:
+        return "(none)"
+    ext = name[dot:]
+    if ext in COMPRESSION_SUFFIXES:
+        inner = name.rfind(".", 0, dot)
+        if inner > 0:
+            ext = name[inner:]
+    return ext
+
+
+def format_size(size):
+    size_str = f"{size:,} bytes"
+    if size > 1024 * 1024 * 1024:
+        size_str = f"{size / (1024 * 1024 * 1024):.1f} GB"
+    elif size > 1024 * 1024:
+        size_str = f"{size / (1024 * 1024):.1f} MB"
+    elif size > 1024:
+        size_str = f"{size / 1024:.1f} KB"
+    return size_str
+
+
+@lru_cache(maxsize=32)
+def _ignore_regex(patterns):
+    # all globs compiled into one regex, so each entry costs two regex matches
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns)) if patterns else None
+
+
+def is_ignored(name, rel_path, patterns):
+    regex = _ignore_regex(tuple(patterns))
+    return regex is not None and (regex.match(name) is not None or regex.match(rel_path) is not None)
+
+
+class ScanResult:
+    """Files found under `root` plus what the walk had to leave out"""
+
+    def __init__(self, root):
+        self.root = root
+        self.files = []
+        self.n_dirs = 0
+        self.truncated = False  # stopped at max_files
+        self.depth_limited = 0  # directories below max_depth that were not entered
+        self.errors = []  # (relative directory, error message)
+
+
+def scan_dir(root, rel_dir, patterns):
+    """
+    List one directory with os.scandir. Returns (files, subdirectories) with paths
+    relative to `root`; each file is stat'ed once through its DirEntry.
+    """
+    files, subdirs = [], []
+    with os.scandir(os.path.join(root, rel_dir) if rel_dir else root) as entries:
+        for entry in entries:
+            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            if is_ignored(entry.name, rel_path, patterns):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):  # symlinked directories are not followed, so no cycles
+                    subdirs.append(rel_path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append(FileEntry(rel_path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue
+    return files, subdirs
+
+
+def scan_directory(root, ignore=None, max_depth=None, max_files=None, max_workers=None):
+    """
+    Walk `root` with parallel os.scandir calls (one task per directory).
+    Entries matching the `ignore` globs (name or relative path) are skipped, directories
+    deeper than `max_depth` are not entered and the walk stops after `max_files` files.
+    """
+    patterns = FILES_CONFIG["ignore"] if ignore is None else ignore
+    max_depth = FILES_CONFIG["max_depth"] if max_depth is None else max_depth
+    max_files = max_files or FILES_CONFIG["max_files"]
+    max_workers = max_workers or FILES_CONFIG["max_workers"]
+
+    result = ScanResult(root)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(scan_dir, root, "", patterns): ("", 0)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rel_dir, depth = pending.pop(future)
+                try:
+                    files, subdirs = future.result()
+                except OSError as e:
+                    result.errors.append((rel_dir or ".", str(e)))
+                    continue
+                result.n_dirs += 1
+                result.files.extend(files)
+                if len(result.files) > max_files or (len(result.files) == max_files and (subdirs or pending)):
+                    result.truncated = True
+                    continue
+                for subdir in subdirs:
+                    if depth + 1 > max_depth:
+                        result.depth_limited += 1
+                    else:
+                        pending[executor.submit(scan_dir, root, subdir, patterns)] = (subdir, depth + 1)
+            if result.truncated:
+                for future in pending:
+                    future.cancel()
+                break
+    result.files.sort(key=lambda f: f.path)
+    del result.files[max_files:]
+    return result
+
+
+def summarize_files(files, extensions=None):
+    """Aggregate FileEntry records per extension and per directory: {key: [count, total size, sample paths]}"""
+    samples = FILES_CONFIG["samples_per_group"]
+    extensions = extensions or [file_extension(f.path) for f in files]
+    by_ext = defaultdict(lambda: [0, 0, []])
+    by_dir = defaultdict(lambda: [0, 0, []])
+    for f, ext in zip(files, extensions):
+        cut = f.path.rfind(os.sep)
+        for key, groups in ((ext, by_ext), (f.path[:cut] if cut > 0 else ".", by_dir)):
+            group = groups[key]
+            group[0] += 1
+            group[1] += f.size
+            if len(group[2]) < samples:
+                group[2].append(f.path)
+    return by_ext, by_dir
+
+
+def sample_listing(files, limit, extensions=None):
+    """
+    Pick at most `limit` files for the listing, taking them round-robin across
+    extensions (rarest first) so that a few data files are not hidden behind
+    thousands of files of one type. Returned in path order.
+    """
+    if len(files) <= limit:
+        return list(files)
+    extensions = extensions or [file_extension(f.path) for f in files]
+    groups = defaultdict(list)
+    for f, ext in zip(files, extensions):
+        groups[ext].append(f)
+    queues = sorted(groups.values(), key=len)
+    picked, i = [], 0
+    while len(picked) < limit:
+        added = False
+        for queue in queues:
+            if i < len(queue) and len(picked) < limit:
+                picked.append(queue[i])
+                added = True
+        if not added:
+            break
+        i += 1
+    return sorted(picked, key=lambda f: f.path)
+
+
+def format_report(directory, result, listing_files=None, top_dirs=None, changes=None, schemas=None):
+    """
+    LLM-facing report of a scan. Besides the totals it has one line per extension and per
+    directory (largest first, with sample paths) and lists at most `listing_files` files
+    spread across extensions, so its size stays bounded however many files the tree holds.
+    `changes` (from FileIndex.scan) adds what changed since the previous exploration and
+    `schemas` ({relative path: description}) the sniffed layout of data files.
+    """
+    listing_files = listing_files or FILES_CONFIG["listing_files"]
+    top_dirs = top_dirs or FILES_CONFIG["top_dirs"]
+    files = result.files
+    extensions = [file_extension(f.path) for f in files]
+    by_ext, by_dir = summarize_files(files, extensions)
+
+    lines = [
+        "FILES DIRECTORY EXPLORATION",
+        f"Directory: {os.path.abspath(directory)}",  # absolute: generated code may run in its own run directory
+        f"Total files found: {len(files):,} in {result.n_dirs:,} directories ({format_size(sum(f.size for f in files))})",
+    ]
+    if result.truncated:
+        lines.append(f"Note: the walk stopped after {len(files):,} files (max_files); more files exist.")
+    if result.depth_limited:
+        lines.append(f"Note: {result.depth_limited:,} directories deeper than the depth limit were not explored.")
+    for rel_dir, error in result.errors[:10]:
+        lines.append(f"Note: could not read {rel_dir}: {error}")
+
+    if changes and any(changes.values()):
+        samples = FILES_CONFIG["samples_per_group"]
+        lines += ["", "CHANGES SINCE LAST EXPLORATION:", "-" * 50]
+        for kind in ("added", "removed", "changed"):
+            paths = changes[kind]
+            if paths:
+                more = f", ... and {len(paths) - samples:,} more" if len(paths) > samples else ""
+                lines.append(f"{kind}: {len(paths):,} files ({', '.join(paths[:samples])}{more})")
+
+    lines += ["", "FILES BY EXTENSION:", "-" * 50]
+    for ext, (count, size, sample) in sorted(by_ext.items(), key=lambda item: (-item[1][0], item[0])):
+        lines.append(f"{ext}: {count:,} files, {format_size(size)} (e.g. {', '.join(sample)})")
+
+    if len(by_dir) > 1:
+        lines += ["", "FILES BY DIRECTORY:", "-" * 50]
+        ranked = sorted(by_dir.items(), key=lambda item: (-item[1][0], item[0]))
+        for rel_dir, (count, size, sample) in ranked[:top_dirs]:
+            lines.append(f"{rel_dir}/: {count:,} files, {format_size(size)} (e.g. {', '.join(os.path.basename(p) for p in sample)})")
+        if len(ranked) > top_dirs:
+            lines.append(f"... and {len(ranked) - top_dirs:,} more directories")
+
+    if schemas:
+        lines += ["", "DATA FILE SCHEMAS (from file headers):", "-" * 50]
+        lines.extend(f"{path}: {description}" for path, description in sorted(schemas.items()))
+
+    lines += ["", "FILE LISTING:", "-" * 50]
+    lines.extend(f"{f.path} ({format_size(f.size)})" for f in sample_listing(files, listing_files, extensions))
+    if len(files) > listing_files:
+        lines.append(f"... and {len(files) - listing_files:,} more files (see the summaries above)")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,240 @@
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from cache_utils import file_hash
+from config import CACHE_DIR, FILES_CONFIG
+from file_explorer import FileEntry, ScanResult, is_ignored, scan_dir
+
+
+class FileIndex:
+    """
+    Persistent index of explored directory trees (CACHE_DIR/file_index.sqlite).
+
+    Every directory is stored with its mtime and subdirectory list, every file with
+    its size, mtime and (on request) content hash and sniffed schema. A later scan stats each known
+    directory and only re-lists the ones whose mtime changed, which is where files
+    were added, removed or renamed; the others are served from the index. With
+    verify=True files in unchanged directories are stat'ed too, which also catches
+    files rewritten in place.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, "file_index.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS dirs (root TEXT, path TEXT, mtime_ns INTEGER, subdirs TEXT, PRIMARY KEY (root, path));"
+            "CREATE TABLE IF NOT EXISTS files (root TEXT, path TEXT, dir TEXT, size INTEGER, mtime_ns INTEGER, sha256 TEXT, "
+            "PRIMARY KEY (root, path));"
+            "CREATE INDEX IF NOT EXISTS files_by_dir ON files (root, dir);"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}
+        if "schema" not in columns:  # indexes written before schemas were sniffed
+            self.conn.execute("ALTER TABLE files ADD COLUMN schema TEXT")
+        self.conn.commit()
+
+    def _load(self, root):
+        with self.lock:
+            dirs = {
+                path: (mtime_ns, json.loads(subdirs))
+                for path, mtime_ns, subdirs in self.conn.execute(
+                    "SELECT path, mtime_ns, subdirs FROM dirs WHERE root = ?", (root,)
+                )
+            }
+            files = {}
+            for path, rel_dir, size, mtime_ns in self.conn.execute(
+                "SELECT path, dir, size, mtime_ns FROM files WHERE root = ?", (root,)
+            ):
+                files.setdefault(rel_dir, []).append(FileEntry(path, size, mtime_ns))
+        return dirs, files
+
+    @staticmethod
+    def _visit(root, rel_dir, stored, stored_files, patterns, verify):
+        """Worker: (files, subdirs, mtime_ns, rescanned) for one directory"""
+        mtime_ns = os.stat(os.path.join(root, rel_dir) if rel_dir else root).st_mtime_ns
+        if stored is not None and stored[0] == mtime_ns:
+            files = [f for f in stored_files if not is_ignored(os.path.basename(f.path), f.path, patterns)]
+            subdirs = [d for d in stored[1] if not is_ignored(os.path.basename(d), d, patterns)]
+            if verify:
+                current = []
+                for f in files:
+                    try:
+                        st = os.stat(os.path.join(root, f.path))
+                    except OSError:
+                        continue
+                    current.append(FileEntry(f.path, st.st_size, st.st_mtime_ns))
+                return current, subdirs, mtime_ns, current != files
+            return files, subdirs, mtime_ns, False
+        files, subdirs = scan_dir(root, rel_dir, patterns)
+        return files, subdirs, mtime_ns, True
+
+    def scan(self, root, ignore=None, max_depth=None, max_files=None, max_workers=None, verify=None):
+        """
+        Incrementally scan `root`. Returns (ScanResult, changes) where changes is
+        {"added": [...], "removed": [...], "changed": [...]} (relative paths) compared
+        to the previous scan, or None if the tree was not indexed before.
+        """
+        root = os.path.abspath(root)
+        patterns = FILES_CONFIG["ignore"] if ignore is None else ignore
+        max_depth = FILES_CONFIG["max_depth"] if max_depth is None else max_depth
+        max_files = max_files or FILES_CONFIG["max_files"]
+        max_workers = max_workers or FILES_CONFIG["max_workers"]
+        verify = FILES_CONFIG["verify_files"] if verify is None else verify
+
+        stored_dirs, stored_files = self._load(root)
+        first_scan = not stored_dirs
+        result = ScanResult(root)
+        changes = {"added": [], "removed": [], "changed": []}
+        updates = []  # (rel_dir, mtime_ns, subdirs, files) for directories whose entries changed
+        visited = set()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def submit(rel_dir, depth):
+                future = executor.submit(
+                    self._visit, root, rel_dir, stored_dirs.get(rel_dir), stored_files.get(rel_dir, []), patterns, verify
+                )
+                pending[future] = (rel_dir, depth)
+
+            pending = {}
+            submit("", 0)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel_dir, depth = pending.pop(future)
+                    try:
+                        files, subdirs, mtime_ns, rescanned = future.result()
+                    except OSError as e:
+                        result.errors.append((rel_dir or ".", str(e)))
+                        continue
+                    visited.add(rel_dir)
+                    result.n_dirs += 1
+                    result.files.extend(files)
+                    if rescanned:
+                        old = {f.path: f for f in stored_files.get(rel_dir, [])}
+                        new = {f.path: f for f in files}
+                        changes["added"].extend(p for p in new if p not in old)
+                        changes["removed"].extend(p for p in old if p not in new)
+                        changes["changed"].extend(
+                            p for p, f in new.items() if p in old and (old[p].size, old[p].mtime_ns) != (f.size, f.mtime_ns)
+                        )
+                        updates.append((rel_dir, mtime_ns, subdirs, files))
+                    if len(result.files) > max_files or (len(result.files) == max_files and (subdirs or pending)):
+                        result.truncated = True
+                        continue
+                    for subdir in subdirs:
+                        if depth + 1 > max_depth:
+                            result.depth_limited += 1
+                        else:
+                            submit(subdir, depth + 1)
+                if result.truncated:
+                    for future in pending:
+                        future.cancel()
+                    break
+
+        # directories that no longer exist (only known when the walk was complete)
+        gone = []
+        if not result.truncated:
+            for rel_dir in stored_dirs:
+                depth = rel_dir.count(os.sep) + 1 if rel_dir else 0
+                if rel_dir not in visited and depth <= max_depth:
+                    gone.append(rel_dir)
+                    changes["removed"].extend(f.path for f in stored_files.get(rel_dir, []))
+        self._save(root, updates, gone)
+
+        result.files.sort(key=lambda f: f.path)
+        del result.files[max_files:]
+        for paths in changes.values():
+            paths.sort()
+        return result, (None if first_scan else changes)
+
+    def _save(self, root, updates, gone):
+        with self.lock:
+            for rel_dir, mtime_ns, subdirs, files in updates:
+                # keep content hashes and schemas of files whose size and mtime did not change
+                known = {
+                    (path, size, mtime): (sha, schema)
+                    for path, size, mtime, sha, schema in self.conn.execute(
+                        "SELECT path, size, mtime_ns, sha256, schema FROM files "
+                        "WHERE root = ? AND dir = ? AND (sha256 IS NOT NULL OR schema IS NOT NULL)",
+                        (root, rel_dir),
+                    )
+                }
+                self.conn.execute("DELETE FROM files WHERE root = ? AND dir = ?", (root, rel_dir))
+                self.conn.executemany(
+                    "INSERT INTO files (root, path, dir, size, mtime_ns, sha256, schema) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (root, f.path, rel_dir, f.size, f.mtime_ns, *known.get((f.path, f.size, f.mtime_ns), (None, None)))
+                        for f in files
+                    ],
+                )
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO dirs (root, path, mtime_ns, subdirs) VALUES (?, ?, ?, ?)",
+                    (root, rel_dir, mtime_ns, json.dumps(subdirs)),
+                )
+            for rel_dir in gone:
+                self.conn.execute("DELETE FROM files WHERE root = ? AND dir = ?", (root, rel_dir))
+                self.conn.execute("DELETE FROM dirs WHERE root = ? AND path = ?", (root, rel_dir))
+            self.conn.commit()
+
+    def content_hash(self, root, rel_path):
+        """SHA-256 of an indexed file, computed once and reused while its size and mtime are unchanged"""
+        root = os.path.abspath(root)
+        st = os.stat(os.path.join(root, rel_path))
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM files WHERE root = ? AND path = ?", (root, rel_path)
+            ).fetchone()
+        if row and row[2] and (row[0], row[1]) == (st.st_size, st.st_mtime_ns):
+            return row[2]
+        sha = file_hash(os.path.join(root, rel_path))
+        with self.lock:
+            self.conn.execute(
+                "UPDATE files SET sha256 = ? WHERE root = ? AND path = ? AND size = ? AND mtime_ns = ?",
+                (sha, root, rel_path, st.st_size, st.st_mtime_ns),
+            )
+            self.conn.commit()
+        return sha
+
+    def get_schemas(self, root, files):
+        """Cached schemas of FileEntry records whose size and mtime still match: {relative path: schema}"""
+        root = os.path.abspath(root)
+        schemas = {}
+        with self.lock:
+            for f in files:
+                row = self.conn.execute(
+                    "SELECT schema FROM files WHERE root = ? AND path = ? AND size = ? AND mtime_ns = ?",
+                    (root, f.path, f.size, f.mtime_ns),
+                ).fetchone()
+                if row and row[0]:
+                    schemas[f.path] = json.loads(row[0])
+        return schemas
+
+    def set_schemas(self, root, files, schemas):
+        """Store sniffed schemas ({relative path: schema}) for the given FileEntry records"""
+        root = os.path.abspath(root)
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE files SET schema = ? WHERE root = ? AND path = ? AND size = ? AND mtime_ns = ?",
+                [(json.dumps(schemas[f.path]), root, f.path, f.size, f.mtime_ns) for f in files if f.path in schemas],
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_file_index():
+    """The process-wide FileIndex"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FileIndex()
+        return _index
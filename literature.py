@@ -0,0 +1,340 @@
+import re
+import xml.etree.ElementTree as ET
+from cache_utils import JsonCache
+from config import NCBI_CONFIG, LITERATURE_CONFIG
+from rate_limit import get_scheduler
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+
+
+class PubMedClient:
+    """
+    Batched client for the NCBI E-utilities.
+
+    Abstracts and summaries are fetched for many PMIDs per request (POST, up to
+    `batch_size` IDs each), searches can be kept on the history server (WebEnv)
+    and paged from there, and every request goes through the shared request
+    scheduler so the NCBI limit (3 req/s, or 10 req/s with an API key) is respected.
+    """
+
+    BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+
+    def __init__(self, api_key=None, email=None, tool=None, batch_size=None, timeout=30):
+        self.api_key = api_key if api_key is not None else NCBI_CONFIG.get("api_key")
+        self.email = email if email is not None else NCBI_CONFIG.get("email")
+        self.tool = tool or NCBI_CONFIG.get("tool", "agentic_lab")
+        self.batch_size = batch_size or NCBI_CONFIG.get("batch_size", 200)
+        self.timeout = timeout
+        self.scheduler = get_scheduler()
+        if self.api_key:
+            self.scheduler.set_domain_rate("eutils.ncbi.nlm.nih.gov", 10.0)
+        self.request_count = 0
+
+    def _request(self, endpoint, params, post=False):
+        params = dict(params)
+        params["tool"] = self.tool
+        if self.email:
+            params["email"] = self.email
+        if self.api_key:
+            params["api_key"] = self.api_key
+
+        self.request_count += 1
+        url = f"{self.BASE_URL}/{endpoint}"
+        if post:
+            response = self.scheduler.post(url, data=params, timeout=self.timeout)
+        else:
+            response = self.scheduler.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def search(self, term, max_results=20, use_history=True):
+        """
+        Run esearch. Returns a dict with the PMIDs, the total hit count and, if
+        `use_history` is set, the WebEnv/query_key needed to page the full result set.
+        """
+        params = {"db": "pubmed", "term": term, "retmode": "json", "retmax": max_results}
+        if use_history:
+            params["usehistory"] = "y"
+        data = self._request("esearch.fcgi", params).json().get("esearchresult", {})
+        return {
+            "ids": data.get("idlist", []),
+            "count": int(data.get("count", 0) or 0),
+            "webenv": data.get("webenv"),
+            "query_key": data.get("querykey"),
+        }
+
+    def _batches(self, ids):
+        ids = [str(i) for i in ids if str(i).strip()]
+        for start in range(0, len(ids), self.batch_size):
+            yield ids[start:start + self.batch_size]
+
+    def fetch_abstracts(self, pmids):
+        """Fetch title/abstract/journal/year for all `pmids`, `batch_size` IDs per request"""
+        articles = []
+        for batch in self._batches(pmids):
+            params = {"db": "pubmed", "id": ",".join(batch), "retmode": "xml", "rettype": "abstract"}
+            response = self._request("efetch.fcgi", params, post=True)
+            articles.extend(self.parse_efetch_xml(response.content))
+        return articles
+
+    def fetch_summaries(self, pmids):
+        """Fetch esummary records for all `pmids`, keyed by PMID"""
+        summaries = {}
+        for batch in self._batches(pmids):
+            params = {"db": "pubmed", "id": ",".join(batch), "retmode": "json"}
+            result = self._request("esummary.fcgi", params, post=True).json().get("result", {})
+            for uid in result.get("uids", []):
+                summaries[uid] = result.get(uid, {})
+        return summaries
+
+    def fetch_from_history(self, webenv, query_key, count, max_results=None):
+        """Page efetch over a result set stored on the history server"""
+        total = min(count, max_results) if max_results else count
+        articles = []
+        for retstart in range(0, total, self.batch_size):
+            params = {
+                "db": "pubmed",
+                "WebEnv": webenv,
+                "query_key": query_key,
+                "retstart": retstart,
+                "retmax": min(self.batch_size, total - retstart),
+                "retmode": "xml",
+                "rettype": "abstract",
+            }
+            response = self._request("efetch.fcgi", params)
+            articles.extend(self.parse_efetch_xml(response.content))
+        return articles
+
+    def search_and_fetch(self, term, max_results=20):
+        """
+        Search and return the abstracts of the whole result set. Uses the history
+        server, so up to `batch_size` abstracts arrive in two round trips.
+        """
+        found = self.search(term, max_results=max_results, use_history=True)
+        if found["webenv"] and found["query_key"]:
+            return self.fetch_from_history(found["webenv"], found["query_key"], found["count"], max_results)
+        return self.fetch_abstracts(found["ids"])
+
+    @staticmethod
+    def parse_efetch_xml(content):
+        """Parse a PubmedArticleSet document into a list of article dicts"""
+        articles = []
+        root = ET.fromstring(content)
+        for article in root.iter("PubmedArticle"):
+            citation = article.find("MedlineCitation")
+            if citation is None:
+                continue
+            info = citation.find("Article")
+            abstract_parts = []
+            if info is not None:
+                for part in info.findall("Abstract/AbstractText"):
+                    text = "".join(part.itertext()).strip()
+                    label = part.get("Label")
+                    abstract_parts.append(f"{label}: {text}" if label else text)
+            title = info.find("ArticleTitle") if info is not None else None
+            journal = info.find("Journal/Title") if info is not None else None
+            year = info.find("Journal/JournalIssue/PubDate/Year") if info is not None else None
+            articles.append({
+                "pmid": citation.findtext("PMID", default=""),
+                "title": "".join(title.itertext()).strip() if title is not None else "",
+                "abstract": "\n".join(abstract_parts),
+                "journal": journal.text if journal is not None else "",
+                "year": year.text if year is not None else "",
+            })
+        return articles
+
+    @staticmethod
+    def format_article(article):
+        """Format an article dict for inclusion in prompts"""
+        header = f"[PubMed Article] https://pubmed.ncbi.nlm.nih.gov/{article['pmid']}/"
+        meta = ", ".join(x for x in (article.get("journal"), article.get("year")) if x)
+        abstract = article.get("abstract") or "No abstract available."
+        return f"\n{header}\n{article.get('title', '')}\n{meta}\n{abstract}\n"
+
+
+def normalize_arxiv_id(value):
+    """Turn an arXiv URL or versioned ID (http://arxiv.org/abs/2101.00001v2) into a bare ID (2101.00001)"""
+    value = value.strip().rstrip("/")
+    for marker in ("/abs/", "/pdf/"):
+        if marker in value:
+            value = value.split(marker, 1)[1]
+    if value.endswith(".pdf"):
+        value = value[:-4]
+    return re.sub(r"v\d+$", "", value)
+
+
+class ArxivClient:
+    """
+    Batched arXiv API client. Many papers are looked up with a single `id_list`
+    query and every paper's metadata is cached on disk, so revisiting a topic
+    costs no requests for papers that were already seen.
+    """
+
+    API_URL = "http://export.arxiv.org/api/query"
+
+    def __init__(self, batch_size=None, cache=None, timeout=30):
+        self.batch_size = batch_size or LITERATURE_CONFIG.get("arxiv_batch_size", 100)
+        ttl = LITERATURE_CONFIG.get("cache_ttl_days", 30) * 86400
+        self.cache = cache if cache is not None else JsonCache("arxiv", ttl=ttl)
+        self.timeout = timeout
+        self.scheduler = get_scheduler()
+        self.request_count = 0
+
+    def _query(self, params):
+        self.request_count += 1
+        response = self.scheduler.get(self.API_URL, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return self.parse_feed(response.content)
+
+    def search(self, query, max_results=5):
+        """Search arXiv; the returned papers are cached so a later fetch() is free"""
+        papers = self._query({"search_query": f"all:{query}", "start": 0, "max_results": max_results})
+        for paper in papers:
+            self.cache.set(paper["id"], paper)
+        return papers
+
+    def fetch(self, ids_or_urls):
+        """Return metadata for all papers (in input order), using `id_list` batches for cache misses"""
+        ids = []
+        for value in ids_or_urls:
+            arxiv_id = normalize_arxiv_id(value)
+            if arxiv_id and arxiv_id not in ids:
+                ids.append(arxiv_id)
+
+        papers, missing = self.cache.get_many(ids)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            for paper in self._query({"id_list": ",".join(batch), "max_results": len(batch)}):
+                self.cache.set(paper["id"], paper)
+                papers[paper["id"]] = paper
+        return [papers[i] for i in ids if i in papers]
+
+    @staticmethod
+    def parse_feed(content):
+        """Parse an arXiv Atom feed into a list of paper dicts"""
+        papers = []
+        root = ET.fromstring(content)
+        for entry in root.findall(f"{ATOM_NS}entry"):
+            entry_id = entry.findtext(f"{ATOM_NS}id", default="")
+            title = entry.findtext(f"{ATOM_NS}title", default="")
+            if not entry_id or "/api/errors" in entry_id:
+                continue
+            papers.append({
+                "id": normalize_arxiv_id(entry_id),
+                "url": entry_id,
+                "title": " ".join(title.split()),
+                "abstract": " ".join(entry.findtext(f"{ATOM_NS}summary", default="").split()),
+                "authors": [a.findtext(f"{ATOM_NS}name", default="") for a in entry.findall(f"{ATOM_NS}author")],
+                "published": entry.findtext(f"{ATOM_NS}published", default=""),
+            })
+        return papers
+
+    @staticmethod
+    def format_paper(paper):
+        """Format a paper dict for inclusion in prompts"""
+        return f"\n[ArXiv Paper]\n{paper['url']}\n{paper['title']}\n{paper['abstract']}\n"
+
+
+def semantic_scholar_id(url):
+    """Paper ID of a semanticscholar.org paper URL (".../paper/<title-slug>/<40 hex>" or ".../paper/<40 hex>"), else None"""
+    match = re.search(r"semanticscholar\.org/paper/(?:[^/\s]+/)?([0-9a-f]{40})\b", url)
+    return match.group(1) if match else None
+
+
+class SemanticScholarClient:
+    """
+    Semantic Scholar Graph API client. Paper details (title, abstract, citation
+    count) come from the `/paper/batch` endpoint for up to `batch_size` IDs per
+    request and are cached on disk per paper ID.
+    """
+
+    BASE_URL = "https://api.semanticscholar.org/graph/v1"
+    FIELDS = "title,abstract,citationCount,year,url,externalIds"
+
+    def __init__(self, api_key=None, batch_size=None, cache=None, timeout=30):
+        self.api_key = api_key if api_key is not None else LITERATURE_CONFIG.get("semantic_scholar_api_key")
+        self.batch_size = batch_size or LITERATURE_CONFIG.get("semantic_scholar_batch_size", 500)
+        ttl = LITERATURE_CONFIG.get("cache_ttl_days", 30) * 86400
+        self.cache = cache if cache is not None else JsonCache("semantic_scholar", ttl=ttl)
+        self.timeout = timeout
+        self.scheduler = get_scheduler()
+        self.request_count = 0
+
+    def _headers(self):
+        return {"x-api-key": self.api_key} if self.api_key else {}
+
+    def search(self, query, max_results=5):
+        """Search papers; returned records carry the full field set and are cached by paperId"""
+        self.request_count += 1
+        response = self.scheduler.get(
+            f"{self.BASE_URL}/paper/search",
+            params={"query": query, "limit": max_results, "fields": self.FIELDS},
+            headers=self._headers(),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        papers = [p for p in response.json().get("data", []) if p]
+        for paper in papers:
+            self.cache.set(paper["paperId"], paper)
+        return papers
+
+    def fetch(self, paper_ids):
+        """
+        Return details for all `paper_ids` (S2 IDs or prefixed IDs such as
+        "ARXIV:2101.00001", "PMID:123", "DOI:..."), batching the cache misses.
+        """
+        ids = list(dict.fromkeys(paper_ids))
+        papers, missing = self.cache.get_many(ids)
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            self.request_count += 1
+            response = self.scheduler.post(
+                f"{self.BASE_URL}/paper/batch",
+                params={"fields": self.FIELDS},
+                json={"ids": batch},
+                headers=self._headers(),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            # the batch endpoint answers with one entry per requested ID, null when not found
+            for requested_id, paper in zip(batch, response.json()):
+                if paper:
+                    self.cache.set(requested_id, paper)
+                    papers[requested_id] = paper
+        return [papers[i] for i in ids if i in papers]
+
+    @staticmethod
+    def format_paper(paper):
+        """Format a paper dict for inclusion in prompts"""
+        meta = ", ".join(str(x) for x in (paper.get("year"), f"{paper.get('citationCount') or 0} citations") if x)
+        abstract = paper.get("abstract") or "No abstract available."
+        return f"\n[Semantic Scholar Paper]\n{paper.get('url', '')}\n{paper.get('title', '')}\n{meta}\n{abstract}\n"
+
+
+_pubmed_client = None
+_arxiv_client = None
+_semantic_scholar_client = None
+
+
+def get_pubmed_client():
+    """Shared PubMedClient so every agent uses the same rate limit and settings"""
+    global _pubmed_client
+    if _pubmed_client is None:
+        _pubmed_client = PubMedClient()
+    return _pubmed_client
+
+
+def get_arxiv_client():
+    """Shared ArxivClient (one rate limit and cache for the whole process)"""
+    global _arxiv_client
+    if _arxiv_client is None:
+        _arxiv_client = ArxivClient()
+    return _arxiv_client
+
+
+def get_semantic_scholar_client():
+    """Shared SemanticScholarClient (one rate limit and cache for the whole process)"""
+    global _semantic_scholar_client
+    if _semantic_scholar_client is None:
+        _semantic_scholar_client = SemanticScholarClient()
+    return _semantic_scholar_client
@@ -1,14 +1,18 @@
 import requests
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from config import LLM_CONFIG
 
 total_tokens_used = 0
 output_log = []
+_log_lock = threading.Lock()
 os.environ["NO_PROXY"] = "localhost"
 
-def query_llm(prompt, model=LLM_CONFIG["default_model"], temperature=0.7):
+def query_llm(prompt, model=LLM_CONFIG["default_model"], temperature=0.7, endpoint=None):
     global total_tokens_used
-    url = "http://localhost:11434/api/generate"
+    url = f"{endpoint or LLM_CONFIG['endpoints'][0]}/api/generate"
     payload = {
         "model": model,
         "prompt": prompt,
@@ -18,15 +22,100 @@ def query_llm(prompt, model=LLM_CONFIG["default_model"], temperature=0.7):
     response = requests.post(url, json=payload)
     if response.status_code == 200:
         response_data = response.json()
-        total_tokens_used += response_data.get("eval_count", 0)  # track tokens
-        output_log.append(
-            {
-                "model": model,
-                "prompt": prompt,
-                "response": response_data.get("response", "").strip(),
-                "tokens_used": response_data.get("eval_count", 0),
-            }
-        )
+        with _log_lock:  # query_llm is also called from EndpointPool worker threads
+            total_tokens_used += response_data.get("eval_count", 0)  # track tokens
+            output_log.append(
+                {
+                    "model": model,
+                    "prompt": prompt,
+                    "response": response_data.get("response", "").strip(),
+                    "tokens_used": response_data.get("eval_count", 0),
+                }
+            )
         return response.json().get("response", "").strip()
     else:
         raise Exception(f"Error: {response.status_code}, {response.text}")
+
+
+def embed_texts(texts, model=LLM_CONFIG["embedding_model"], batch_size=64):
+    """Embed a list of texts with the Ollama embeddings endpoint, `batch_size` texts per request"""
+    url = f"{LLM_CONFIG['endpoints'][0]}/api/embed"
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        payload = {"model": model, "input": texts[start:start + batch_size]}
+        response = requests.post(url, json=payload)
+        if response.status_code == 200:
+            vectors.extend(response.json().get("embeddings", []))
+        else:
+            raise Exception(f"Error: {response.status_code}, {response.text}")
+    return vectors
+
+
+class EndpointPool:
+    """
+    Pool of Ollama endpoints (LLM_CONFIG["endpoints"]), each serving at most
+    `max_concurrency` requests at a time. Requests go to the least busy endpoint;
+    map() runs a list of prompts concurrently across the whole pool.
+    """
+
+    def __init__(self, endpoints=None, max_concurrency=None):
+        self.endpoints = list(endpoints or LLM_CONFIG["endpoints"])
+        self.max_concurrency = max_concurrency or LLM_CONFIG["max_concurrency_per_endpoint"]
+        self.active = {endpoint: 0 for endpoint in self.endpoints}
+        self.failed = set()
+        self.cond = threading.Condition()
+
+    @property
+    def size(self):
+        return len(self.endpoints) * self.max_concurrency
+
+    @contextmanager
+    def endpoint(self, exclude=()):
+        with self.cond:
+            while True:
+                candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+                # endpoints that refused a connection are only used when nothing else is left
+                endpoint = min(candidates, key=lambda e: (e in self.failed, self.active[e]))
+                if self.active[endpoint] < self.max_concurrency:
+                    break
+                self.cond.wait()
+            self.active[endpoint] += 1
+        try:
+            yield endpoint
+        finally:
+            with self.cond:
+                self.active[endpoint] -= 1
+                self.cond.notify_all()
+
+    def query(self, prompt, model=LLM_CONFIG["default_model"], temperature=0.7):
+        """query_llm() on the least busy endpoint, moving on to another endpoint if one is unreachable"""
+        tried = []
+        while True:
+            with self.endpoint(exclude=tried) as endpoint:
+                try:
+                    return query_llm(prompt, model=model, temperature=temperature, endpoint=endpoint)
+                except requests.ConnectionError:
+                    self.failed.add(endpoint)
+                    tried.append(endpoint)
+                    if len(tried) >= len(self.endpoints):
+                        raise
+
+    def map(self, prompts, model=LLM_CONFIG["default_model"], temperature=0.7):
+        """Run every prompt concurrently across the pool; results are returned in order"""
+        if len(prompts) <= 1 or self.size <= 1:
+            return [self.query(prompt, model, temperature) for prompt in prompts]
+        with ThreadPoolExecutor(max_workers=min(self.size, len(prompts))) as executor:
+            return list(executor.map(lambda prompt: self.query(prompt, model, temperature), prompts))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_endpoint_pool():
+    """The process-wide EndpointPool"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = EndpointPool()
+        return _pool
@@ -0,0 +1,341 @@
+import codecs
+import json
+import os
+import re
+from config import NOTEBOOK_CONFIG
+from rate_limit import get_scheduler
+
+# outside strings only these characters change the scanner state; inside strings only quotes and escapes do,
+# so long runs (e.g. base64 image data) are skipped at regex speed
+_STRUCTURE_RE = re.compile(r'["{}\[\]]')
+_IN_STRING_RE = re.compile(r'["\\]')
+_TRUNCATED_RE = re.compile(r"\.\.\.\[truncated (\d+) chars\]$")
+_PARTIAL_ESCAPE_RE = re.compile(r"(?<!\\)(\\\\)*\\(u[0-9a-fA-F]{0,3})?$")
+
+BINARY_MIME_PREFIXES = ("image/", "application/pdf", "application/vnd", "video/", "audio/")
+# output formats summarize_output() never uses, so none of their text is kept
+SKIPPED_MIME_TYPES = ("text/html",)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class NotebookCellScanner:
+    """
+    Incremental reader for the `cells` array of an .ipynb document.
+
+    Text is fed in chunks and each cell is yielded as soon as its closing brace
+    arrives, so the whole notebook is never held in memory. Strings longer than
+    `max_string_chars` are cut while scanning (the dropped length is recorded in a
+    "...[truncated N chars]" marker). The cell's source and the rest of the cell
+    (outputs, metadata) each keep at most `max_cell_chars` of string data; after that
+    their remaining strings are emptied behind one "...[cell truncated]" marker, which
+    bounds the memory used per cell no matter how large the embedded outputs are,
+    while outputs (stored before the source) cannot crowd the source out.
+    """
+
+    def __init__(self, max_string_chars=None, max_cell_chars=None):
+        self.max_string_chars = max_string_chars or NOTEBOOK_CONFIG["max_string_chars"]
+        self.max_cell_chars = max_cell_chars or NOTEBOOK_CONFIG["max_cell_chars"]
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.in_cells = False
+        self.done = False
+        self.last_key = None
+        self.string_parts = []
+        self.string_kept = 0
+        self.string_dropped = 0
+        self.string_limit = 0
+        self.cell_parts = None
+        self.cell_stack = []
+        self.cell_key = None
+        self.cell_field = None  # top-level key of the cell whose value is being read
+        self.cell_kept = {}  # {"source" or "other": string characters kept}
+        self.cell_dropped = 0
+        self.cell_cut = set()  # budgets whose "...[cell truncated]" marker has been written
+        self.budget_cut = False  # the current string is limited by the cell budget rather than max_string_chars
+
+    # --- string handling -------------------------------------------------
+    def _start_string(self):
+        self.in_string = True
+        self.string_parts = []
+        self.string_kept = 0
+        self.string_dropped = 0
+        self.budget_cut = False
+        if self.cell_parts is None:
+            # outside of cells only short top-level keys are needed
+            self.string_limit = 16 if self.depth == 1 else 0
+        elif self._expecting_key():
+            self.string_limit = None  # object keys are never cut
+        elif self.cell_key and self.cell_key.startswith(BINARY_MIME_PREFIXES):
+            self.string_limit = 0  # binary payloads are only summarized, so none of it is kept
+        elif self.cell_key in SKIPPED_MIME_TYPES:
+            self.string_limit = 0
+        else:
+            room = max(0, self.max_cell_chars - self.cell_kept.get(self._budget(), 0))
+            self.budget_cut = room < self.max_string_chars
+            self.string_limit = min(self.max_string_chars, room)
+
+    def _budget(self):
+        return "source" if self.cell_field == "source" else "other"
+
+    def _expecting_key(self):
+        if not self.cell_stack or self.cell_stack[-1] != "{":
+            return False
+        for part in reversed(self.cell_parts):
+            stripped = part.rstrip()
+            if stripped:
+                return stripped[-1] in "{,"
+        return False
+
+    def _string_append(self, text):
+        if not text:
+            return
+        limit = self.string_limit
+        if limit is None:
+            self.string_parts.append(text)
+            return
+        room = limit - self.string_kept
+        if room >= len(text):
+            self.string_parts.append(text)
+            self.string_kept += len(text)
+        else:
+            if room > 0:
+                self.string_parts.append(text[:room])
+                self.string_kept += room
+            self.string_dropped += len(text) - max(room, 0)
+
+    def _end_string(self):
+        self.in_string = False
+        value = "".join(self.string_parts)
+        if self.cell_parts is None:
+            if self.depth == 1:
+                self.last_key = value if not self.string_dropped else None
+            return
+        budget = self._budget()
+        if self.string_limit is None:
+            self.cell_key = value
+            if len(self.cell_stack) == 1:
+                self.cell_field = value
+        elif self.string_dropped:
+            # never leave half an escape sequence behind the cut
+            value = _PARTIAL_ESCAPE_RE.sub(lambda m: m.group(1) or "", value)
+            if self.budget_cut:
+                if budget not in self.cell_cut:
+                    value += "...[cell truncated]"
+                    self.cell_cut.add(budget)
+            elif self.string_limit or (self.cell_key or "").startswith(BINARY_MIME_PREFIXES):
+                value += f"...[truncated {self.string_dropped} chars]"
+            self.cell_dropped += self.string_dropped
+        self.cell_kept[budget] = self.cell_kept.get(budget, 0) + self.string_kept
+        self.cell_parts.append('"' + value + '"')
+
+    # --- structure handling ----------------------------------------------
+    def _emit(self, text):
+        if self.cell_parts is not None and text:
+            self.cell_parts.append(text)
+
+    def _finish_cell(self):
+        raw = "".join(self.cell_parts)
+        dropped = self.cell_dropped
+        self.cell_parts = None
+        self.cell_field = None
+        self.cell_kept = {}
+        self.cell_dropped = 0
+        self.cell_cut = set()
+        try:
+            cell = json.loads(raw)
+        except ValueError as e:
+            cell = {"cell_type": "raw", "source": f"[unparseable cell: {e}]"}
+        if dropped:
+            cell["_truncated_chars"] = dropped
+        return cell
+
+    def feed(self, text):
+        """Consume a chunk of notebook text and return the list of cells completed by it"""
+        cells = []
+        i, n = 0, len(text)
+        while i < n and not self.done:
+            if self.in_string:
+                if self.escape:
+                    self._string_append(text[i])
+                    self.escape = False
+                    i += 1
+                    continue
+                match = _IN_STRING_RE.search(text, i)
+                if match is None:
+                    self._string_append(text[i:])
+                    break
+                j = match.start()
+                if text[j] == "\\":
+                    if j + 1 < n:
+                        # keep the escape pair together with the text before it
+                        self._string_append(text[i:j + 2])
+                        i = j + 2
+                    else:
+                        self._string_append(text[i:j + 1])
+                        self.escape = True
+                        i = j + 1
+                    continue
+                self._string_append(text[i:j])
+                self._end_string()
+                i = j + 1
+                continue
+
+            match = _STRUCTURE_RE.search(text, i)
+            if match is None:
+                self._emit(text[i:])
+                break
+            j = match.start()
+            self._emit(text[i:j])
+            ch = text[j]
+            i = j + 1
+
+            if ch == '"':
+                self._start_string()
+            elif self.cell_parts is not None:
+                self.cell_parts.append(ch)
+                if ch in "{[":
+                    self.cell_stack.append(ch)
+                else:
+                    self.cell_stack.pop()
+                if not self.cell_stack:
+                    cells.append(self._finish_cell())
+            elif ch in "{[":
+                if self.in_cells and ch == "{" and self.depth == 2:
+                    self.cell_parts = ["{"]
+                    self.cell_stack = ["{"]
+                    self.cell_key = None
+                    continue
+                if ch == "[" and self.depth == 1 and self.last_key == "cells":
+                    self.in_cells = True
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.in_cells and self.depth == 1:
+                    self.in_cells = False
+                    self.done = True  # everything after the cells array is notebook metadata
+        return cells
+
+
+def _iter_text_chunks(source, chunk_size=CHUNK_SIZE, timeout=30):
+    """Yield the text of a notebook given as a local path, an http(s) URL or the raw JSON text"""
+    if source.startswith(("http://", "https://")):
+        response = get_scheduler().get(source, stream=True, timeout=timeout)
+        try:
+            response.raise_for_status()
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield decoder.decode(chunk)
+            yield decoder.decode(b"", final=True)
+        finally:
+            response.close()
+    elif not source.lstrip().startswith("{") and os.path.exists(source):
+        with open(source, "r", encoding="utf-8", errors="replace") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    else:
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+
+
+def iter_notebook_cells(source, max_string_chars=None, max_cell_chars=None):
+    """
+    Stream the cells of a notebook one at a time.
+    `source` may be a local .ipynb path, a URL to the raw notebook, or the notebook JSON text.
+    Reading stops as soon as the cells array is complete.
+    """
+    scanner = NotebookCellScanner(max_string_chars, max_cell_chars)
+    chunks = _iter_text_chunks(source)
+    try:
+        for chunk in chunks:
+            for cell in scanner.feed(chunk):
+                yield cell
+            if scanner.done:
+                break
+    finally:
+        chunks.close()
+
+
+def _join(value):
+    return "".join(value) if isinstance(value, list) else str(value or "")
+
+
+def _describe_binary(mime, value):
+    text = _join(value)
+    size = len(text)
+    match = _TRUNCATED_RE.search(text)
+    if match:
+        size = match.start() + int(match.group(1))
+    # base64 carries 3 bytes per 4 characters
+    return f"[{mime} output omitted, ~{size * 3 // 4 // 1024} KB]"
+
+
+def summarize_output(output):
+    """Return the text of one code cell output, replacing binary payloads with a short description"""
+    output_type = output.get("output_type")
+    if output_type == "stream":
+        return _join(output.get("text", ""))
+    if output_type == "error":
+        return f"{output.get('ename', 'Error')}: {output.get('evalue', '')}"
+    data = output.get("data", {}) or {}
+    if "text/plain" in data:
+        return _join(data["text/plain"])
+    parts = []
+    for mime, value in data.items():
+        if mime.startswith(BINARY_MIME_PREFIXES):
+            parts.append(_describe_binary(mime, value))
+        elif mime != "text/html":
+            parts.append(_join(value))
+    return "\n".join(parts)
+
+
+def _cap(text, limit):
+    return text if len(text) <= limit else text[:limit] + f"\n... [truncated {len(text) - limit} chars]"
+
+
+def notebook_to_text(source, style="markdown", include_outputs=None, max_cell_chars=None, max_total_chars=None):
+    """
+    Render a notebook as prompt text while streaming it.
+
+    style="markdown" produces "## Cell i (Markdown)" / fenced code sections,
+    style="sections" produces "--- Markdown Cell i ---" / "--- Code Cell i ---" / "--- Output i ---" sections.
+    Per-cell text and the total length are capped; once the total cap is reached the
+    remaining cells are not read at all.
+    """
+    include_outputs = NOTEBOOK_CONFIG["include_outputs"] if include_outputs is None else include_outputs
+    max_cell_chars = max_cell_chars or NOTEBOOK_CONFIG["max_cell_chars"]
+    max_total_chars = max_total_chars or NOTEBOOK_CONFIG["max_total_chars"]
+
+    parts = []
+    total = 0
+    for i, cell in enumerate(iter_notebook_cells(source, max_cell_chars=max_cell_chars), 1):
+        cell_type = cell.get("cell_type", "")
+        text = _cap(_join(cell.get("source", [])), max_cell_chars)
+        if cell_type not in ("markdown", "code"):
+            continue
+
+        if style == "sections":
+            label = "Markdown Cell" if cell_type == "markdown" else "Code Cell"
+            section = f"\n--- {label} {i} ---\n{text}\n"
+        elif cell_type == "markdown":
+            section = f"## Cell {i} (Markdown)\n{text}\n"
+        else:
+            section = f"## Cell {i} (Code)\n```python\n{text}\n```\n"
+
+        if include_outputs and cell_type == "code" and cell.get("outputs"):
+            outputs = (summarize_output(o).rstrip("\n") for o in cell["outputs"])
+            output_text = _cap("\n".join(o for o in outputs if o), max_cell_chars)
+            if output_text.strip():
+                section += f"\n--- Output {i} ---\n{output_text}\n" if style == "sections" else f"Output:\n{output_text}\n"
+
+        if total + len(section) > max_total_chars:
+            parts.append(f"\n... [notebook truncated after {i - 1} cells: {max_total_chars} character limit]\n")
+            break
+        parts.append(section)
+        total += len(section)
+
+    return ("" if style == "sections" else "\n").join(parts)
@@ -0,0 +1,93 @@
+import re
+from cache_utils import JsonCache
+
+# top-level import names whose distribution on PyPI is called differently
+KNOWN_DISTRIBUTIONS = {
+    "cv2": "opencv-python",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "skbio": "scikit-bio",
+    "yaml": "PyYAML",
+    "Bio": "biopython",
+    "PIL": "Pillow",
+    "bs4": "beautifulsoup4",
+    "dateutil": "python-dateutil",
+    "dotenv": "python-dotenv",
+    "docx": "python-docx",
+    "pptx": "python-pptx",
+    "fitz": "PyMuPDF",
+    "Crypto": "pycryptodome",
+    "OpenSSL": "pyOpenSSL",
+    "jwt": "PyJWT",
+    "git": "GitPython",
+    "zmq": "pyzmq",
+    "serial": "pyserial",
+    "magic": "python-magic",
+    "attr": "attrs",
+    "mpl_toolkits": "matplotlib",
+    "pkg_resources": "setuptools",
+    "google.protobuf": "protobuf",
+    "MySQLdb": "mysqlclient",
+    "psycopg2": "psycopg2-binary",
+    "Levenshtein": "python-Levenshtein",
+    "umap": "umap-learn",
+    "igraph": "python-igraph",
+    "community": "python-louvain",
+    "scvi": "scvi-tools",
+    "faiss": "faiss-cpu",
+    "gi": "PyGObject",
+    "cairo": "pycairo",
+    "wx": "wxPython",
+    "ruamel": "ruamel.yaml",
+    "slugify": "python-slugify",
+    "multipart": "python-multipart",
+    "jose": "python-jose",
+}
+
+_PACKAGE_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*(\[[A-Za-z0-9._,-]+\])?$")
+
+
+def is_package_name(name):
+    """True if `name` looks like a pip requirement name (not a sentence from the LLM)"""
+    return bool(_PACKAGE_NAME_RE.match(name))
+
+
+class PackageResolver:
+    """
+    Maps a missing module to the distribution that provides it without asking the LLM:
+    the distribution index of the target environment (packages_distributions), then
+    KNOWN_DISTRIBUTIONS, then earlier LLM answers that led to a successful install
+    (JsonCache "package_names"). Names found nowhere are left to the LLM.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache or JsonCache("package_names")
+
+    def resolve(self, module, snapshot=None):
+        """(distribution, source) for a module name, or (None, None) if it is unknown"""
+        top = module.split(".")[0]
+        if snapshot is not None and top in snapshot.modules:
+            return snapshot.modules[top][0], "environment"
+        for name in (module, top):
+            if name in KNOWN_DISTRIBUTIONS:
+                return KNOWN_DISTRIBUTIONS[name], "table"
+        cached = self.cache.get(top)
+        if cached:
+            return cached, "cache"
+        return None, None
+
+    def resolve_many(self, modules, snapshot=None):
+        """Returns ({module: (distribution, source)}, [unresolved modules])"""
+        resolved, unresolved = {}, []
+        for module in modules:
+            distribution, source = self.resolve(module, snapshot)
+            if distribution:
+                resolved[module] = (distribution, source)
+            else:
+                unresolved.append(module)
+        return resolved, unresolved
+
+    def remember(self, module, distribution):
+        """Cache an LLM answer once installing it worked"""
+        if is_package_name(distribution):
+            self.cache.set(module.split(".")[0], distribution)
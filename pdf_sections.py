@@ -0,0 +1,113 @@
+import re
+from collections import Counter
+from config import PDF_CONFIG
+
+# canonical section name -> heading words that introduce it
+SECTION_HEADINGS = {
+    "abstract": ["abstract", "summary"],
+    "introduction": ["introduction", "background"],
+    "methods": ["methods", "method", "materials and methods", "methods and materials", "methodology",
+                "experimental procedures", "star methods", "online methods", "experimental section"],
+    "results": ["results", "results and discussion"],
+    "discussion": ["discussion"],
+    "conclusion": ["conclusion", "conclusions", "concluding remarks"],
+    "acknowledgements": ["acknowledgements", "acknowledgments", "acknowledgement", "acknowledgment", "funding"],
+    "references": ["references", "bibliography", "literature cited", "references and notes", "works cited"],
+    "supplementary": ["supplementary material", "supplementary materials", "supplementary information",
+                      "supplemental information", "supporting information", "appendix", "appendices"],
+}
+
+_HEADING_WORDS = {word: name for name, words in SECTION_HEADINGS.items() for word in words}
+# optional numbering ("2", "2.", "II.", "A.") then a known heading, alone on its line (a trailing colon or period is allowed)
+_HEADING_RE = re.compile(
+    r"^\s*(?:(?:\d{1,2}|[IVX]{1,4}|[A-H])[.)]?\s+)?(" + "|".join(sorted(map(re.escape, _HEADING_WORDS), key=len, reverse=True)) + r")\s*[:.]?\s*$",
+    re.IGNORECASE,
+)
+_PAGE_NUMBER_RE = re.compile(r"^\s*(?:page\s*)?\d{1,4}(?:\s*(?:of|/)\s*\d{1,4})?\s*$", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d+")
+
+EDGE_LINES = 3  # lines at the top and bottom of a page that may be running headers or footers
+
+
+def _edge_key(line):
+    # page numbers and dates inside running headers differ from page to page
+    return _DIGITS_RE.sub("#", line.strip().lower())
+
+
+def strip_boilerplate(pages, min_share=0.5):
+    """
+    Remove running headers and footers (lines near the top or bottom of a page that
+    repeat on at least `min_share` of the pages) and bare page numbers.
+    Returns the cleaned page texts.
+    """
+    split_pages = [page.splitlines() for page in pages]
+    counts = Counter()
+    for lines in split_pages:
+        edges = {_edge_key(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:] if line.strip()}
+        counts.update(edges)
+    threshold = max(2, min_share * len(pages))
+    repeated = {key for key, count in counts.items() if count >= threshold}
+
+    cleaned = []
+    for lines in split_pages:
+        n = len(lines)
+        kept = [
+            line for i, line in enumerate(lines)
+            if not ((i < EDGE_LINES or i >= n - EDGE_LINES) and (_edge_key(line) in repeated or _PAGE_NUMBER_RE.match(line)))
+        ]
+        cleaned.append("\n".join(kept))
+    return cleaned
+
+
+def split_sections(text):
+    """
+    Split paper text at recognised section headings.
+    Returns a list of (section, text); text before the first heading is the "front" section.
+    """
+    sections = []
+    current, lines = "front", []
+    for line in text.splitlines():
+        match = _HEADING_RE.match(line) if len(line) < 60 else None
+        if match:
+            if lines:
+                sections.append((current, "\n".join(lines)))
+            current, lines = _HEADING_WORDS[match.group(1).lower()], [line]
+        else:
+            lines.append(line)
+    if lines:
+        sections.append((current, "\n".join(lines)))
+    return sections
+
+
+def section_name(name):
+    """Canonical SECTION_HEADINGS name of a section or heading ("Methods", "materials and methods" -> "methods")"""
+    key = " ".join(name.lower().replace("_", " ").split())
+    if key in SECTION_HEADINGS:
+        return key
+    if key in _HEADING_WORDS:
+        return _HEADING_WORDS[key]
+    raise ValueError(f"unknown paper section {name!r} (known: {', '.join(SECTION_HEADINGS)})")
+
+
+def select_sections(text, sections=None, drop=None):
+    """
+    Keep only the useful sections of a paper. `sections` lists the sections to keep
+    (plus the front matter); otherwise every section except those in `drop`
+    (default PDF_CONFIG["drop_sections"]) is kept. A dropped section runs until the next
+    recognised heading, so e.g. methods printed after the references are still kept.
+    Section names go through section_name(), so unknown names raise ValueError.
+    """
+    drop = {section_name(name) for name in (PDF_CONFIG["drop_sections"] if drop is None else drop)}
+    keep = {"front", *map(section_name, sections)} if sections else None
+    parts = []
+    for name, body in split_sections(text):
+        if (name not in keep) if keep is not None else (name in drop):
+            continue
+        parts.append(body)
+    return "\n".join(parts).strip()
+
+
+def clean_pdf_text(pages, sections=None, drop=None):
+    """Page texts -> prompt text without headers, footers, page numbers and unwanted sections"""
+    text = "\n".join(strip_boilerplate(pages)) if len(pages) > 2 else "\n".join(pages)
+    return select_sections(text, sections, drop)
@@ -0,0 +1,238 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import PyPDF2
+from cache_utils import file_hash
+from config import CACHE_DIR, PDF_CONFIG
+from pdf_sections import clean_pdf_text
+
+PdfPage = namedtuple("PdfPage", ["path", "number", "text", "seconds"])
+
+# part of every cache key: bump the suffix when extraction changes, a PyPDF2 upgrade invalidates on its own
+EXTRACTOR_VERSION = f"PyPDF2-{PyPDF2.__version__}/1"
+
+
+class PdfPageCache:
+    """
+    Persistent page-level cache of extracted PDF text.
+
+    Pages are stored zlib-compressed in an SQLite database under CACHE_DIR, keyed
+    by (file content hash, extractor version, page number). File hashes are
+    remembered together with the file's size and mtime, so unchanged files are not
+    even re-hashed; a modified file gets a new hash and is extracted again.
+    """
+
+    def __init__(self, path=None, extractor=EXTRACTOR_VERSION):
+        self.path = path or os.path.join(CACHE_DIR, "pdf_pages.sqlite")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.extractor = extractor
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT);"
+            "CREATE TABLE IF NOT EXISTS documents (sha256 TEXT, extractor TEXT, n_pages INTEGER, PRIMARY KEY (sha256, extractor));"
+            "CREATE TABLE IF NOT EXISTS pages (sha256 TEXT, extractor TEXT, page INTEGER, text BLOB, "
+            "PRIMARY KEY (sha256, extractor, page));"
+        )
+        self.conn.commit()
+
+    def file_sha(self, path):
+        """Content hash of a file, skipping the hashing when size and mtime match the last visit"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        sha = file_hash(path)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, sha),
+            )
+            self.conn.commit()
+        return sha
+
+    def get(self, sha):
+        """Cached page texts of a document in page order, or None if it was not fully extracted before"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT n_pages FROM documents WHERE sha256 = ? AND extractor = ?", (sha, self.extractor)
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self.conn.execute(
+                "SELECT text FROM pages WHERE sha256 = ? AND extractor = ? ORDER BY page", (sha, self.extractor)
+            ).fetchall()
+        if len(rows) != row[0]:
+            return None
+        return [zlib.decompress(text).decode("utf-8") for (text,) in rows]
+
+    def put(self, sha, pages):
+        """Store the page texts of a fully extracted document"""
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pages (sha256, extractor, page, text) VALUES (?, ?, ?, ?)",
+                [(sha, self.extractor, number, zlib.compress(text.encode("utf-8"), 6)) for number, text in enumerate(pages)],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (sha256, extractor, n_pages) VALUES (?, ?, ?)",
+                (sha, self.extractor, len(pages)),
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """The process-wide PdfPageCache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PdfPageCache()
+        return _cache
+
+
+def pdf_hash(path):
+    """Content hash of a PDF, using the page cache's size/mtime fast path when caching is enabled"""
+    return get_page_cache().file_sha(path) if PDF_CONFIG["cache"] else file_hash(path)
+
+
+def _page_count(path):
+    with open(path, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def _extract_range(path, start, end):
+    """Worker: text and extraction time of pages [start, end) of one PDF"""
+    pages = []
+    with open(path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        for number in range(start, min(end, len(reader.pages))):
+            began = time.perf_counter()
+            text = reader.pages[number].extract_text() or ""
+            pages.append(PdfPage(path, number, text, time.perf_counter() - began))
+    return pages
+
+
+def _ranges(n_pages, pages_per_task):
+    return [(start, min(n_pages, start + pages_per_task)) for start in range(0, n_pages, pages_per_task)]
+
+
+def _iter_serial(paths, errors):
+    for path in paths:
+        try:
+            yield from _extract_range(path, 0, _page_count(path))
+        except Exception as e:
+            errors[path] = e
+
+
+def iter_pdf_pages(paths, max_workers=None, pages_per_task=None, errors=None):
+    """
+    Stream the pages of several PDFs as PdfPage(path, number, text, seconds).
+
+    Work is spread over a process pool, across files and across page ranges of
+    large files, and pages are yielded as soon as their range is done, so pages of
+    different files interleave and a file's pages may arrive out of order. Files
+    that cannot be read are recorded in `errors` ({path: exception}).
+    """
+    max_workers = max_workers or PDF_CONFIG["max_workers"] or os.cpu_count() or 1
+    pages_per_task = pages_per_task or PDF_CONFIG["pages_per_task"]
+    errors = {} if errors is None else errors
+    paths = list(paths)
+    if len(paths) == 1 and max_workers > 1:
+        # a single short file is not worth starting worker processes for
+        try:
+            if _page_count(paths[0]) <= pages_per_task:
+                max_workers = 1
+        except Exception as e:
+            errors[paths[0]] = e
+            return
+    if max_workers <= 1 or not paths:
+        yield from _iter_serial(paths, errors)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # page counts come back first; each one fans out into page-range tasks
+        pending = {executor.submit(_page_count, path): ("count", path) for path in paths}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, path = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[path] = e
+                    continue
+                if kind == "count":
+                    for start, end in _ranges(result, pages_per_task):
+                        pending[executor.submit(_extract_range, path, start, end)] = ("pages", path)
+                else:
+                    yield from result
+
+
+def extract_pdfs(paths, max_workers=None, pages_per_task=None, verbose=False, use_cache=None, clean=None, sections=None):
+    """
+    Extract the text of several PDFs in parallel.
+    Files whose content was extracted before are served from the page cache; only new
+    or modified files are parsed. With clean=True (PDF_CONFIG["clean"]) running headers,
+    footers, page numbers and the sections in PDF_CONFIG["drop_sections"] are removed, or
+    only `sections` are kept (see pdf_sections). Returns {path: text} with each file's
+    pages joined in page order, and {path: exception} for failures.
+    """
+    paths = list(paths)
+    use_cache = PDF_CONFIG["cache"] if use_cache is None else use_cache
+    clean = PDF_CONFIG["clean"] if clean is None else clean
+
+    def assemble(ordered):
+        return clean_pdf_text(ordered, sections) if clean else "\n".join(ordered)
+    errors = {}
+    texts = {}
+    shas = {}
+    if use_cache:
+        cache = get_page_cache()
+        for path in paths:
+            try:
+                shas[path] = cache.file_sha(path)
+            except OSError as e:
+                errors[path] = e
+                continue
+            cached = cache.get(shas[path])
+            if cached is not None:
+                texts[path] = assemble(cached)
+        if verbose and texts:
+            print(f"Loaded {len(texts)} PDF(s) from the page cache")
+    todo = [path for path in paths if path not in texts and path not in errors]
+
+    pages = {path: {} for path in todo}
+    began = time.perf_counter()
+    n_pages = 0
+    slowest = None
+    for page in iter_pdf_pages(todo, max_workers, pages_per_task, errors):
+        pages[page.path][page.number] = page.text
+        n_pages += 1
+        if slowest is None or page.seconds > slowest.seconds:
+            slowest = page
+    if verbose and n_pages:
+        print(
+            f"Extracted {n_pages} pages from {sum(path not in errors for path in todo)} PDF(s) in {time.perf_counter() - began:.1f}s "
+            f"(slowest page: {os.path.basename(slowest.path)} p.{slowest.number + 1}, {slowest.seconds:.2f}s)"
+        )
+    for path, by_number in pages.items():
+        if path in errors:
+            continue
+        ordered = [by_number[number] for number in sorted(by_number)]
+        if use_cache:
+            cache.put(shas[path], ordered)
+        texts[path] = assemble(ordered)
+    return texts, errors
@@ -0,0 +1,325 @@
+import ast
+import builtins
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+Issue = namedtuple("Issue", ["kind", "line", "message"])  # kind: syntax, undefined-name, missing-module, missing-file
+
+# findings that may be wrong (a file created by other means before the run): the user can run the code anyway
+WARNING_KINDS = {"missing-file"}
+
+# standard library modules are never looked up in the distribution index
+STDLIB_MODULES = set(getattr(sys, "stdlib_module_names", ())) | set(sys.builtin_module_names) | {"__future__"}
+
+# names a script run by runpy / `python script.py` has without binding them
+MODULE_NAMES = {"__file__", "__name__", "__doc__", "__spec__", "__loader__", "__package__", "__builtins__", "__cached__", "__class__"}
+
+# calls whose names are bound at run time, which makes undefined names undecidable
+DYNAMIC_NAMES = {"exec", "eval", "globals", "locals", "vars", "__import__"}
+
+# calls, by qualified name after resolving import aliases, that read the file named by their first
+# argument (the mode argument is checked for open and h5py.File); generic names such as x.load()
+# (spacy.load, torch.hub.load) are not file readers
+READ_FUNCTIONS = {
+    "open", "io.open", "numpy.load", "numpy.loadtxt", "numpy.genfromtxt", "numpy.fromfile", "h5py.File",
+    "scipy.io.mmread", "scipy.io.loadmat", "scanpy.read", "pyarrow.parquet.read_table", "pyarrow.parquet.ParquetFile",
+    "matplotlib.pyplot.imread", "imageio.imread", "cv2.imread", "skimage.io.imread",
+}
+READ_PREFIXES = ("pandas.read_", "scanpy.read_", "anndata.read_")
+# keywords that give the call another source than a local file
+URL_KEYWORDS = {"backup_url", "url", "storage_options"}
+# methods and functions that write the file named by their first argument
+WRITE_NAMES = {
+    "savefig", "save", "savez", "savez_compressed", "savetxt", "write", "write_h5ad", "write_loom", "write_csvs",
+    "dump", "imsave", "imwrite", "write_table",
+}
+_WRITE_MODE_RE = re.compile(r"[wax]")
+
+# batch import check run in the target interpreter for modules missing from the index
+FIND_SPEC_SCRIPT = (
+    "import importlib.util, json, sys\n"
+    "missing = []\n"
+    "for name in sys.argv[1:]:\n"
+    "    try:\n"
+    "        found = importlib.util.find_spec(name) is not None\n"
+    "    except (ImportError, ValueError):\n"
+    "        found = False\n"
+    "    if not found:\n"
+    "        missing.append(name)\n"
+    "print(json.dumps(missing))\n"
+)
+
+
+class PreflightReport:
+    """Problems found in generated code before running it"""
+
+    def __init__(self):
+        self.issues = []
+        self.missing_modules = []  # top-level modules the target environment cannot import
+        self.checked = True  # False when the code uses syntax newer than this interpreter can parse
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        return not self.issues
+
+    @property
+    def blocking(self):
+        """Issues that make running the code pointless (everything but WARNING_KINDS)"""
+        return [issue for issue in self.issues if issue.kind not in WARNING_KINDS]
+
+    def add(self, kind, line, message):
+        self.issues.append(Issue(kind, line, message))
+
+    def format(self):
+        return "\n".join(f"line {issue.line}: [{issue.kind}] {issue.message}" for issue in self.issues)
+
+
+def _version_tuple(python_version):
+    """(3, 11) from "Python 3.11.7"; None if it cannot be read"""
+    match = re.search(r"(\d+)\.(\d+)", python_version or "")
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def parse_code(code, target_version=None):
+    """
+    AST of `code`, checked with the grammar of the target interpreter where this one knows it.
+    Raises SyntaxError (also for errors only compile() finds, e.g. 'return' outside a function).
+    """
+    feature_version = target_version if target_version and (3, 7) <= target_version <= sys.version_info[:2] else None
+    tree = ast.parse(code, feature_version=feature_version) if feature_version else ast.parse(code)
+    compile(tree, "<generated code>", "exec", dont_inherit=True)
+    return tree
+
+
+def undefined_names(tree):
+    """
+    {name: first line} of names that are read but never bound anywhere in the script, nor
+    builtins. Every binding counts for every scope, so only names that cannot exist at run
+    time are reported; scripts using star imports or exec/globals() are not checked.
+    """
+    bound = set(dir(builtins)) | MODULE_NAMES
+    loaded = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                if node.id in DYNAMIC_NAMES:
+                    return {}
+                loaded.setdefault(node.id, node.lineno)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+            return {}
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            bound.update(alias.asname or alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, getattr(ast, "MatchAs", ())) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, getattr(ast, "MatchStar", ())) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, getattr(ast, "MatchMapping", ())) and node.rest:
+            bound.add(node.rest)
+    return {name: line for name, line in loaded.items() if name not in bound}
+
+
+def _guards_imports(node):
+    """True for try blocks whose handlers catch a failed import (the import is optional)"""
+    if not isinstance(node, ast.Try):
+        return False
+    for handler in node.handlers:
+        names = [handler.type] if not isinstance(handler.type, ast.Tuple) else handler.type.elts
+        if handler.type is None or any(
+            isinstance(n, ast.Name) and n.id in ("ImportError", "ModuleNotFoundError", "Exception", "BaseException") for n in names
+        ):
+            return True
+    return False
+
+
+def required_imports(tree):
+    """
+    {top-level module: first line} of absolute imports that run unconditionally: imports
+    under an `if` or inside a try that handles ImportError are optional by design.
+    """
+    imports = {}
+
+    def visit(node, optional):
+        if isinstance(node, ast.Import):
+            if not optional:
+                for alias in node.names:
+                    imports.setdefault(alias.name.split(".")[0], node.lineno)
+        elif isinstance(node, ast.ImportFrom):
+            if not optional and node.level == 0 and node.module:
+                imports.setdefault(node.module.split(".")[0], node.lineno)
+        elif _guards_imports(node):
+            for stmt in node.body:
+                visit(stmt, True)
+            for part in node.handlers + node.orelse + node.finalbody:
+                visit(part, optional)
+        else:
+            for child in ast.iter_child_nodes(node):
+                visit(child, optional or isinstance(node, ast.If))
+
+    visit(tree, False)
+    return imports
+
+
+def import_aliases(tree):
+    """{local name: qualified name} bound by the imports of a script ("np" -> "numpy", "mmread" -> "scipy.io.mmread")"""
+    aliases = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    aliases[alias.asname] = alias.name
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            for alias in node.names:
+                aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+    return aliases
+
+
+def qualified_name(func, aliases):
+    """Dotted name of a called expression with import aliases resolved, or None"""
+    parts = []
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if not isinstance(func, ast.Name):
+        return None
+    parts.append(aliases.get(func.id, func.id))
+    return ".".join(reversed(parts))
+
+
+def _is_reader(name):
+    return name in READ_FUNCTIONS or name.startswith(READ_PREFIXES)
+
+
+def _path_literal(node):
+    """The first positional argument of a call if it is a plausible local path literal, else None"""
+    if not node.args or not isinstance(node.args[0], ast.Constant) or not isinstance(node.args[0].value, str):
+        return None
+    path = node.args[0].value
+    if not path.strip() or "://" in path or "\n" in path or len(path) > 1024:
+        return None
+    return path
+
+
+def file_arguments(tree):
+    """
+    Path literals given to file reading and writing calls: ({path: first line} read, {paths} written).
+    Reads are the READ_FUNCTIONS / READ_PREFIXES calls (open and h5py.File in a read mode)
+    without URL keywords; writes are WRITE_NAMES, to_* methods and open/File in a write mode.
+    """
+    aliases = import_aliases(tree)
+    reads, writes = {}, set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        path = _path_literal(node)
+        if path is None:
+            continue
+        name = qualified_name(node.func, aliases) or ""
+        attr = name.rsplit(".", 1)[-1]
+        if name in ("open", "io.open", "h5py.File"):
+            (writes.add(path) if _WRITE_MODE_RE.search(_mode(node)) else reads.setdefault(path, node.lineno))
+        elif _is_reader(name):
+            if not any(kw.arg in URL_KEYWORDS for kw in node.keywords):
+                reads.setdefault(path, node.lineno)
+        elif attr in WRITE_NAMES or attr.startswith("to_"):
+            writes.add(path)
+    return reads, writes
+
+
+def _mode(node):
+    mode = node.args[1] if len(node.args) > 1 else next((kw.value for kw in node.keywords if kw.arg == "mode"), None)
+    return mode.value if isinstance(mode, ast.Constant) and isinstance(mode.value, str) else "r"
+
+
+def missing_input_files(tree, cwd=None):
+    """
+    {path: line} of path literals read by file_arguments() readers (open, pd.read_csv,
+    sc.read_h5ad, np.load, ...) that do not exist. Literals that are written too or appear
+    more than once are skipped, since the script may create the file before reading it.
+    """
+    cwd = cwd or os.getcwd()
+    counts = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            counts[node.value] = counts.get(node.value, 0) + 1
+    reads, writes = file_arguments(tree)
+    return {
+        path: line for path, line in reads.items()
+        if path not in writes and counts[path] == 1 and not os.path.exists(os.path.join(cwd, os.path.expanduser(path)))
+    }
+
+
+def find_missing_modules(python_executable, modules, timeout=60):
+    """The modules the interpreter cannot import (one find_spec launch for all of them)"""
+    if not modules:
+        return []
+    result = subprocess.run(
+        [python_executable, "-c", FIND_SPEC_SCRIPT, *modules], capture_output=True, text=True, timeout=timeout
+    )
+    if result.returncode != 0:
+        return []  # cannot tell; the run itself will show
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def preflight_check(code, snapshot=None, python_executable=None, cwd=None):
+    """
+    Check generated code without running it: syntax (with the target interpreter's grammar),
+    names that are never bound, unconditional imports of modules the target environment does
+    not have (looked up in the snapshot's distribution index, confirmed in one interpreter
+    launch) and literal input files that do not exist.
+    """
+    began = time.perf_counter()
+    report = PreflightReport()
+    cwd = cwd or os.getcwd()
+    target_version = _version_tuple(snapshot.python_version) if snapshot else None
+    try:
+        tree = parse_code(code, target_version)
+    except SyntaxError as e:
+        if target_version and target_version > sys.version_info[:2]:
+            report.checked = False  # may be valid syntax of the newer target interpreter
+        else:
+            text = f": {e.text.strip()}" if e.text and e.text.strip() else ""
+            report.add("syntax", e.lineno or 0, f"SyntaxError: {e.msg}{text}")
+        report.seconds = time.perf_counter() - began
+        return report
+
+    for name, line in sorted(undefined_names(tree).items(), key=lambda item: item[1]):
+        report.add("undefined-name", line, f"name '{name}' is not defined")
+
+    imports = required_imports(tree)
+    unknown = [
+        module for module in imports
+        if module not in STDLIB_MODULES
+        and not (snapshot is not None and snapshot.has_module(module))
+        and not os.path.exists(os.path.join(cwd, module + ".py"))
+        and not os.path.isdir(os.path.join(cwd, module))
+    ]
+    if unknown and python_executable:
+        # not every importable module has a distribution record (conda builds, editable installs)
+        try:
+            report.missing_modules = find_missing_modules(python_executable, unknown)
+        except (OSError, subprocess.TimeoutExpired, ValueError):
+            report.missing_modules = []
+    for module in report.missing_modules:
+        report.add("missing-module", imports[module], f"No module named '{module}' in the target environment")
+
+    for path, line in sorted(missing_input_files(tree, cwd).items(), key=lambda item: item[1]):
+        report.add("missing-file", line, f"input file not found: {path}")
+    report.issues.sort(key=lambda issue: issue.line)
+    report.seconds = time.perf_counter() - began
+    return report
@@ -8,6 +8,8 @@ import requests
 from llm_utils import query_llm
 import prompts
 import io
+import json
+from source_index import render_sources
 
 
 def get_quick_search_summary_prompt(query, raw_text):
@@ -21,6 +23,7 @@ def get_quick_search_summary_prompt(query, raw_text):
 
 def get_pi_plan_prompt(sources, topic, mode, changes=None):
     """Create a comprehensive plan prompt for the Principal Investigator"""
+    sources = render_sources(sources, f"{topic} {changes or ''}")
     
     if changes:
         plan_prompt = f"""
@@ -82,6 +85,7 @@ def get_pi_plan_prompt(sources, topic, mode, changes=None):
     return plan_prompt
 
 def get_browsing_prompt(topic, formatted_sources):
+    formatted_sources = render_sources(formatted_sources, topic)
     return (
         f"You are a research assistant summarizing information from multiple sources.\n\n"
         f"Topic: {topic}\n\n"
@@ -91,6 +95,7 @@ def get_browsing_prompt(topic, formatted_sources):
 
 
 def get_only_research_draft_prompt(sources, topic, plan_section=""):
+    sources = render_sources(sources, f"{topic} {plan_section}")
     return (
         f"Write a professional research report on the topic: '{topic}', using the following sources:\n\n"
         f"{sources}\n\n"
@@ -119,6 +124,7 @@ def get_research_improve_prompt(draft, feedback):
 
 
 def get_code_prompt(sources, topic, plan_section=""):
+    sources = render_sources(sources, f"{topic} {plan_section}")
     return (
         f"You are a professional Python developer. Based on the following sources:\n\n"
         f"{sources}\n\n"
@@ -224,6 +230,7 @@ def get_code_review_succeeded_prompt(code, execution_result):
 
 
 def get_document_critique_prompt(document, sources):
+    sources = render_sources(sources, document)
     return (
         f"Review the following research document and critique it for clarity, completeness, and relevance.\n\n"
         f"Document:\n{document}\n\n"
@@ -251,6 +258,7 @@ def get_summary_feedback_prompt(report_feedback, code_feedback):
 
 
 def get_coding_plan_prompt(sources, topic, plan_section=""):
+    sources = render_sources(sources, f"{topic} {plan_section}")
     return (
         f"You are a professional Python developer with a strong understanding of the Python programming language and its libraries. "
         f"You are also an expert on Bioinformatics and Genomics.\n\n"
@@ -316,6 +324,7 @@ def get_improved_coding_plan_prompt(feedback, coding_plan):
 
 
 def get_code_writing_prompt(sources, topic, plan_section, coding_plan):
+    sources = render_sources(sources, f"{topic} {coding_plan}")
     return (
         f"You are a professional Python developer with a strong understanding of the Python programming language and its libraries. "
         f"You are also an expert on Bioinformatics and Genomics.\n\n"
@@ -388,7 +397,15 @@ def get_code_writing_prompt(sources, topic, plan_section, coding_plan):
     )
 
 
-def get_code_reviewer_analysis_prompt(code, execution_result):
+def format_error_report_block(error_report):
+    """The executor's structured error report as a JSON block for the reviewer prompts ("" if there is none)"""
+    if not error_report:
+        return ""
+    fields = {key: value for key, value in error_report.items() if value not in (None, [], {}, 0)}
+    return f"Structured Error Report (parsed from the complete output):\n```json\n{json.dumps(fields, indent=1)}\n```\n"
+
+
+def get_code_reviewer_analysis_prompt(code, execution_result, error_report=None):
     """Create a prompt to analyze the execution result and determine what needs to be fixed"""
     
     # Check if user provided a suggestion
@@ -408,13 +425,15 @@ Code:
 Execution Result:
 {execution_result}
 
+{format_error_report_block(error_report)}
 {f"USER SUGGESTION: {user_suggestion}" if user_suggestion else ""}
 
-Based on the execution result, identify:
+Based on the execution result (and the structured error report: status, exception type, failing line, frames, missing modules), identify:
 1. What type of issue occurred (user feedback, execution error, output error, etc.)
 2. What specific problems need to be addressed
 3. What the root cause is
 4. What approach should be taken to fix it
+5. If a "Resource usage" line is present (wall/CPU time, peak RSS), whether it points to a performance or memory problem worth fixing
 
 {f"IMPORTANT: The user provided a specific suggestion: '{user_suggestion}'. Prioritize this suggestion in your analysis and use it as the primary approach to fix the issue." if user_suggestion else ""}
 
@@ -427,7 +446,7 @@ APPROACH: [how to fix the issues - prioritize user suggestion if provided]
 Focus on understanding the user's intent and the actual problems, not just surface-level issues."""
 
 
-def get_code_reviewer_fix_prompt(code, execution_result, analysis):
+def get_code_reviewer_fix_prompt(code, execution_result, analysis, error_report=None):
     """Create a prompt to fix the code based on the intelligent analysis"""
     
     # Check if user provided a suggestion
@@ -450,6 +469,7 @@ Code:
 Execution Result:
 {execution_result}
 
+{format_error_report_block(error_report)}
 {f"USER SUGGESTION: {user_suggestion}" if user_suggestion else ""}
 
 Provide a corrected version of the code that addresses the identified issues. 
@@ -623,3 +643,43 @@ def get_file_path_validation_prompt():
 
 
 
+
+
+def get_source_digest_prompt(kind, text):
+    """Map step of the source digest: condense one piece of a source"""
+    return (
+        f"You are condensing research material so that other agents do not have to re-read it.\n\n"
+        f"Source type: {kind}\n\n"
+        f"Source text:\n{text}\n\n"
+        f"Write a compact structured digest of this text using exactly these sections (write 'None' if a section is empty):\n"
+        f"KEY FINDINGS: the main results, claims and numbers, one bullet each\n"
+        f"METHODS: techniques, models and analysis steps\n"
+        f"DATASETS: dataset names, accessions and data formats\n"
+        f"FILE PATHS: every file or directory path mentioned, copied exactly\n"
+        f"PACKAGES: software packages, libraries and tools\n\n"
+        f"Be factual and terse. Do not add information that is not in the text. Do not include your internal reasoning."
+    )
+
+
+def get_source_digest_reduce_prompt(kind, digests):
+    """Reduce step of the source digest: merge partial digests of the same source"""
+    joined = "\n\n".join(f"Partial digest {i}:\n{digest}" for i, digest in enumerate(digests, 1))
+    return (
+        f"The following partial digests were written for consecutive parts of one source ({kind}).\n\n"
+        f"{joined}\n\n"
+        f"Merge them into a single digest with the same sections (KEY FINDINGS, METHODS, DATASETS, FILE PATHS, PACKAGES). "
+        f"Remove duplicates, keep every distinct file path, package and dataset, and keep the most important findings. "
+        f"Do not include your internal reasoning."
+    )
+
+
+def get_collection_summary_prompt(summaries):
+    """Reduce step for a document collection: synthesize the summaries of several papers"""
+    joined = "\n\n".join(summaries)
+    return (
+        f"Below are structured summaries of several papers from one collection.\n\n"
+        f"{joined}\n\n"
+        f"Write an overview of the collection: the common themes, the main findings and how the papers relate to "
+        f"or disagree with each other, and the datasets, methods and packages they share. Refer to papers by their "
+        f"file names. Be concise and do not include your internal reasoning."
+    )
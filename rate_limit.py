@@ -0,0 +1,301 @@
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from config import HTTP_CONFIG
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second up to `capacity`;
+    acquire() blocks until enough tokens are available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate, capacity=None):
+        """Change the refill rate (e.g. when an API key becomes available)"""
+        with self.lock:
+            self._refill()
+            self.rate = float(rate)
+            self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+            self.tokens = min(self.tokens, self.capacity)
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without blocking; returns the number of seconds to wait if not enough are available"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available and consume them. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(tokens)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+# process-wide buckets shared by every client talking to the same service
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(name, rate, capacity=None):
+    """
+    Return the process-wide bucket registered under `name`, creating it on first use.
+    All callers share the same bucket, so limits hold across agents and threads.
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            bucket = TokenBucket(rate, capacity)
+            _buckets[name] = bucket
+        return bucket
+
+
+# --- per-domain outbound request scheduling -------------------------------
+
+_topic_state = threading.local()
+
+
+@contextmanager
+def request_topic(topic):
+    """
+    Tag every request made by this thread inside the block with `topic`.
+    Requests to the same domain are served round-robin across topics, so one
+    topic with many links cannot starve the others.
+    """
+    previous = getattr(_topic_state, "topic", None)
+    _topic_state.topic = topic
+    try:
+        yield
+    finally:
+        _topic_state.topic = previous
+
+
+def current_topic():
+    return getattr(_topic_state, "topic", None) or "default"
+
+
+def parse_retry_after(value):
+    """Return the number of seconds requested by a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def domain_of(url):
+    host = (urlparse(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class _DomainQueue:
+    """Token bucket, fair per-topic waiting lanes and back-off state for one domain"""
+
+    def __init__(self, domain, rate):
+        self.domain = domain
+        self.configured_rate = rate
+        self.bucket = get_bucket(f"domain:{domain}", rate)
+        self.lanes = OrderedDict()  # topic -> deque of waiting tickets, in round-robin order
+        self.cond = threading.Condition()
+        self.blocked_until = 0.0
+
+    def acquire(self, topic):
+        ticket = object()
+        with self.cond:
+            self.lanes.setdefault(topic, deque()).append(ticket)
+            while True:
+                head_topic = next(iter(self.lanes))
+                if self.lanes[head_topic][0] is not ticket:
+                    self.cond.wait(1.0)
+                    continue
+                delay = self.blocked_until - time.monotonic()
+                if delay <= 0:
+                    delay = self.bucket.try_acquire()
+                if delay <= 0:
+                    lane = self.lanes.pop(head_topic)
+                    lane.popleft()
+                    if lane:
+                        self.lanes[head_topic] = lane  # back of the rotation
+                    self.cond.notify_all()
+                    return
+                self.cond.wait(delay)
+
+    def block(self, seconds):
+        """Pause every request to this domain for `seconds`"""
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+    def on_throttled(self):
+        # multiplicative decrease: the server told us we are too fast
+        self.bucket.set_rate(max(self.bucket.rate * 0.5, self.configured_rate * 0.1), capacity=1)
+
+    def on_success(self):
+        # additive increase back toward the configured rate
+        if self.bucket.rate < self.configured_rate:
+            self.bucket.set_rate(min(self.configured_rate, self.bucket.rate + self.configured_rate * 0.05))
+
+
+class RequestScheduler:
+    """
+    Central scheduler for outbound HTTP.
+
+    Each domain has its own token bucket (rates from HTTP_CONFIG["domain_rates"]),
+    waiting requests are served round-robin across topics, 429/503 responses
+    honour Retry-After by pausing the whole domain, other transient failures are
+    retried with jittered exponential backoff, and a throttled domain's rate is
+    halved and then slowly restored (AIMD) to find the sustainable request rate.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, domain_rates=None, max_retries=None, backoff_base=None, backoff_max=None):
+        self.domain_rates = dict(domain_rates or HTTP_CONFIG["domain_rates"])
+        self.max_retries = HTTP_CONFIG["max_retries"] if max_retries is None else max_retries
+        self.backoff_base = backoff_base or HTTP_CONFIG["backoff_base"]
+        self.backoff_max = backoff_max or HTTP_CONFIG["backoff_max"]
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0}
+
+    def _queue(self, domain):
+        with self.lock:
+            queue = self.queues.get(domain)
+            if queue is None:
+                queue = _DomainQueue(domain, self._rate_for(domain))
+                self.queues[domain] = queue
+            return queue
+
+    def _rate_for(self, domain):
+        # "html.duckduckgo.com" falls back to the "duckduckgo.com" entry, then to "default"
+        parts = domain.split(".")
+        for i in range(len(parts) - 1):
+            rate = self.domain_rates.get(".".join(parts[i:]))
+            if rate is not None:
+                return rate
+        return self.domain_rates.get("default", 2.0)
+
+    def set_domain_rate(self, domain, rate):
+        """Change a domain's sustained rate (e.g. after an API key raises the limit)"""
+        self.domain_rates[domain] = rate
+        queue = self._queue(domain)
+        queue.configured_rate = rate
+        queue.bucket.set_rate(rate)
+
+    def acquire(self, domain, topic=None):
+        """Wait for this domain's next request slot"""
+        self._queue(domain).acquire(topic or current_topic())
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff delay for retry number `attempt` (0-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, topic=None, max_retries=None, **kwargs):
+        """requests.request() with per-domain pacing, Retry-After handling and retries"""
+        retries = self.max_retries if max_retries is None else max_retries
+        domain = domain_of(url)
+        queue = self._queue(domain)
+        kwargs.setdefault("timeout", 30)
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.setdefault("User-Agent", HTTP_CONFIG["user_agent"])
+
+        for attempt in range(retries + 1):
+            queue.acquire(topic or current_topic())
+            self.stats["requests"] += 1
+            try:
+                response = requests.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == retries:
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if response.status_code not in self.RETRY_STATUSES or attempt == retries:
+                if response.status_code < 400:
+                    queue.on_success()
+                return response
+
+            self.stats["retries"] += 1
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code in (429, 503):
+                self.stats["throttled"] += 1
+                queue.on_throttled()
+                queue.block(retry_after if retry_after is not None else self.backoff(attempt))
+            else:
+                time.sleep(retry_after if retry_after is not None else self.backoff(attempt))
+            response.close()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def call(self, domain, func, *args, topic=None, max_retries=None, **kwargs):
+        """
+        Run a non-`requests` fetch (e.g. a DuckDuckGo search through DDGS) in the
+        domain's schedule, retrying with backoff when it raises a rate-limit error.
+        """
+        retries = self.max_retries if max_retries is None else max_retries
+        queue = self._queue(domain)
+        for attempt in range(retries + 1):
+            queue.acquire(topic or current_topic())
+            self.stats["requests"] += 1
+            try:
+                result = func(*args, **kwargs)
+                queue.on_success()
+                return result
+            except Exception as e:
+                rate_limited = "ratelimit" in type(e).__name__.lower() or "rate limit" in str(e).lower()
+                if not rate_limited or attempt == retries:
+                    raise
+                self.stats["retries"] += 1
+                self.stats["throttled"] += 1
+                queue.on_throttled()
+                queue.block(self.backoff(attempt))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The process-wide RequestScheduler used by every fetcher"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
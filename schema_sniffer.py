@@ -0,0 +1,283 @@
+import csv
+import gzip
+import io
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from config import FILES_CONFIG
+from file_explorer import file_extension
+
+# optional readers: without them HDF5/parquet files are only identified by their magic bytes
+try:
+    import h5py
+except ImportError:
+    h5py = None
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+HEAD_BYTES = 64 * 1024
+HDF5_MAGIC = b"\x89HDF\r\n\x1a\n"
+MAX_COLUMNS = 40  # column names listed per table
+
+DELIMITED = {".csv": ",", ".tsv": "\t", ".tab": "\t", ".txt": None}
+FASTA = {".fa", ".fasta", ".fna", ".faa", ".ffn"}
+FASTQ = {".fastq", ".fq"}
+HDF5 = {".h5ad", ".h5", ".hdf5", ".loom"}
+SNIFFABLE = set(DELIMITED) | FASTA | FASTQ | HDF5 | {".mtx", ".vcf", ".parquet", ".pq"}
+
+
+def base_extension(path):
+    """Extension without a compression suffix, and whether the file is gzip/bgzip compressed"""
+    ext = file_extension(path)
+    for suffix in (".gz", ".bgz"):
+        if ext.endswith(suffix) and ext != suffix:
+            return ext[:-len(suffix)], True
+    return ext, False
+
+
+def is_sniffable(path):
+    return base_extension(path)[0] in SNIFFABLE
+
+
+def read_head(path, compressed=False, n_bytes=HEAD_BYTES):
+    """First `n_bytes` of a file (decompressed for .gz) as text; plain files are read through mmap"""
+    if compressed:
+        with gzip.open(path, "rb") as f:
+            data = f.read(n_bytes)
+    else:
+        size = os.path.getsize(path)
+        if size == 0:
+            return ""
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), min(size, n_bytes), access=mmap.ACCESS_READ) as m:
+            data = m[:]
+    return data.decode("utf-8", errors="replace")
+
+
+def _complete_lines(text, limit=None):
+    lines = text.splitlines()
+    if len(text) >= HEAD_BYTES and lines:
+        lines = lines[:-1]  # the last line may be cut
+    return lines[:limit] if limit else lines
+
+
+def _value_type(value):
+    if value == "" or value.upper() in ("NA", "NAN", "NULL", "NONE"):
+        return None
+    try:
+        int(value)
+        return "int"
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return "float"
+    except ValueError:
+        return "str"
+
+
+def sniff_delimited(path, ext, compressed):
+    text = read_head(path, compressed)
+    lines = _complete_lines(text, 50)
+    if not lines:
+        return {"format": "empty text file"}
+    delimiter = DELIMITED.get(ext)
+    if delimiter is None:
+        try:
+            delimiter = csv.Sniffer().sniff("\n".join(lines[:20]), delimiters=",\t;| ").delimiter
+        except csv.Error:
+            return {"format": "text", "first_line": lines[0][:200]}
+    rows = list(csv.reader(io.StringIO("\n".join(lines)), delimiter=delimiter))
+    rows = [row for row in rows if row]
+    header, body = rows[0], rows[1:]
+    n_cols = max(len(row) for row in rows)
+    types = []
+    for i in range(n_cols):
+        seen = {_value_type(row[i]) for row in body if i < len(row)} - {None}
+        types.append("str" if "str" in seen else "float" if "float" in seen else "int" if seen else "empty")
+    # a header row has text where the rest of its column is numeric; for all-text tables ask csv.Sniffer
+    has_header = any(_value_type(value) == "str" and types[i] in ("int", "float") for i, value in enumerate(header[:n_cols]))
+    if not has_header and body and all(t in ("str", "empty") for t in types):
+        try:
+            has_header = csv.Sniffer().has_header("\n".join(lines[:20]))
+        except csv.Error:
+            has_header = False
+    info = {
+        "format": {"\t": "TSV", ",": "CSV"}.get(delimiter, f"delimited ({delimiter!r})"),
+        "columns_count": n_cols,
+        "header": has_header,
+    }
+    if has_header:
+        if len(header) == n_cols - 1:
+            info["note"] = "header has one field less than the rows: the first column is the row index"
+            header = [""] + header
+        info["columns"] = header[:MAX_COLUMNS]
+    info["dtypes"] = types[:MAX_COLUMNS]
+    if not compressed and body:
+        sample = "\n".join(lines)
+        avg = len(sample.encode("utf-8")) / len(lines)
+        info["rows_estimate"] = int(os.path.getsize(path) / avg) - (1 if has_header else 0)
+    return info
+
+
+def sniff_mtx(path, compressed):
+    text = read_head(path, compressed, 4096)
+    lines = text.splitlines()
+    if not lines or not lines[0].startswith("%%MatrixMarket"):
+        return {"format": "unknown (.mtx without a MatrixMarket header)"}
+    banner = lines[0].split()
+    info = {"format": "MatrixMarket " + " ".join(banner[1:]), "note": "read with scipy.io.mmread (not pandas)"}
+    for line in lines[1:]:
+        if line.startswith("%") or not line.strip():
+            continue
+        dims = line.split()
+        if len(dims) >= 2:
+            info["shape"] = [int(dims[0]), int(dims[1])]
+        if len(dims) >= 3:
+            info["nonzeros"] = int(dims[2])
+        break
+    return info
+
+
+def sniff_fasta(path, compressed):
+    lines = _complete_lines(read_head(path, compressed))
+    headers = [line for line in lines if line.startswith(">")]
+    sequence = "".join(line.strip() for line in lines if line and not line.startswith(">"))[:5000].upper()
+    nucleotides = sum(sequence.count(base) for base in "ACGTUN")
+    return {
+        "format": "FASTA",
+        "first_header": headers[0][:200] if headers else None,
+        "records_in_first_64KB": len(headers),
+        "alphabet": "nucleotide" if sequence and nucleotides / len(sequence) > 0.9 else "protein",
+    }
+
+
+def sniff_fastq(path, compressed):
+    lines = _complete_lines(read_head(path, compressed), 8)
+    return {
+        "format": "FASTQ",
+        "first_header": lines[0][:200] if lines else None,
+        "read_length": len(lines[1]) if len(lines) > 1 else None,
+    }
+
+
+def sniff_vcf(path, compressed):
+    lines = _complete_lines(read_head(path, compressed))
+    meta = [line for line in lines if line.startswith("##")]
+    info = {"format": meta[0][2:] if meta and meta[0].startswith("##fileformat") else "VCF", "meta_lines": len(meta)}
+    for line in lines:
+        if line.startswith("#CHROM"):
+            columns = line[1:].split("\t")
+            samples = columns[9:]
+            info["columns"] = columns[:9]
+            info["samples_count"] = len(samples)
+            info["samples"] = samples[:10]
+            break
+    info["info_fields"] = [line.split("ID=")[1].split(",")[0] for line in meta if line.startswith("##INFO=<ID=")][:MAX_COLUMNS]
+    return info
+
+
+def _h5_shape(node):
+    if isinstance(node, h5py.Dataset):
+        return list(node.shape), str(node.dtype)
+    # sparse matrices are stored as groups with a shape attribute
+    shape = node.attrs.get("shape", node.attrs.get("h5sparse_shape"))
+    encoding = _decode(node.attrs.get("encoding-type", node.attrs.get("h5sparse_format", "")))
+    dtype = str(node["data"].dtype) if "data" in node else None
+    return ([int(x) for x in shape] if shape is not None else None), f"{dtype} ({encoding})" if encoding else dtype
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def sniff_hdf5(path, ext):
+    with open(path, "rb") as f:
+        if f.read(8) != HDF5_MAGIC:
+            return {"format": f"unknown ({ext} without an HDF5 signature)"}
+    if h5py is None:
+        return {"format": "HDF5", "note": "install h5py to inspect its contents"}
+    with h5py.File(path, "r") as f:
+        if ext == ".h5ad" or ("obs" in f and "var" in f and "X" in f):
+            info = {"format": "AnnData (.h5ad)", "note": "read with anndata.read_h5ad / scanpy.read_h5ad"}
+            if "X" in f:
+                info["X_shape"], info["X_dtype"] = _h5_shape(f["X"])
+            for axis in ("obs", "var"):
+                if axis in f:
+                    group = f[axis]
+                    order = group.attrs.get("column-order", [])
+                    info[f"{axis}_columns"] = [_decode(c) for c in order][:MAX_COLUMNS]
+            for key in ("layers", "obsm", "varm", "obsp", "uns"):
+                if key in f:
+                    info[key] = list(f[key].keys())[:MAX_COLUMNS]
+            return info
+        datasets = []
+        f.visititems(lambda name, node: datasets.append(name) if isinstance(node, h5py.Dataset) else None)
+        info = {"format": "HDF5", "groups": list(f.keys())[:MAX_COLUMNS], "datasets_count": len(datasets)}
+        info["datasets"] = {name: _h5_shape(f[name])[0] for name in datasets[:20]}
+        return info
+
+
+def sniff_parquet(path):
+    if pq is None:
+        with open(path, "rb") as f:
+            magic = f.read(4)
+        return {"format": "Parquet" if magic == b"PAR1" else "unknown", "note": "install pyarrow to inspect its schema"}
+    parquet = pq.ParquetFile(path)
+    schema = parquet.schema_arrow
+    return {
+        "format": "Parquet",
+        "rows": parquet.metadata.num_rows,
+        "row_groups": parquet.metadata.num_row_groups,
+        "columns": schema.names[:MAX_COLUMNS],
+        "dtypes": [str(t) for t in schema.types][:MAX_COLUMNS],
+    }
+
+
+def sniff_file(path):
+    """
+    Describe a data file from its header only (the first KBs, the MatrixMarket banner,
+    HDF5 or parquet metadata). Returns a dict with the format, dimensions, columns and
+    dtypes where they can be determined, or None for file types that are not sniffed.
+    """
+    ext, compressed = base_extension(path)
+    try:
+        if ext in DELIMITED:
+            return sniff_delimited(path, ext, compressed)
+        if ext == ".mtx":
+            return sniff_mtx(path, compressed)
+        if ext in FASTA:
+            return sniff_fasta(path, compressed)
+        if ext in FASTQ:
+            return sniff_fastq(path, compressed)
+        if ext == ".vcf":
+            return sniff_vcf(path, compressed)
+        if ext in HDF5 and not compressed:
+            return sniff_hdf5(path, ext)
+        if ext in (".parquet", ".pq") and not compressed:
+            return sniff_parquet(path)
+    except Exception as e:
+        return {"format": "unreadable", "error": str(e)[:200]}
+    return None
+
+
+def sniff_files(paths, max_workers=None):
+    """Sniff several files in parallel; returns {path: schema} for the files that could be described"""
+    max_workers = max_workers or FILES_CONFIG["max_workers"]
+    paths = [path for path in paths if is_sniffable(path)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = dict(zip(paths, executor.map(sniff_file, paths)))
+    return {path: schema for path, schema in results.items() if schema is not None}
+
+
+def format_schema(schema):
+    """One-line description of a sniffed schema for the files report"""
+    parts = [schema["format"]]
+    for key, value in schema.items():
+        if key == "format" or value in (None, [], {}):
+            continue
+        if isinstance(value, list) and key in ("shape", "X_shape"):
+            value = " x ".join(str(v) for v in value)
+        parts.append(f"{key}={value}")
+    return "; ".join(str(p) for p in parts)
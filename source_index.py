@@ -0,0 +1,227 @@
+import re
+import sqlite3
+import threading
+from collections import Counter
+from config import RETRIEVAL_CONFIG
+from sources import SourceStore
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]{2,}")
+
+# words that carry no retrieval signal; dropping them keeps FTS5 OR-queries selective
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "are", "was", "were", "have", "has",
+    "will", "would", "should", "can", "could", "into", "using", "use", "based", "about", "which",
+    "their", "there", "these", "those", "then", "than", "them", "they", "you", "your", "our",
+    "all", "any", "not", "but", "its", "also", "how", "what", "when", "where", "who", "why",
+    "please", "want", "need", "understand", "write", "code", "located", "files", "file",
+    "of", "to", "in", "on", "is", "it", "be", "as", "by", "or", "an", "at", "we", "do",
+}
+
+
+def chunk_text(text, chunk_chars=None, overlap=None):
+    """
+    Split text into overlapping chunks of about `chunk_chars` characters, cutting at
+    line breaks or spaces where possible. Returns a list of (start, end) offsets.
+    """
+    chunk_chars = chunk_chars or RETRIEVAL_CONFIG["chunk_chars"]
+    overlap = RETRIEVAL_CONFIG["chunk_overlap"] if overlap is None else overlap
+    overlap = min(overlap, chunk_chars // 4)  # keep every chunk advancing by most of its length
+    spans = []
+    start, length = 0, len(text)
+    while start < length:
+        end = min(length, start + chunk_chars)
+        if end < length:
+            cut = text.rfind("\n", start + chunk_chars // 2, end)
+            if cut == -1:
+                cut = text.rfind(" ", start + chunk_chars // 2, end)
+            if cut != -1:
+                end = cut
+        spans.append((start, end))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def build_match_query(text, max_terms=32):
+    """Turn free text into an FTS5 OR-query of quoted terms (safe against FTS5 syntax characters)"""
+    counts = Counter(word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS)
+    # for long queries (e.g. a whole draft report) keep the most frequent terms
+    terms = [word for word, _ in counts.most_common(max_terms)]
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class SourceIndex:
+    """
+    Local full-text index over the gathered sources.
+
+    Each source is kept as a lazily loaded Source handle (its text lives in a
+    SourceStore spool file), and its chunks are stored in an SQLite FTS5 table in
+    a temporary on-disk database; search() returns the top-k chunks by BM25 score.
+    Sources added with pinned=True (directory and file listings the code writer
+    must see verbatim) are always rendered in full.
+    Prompt builders call render(query) so that only relevant passages reach the
+    LLM and prompt size stays flat as the corpus grows.
+
+    After enable_semantic(), search() also runs a cosine search over the chunk
+    embeddings and fuses both rankings with reciprocal rank fusion. After
+    set_digest(), render() leads with the corpus digest and only a few raw passages.
+    """
+
+    RRF_K = 60
+
+    def __init__(self, path="", chunk_chars=None, chunk_overlap=None, top_k=None, store=None, retrieval=True):
+        # path="" is SQLite's private temporary on-disk database, so chunk text does not sit in memory
+        self.chunk_chars = chunk_chars or RETRIEVAL_CONFIG["chunk_chars"]
+        self.chunk_overlap = RETRIEVAL_CONFIG["chunk_overlap"] if chunk_overlap is None else chunk_overlap
+        self.top_k = top_k or RETRIEVAL_CONFIG["top_k"]
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5("
+            "text, kind UNINDEXED, origin UNINDEXED, source_id UNINDEXED, start UNINDEXED, end UNINDEXED, "
+            "tokenize='porter unicode61')"
+        )
+        self.store = store or SourceStore()
+        self.retrieval = retrieval
+        self.sources = []  # Source handles in insertion order
+        self.vector_store = None
+        self.vector_rows = None  # store row of each embedded chunk
+        self.vector_chunk_ids = None  # chunk rowid for each entry of vector_rows
+        self.digest = None
+
+    def add_source(self, kind, origin, text, pinned=False):
+        """Spool, chunk and index one source; returns the number of chunks added"""
+        if not text:
+            return 0
+        source_id = len(self.sources)
+        self.sources.append(self.store.add(kind, origin, text, pinned))
+        if pinned or not self.retrieval:
+            return 0
+        spans = chunk_text(text, self.chunk_chars, self.chunk_overlap)
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO chunks (text, kind, origin, source_id, start, end) VALUES (?, ?, ?, ?, ?, ?)",
+                [(text[s:e], kind, origin, source_id, s, e) for s, e in spans],
+            )
+            self.conn.commit()
+        return len(spans)
+
+    def enable_semantic(self, vector_store):
+        """
+        Embed every indexed chunk through `vector_store` (reusing stored embeddings)
+        so that search() combines BM25 with cosine similarity.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT rowid, text FROM chunks ORDER BY rowid").fetchall()
+        if not rows:
+            return 0
+        self.vector_rows = vector_store.add_texts([text for _, text in rows])
+        self.vector_chunk_ids = [rowid for rowid, _ in rows]
+        self.vector_store = vector_store
+        return len(rows)
+
+    def set_digest(self, digest, top_k=None):
+        """Attach the corpus digest (see digest.SourceDigester); `top_k` lowers the number of raw passages rendered with it"""
+        self.digest = digest or None
+        if self.digest and top_k:
+            self.top_k = top_k
+
+    def _rows(self, sql, params):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _lexical_ids(self, query, k):
+        match = build_match_query(query)
+        if not match:
+            return []
+        rows = self._rows("SELECT rowid FROM chunks WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?", (match, k))
+        return [rowid for (rowid,) in rows]
+
+    def _semantic_ids(self, query, k):
+        try:
+            query_vector = self.vector_store.embed_query(query)
+        except Exception as e:
+            print(f"Semantic retrieval unavailable, using BM25 only: {e}")
+            return []
+        positions, _ = self.vector_store.search(query_vector, k, rows=self.vector_rows)
+        return [self.vector_chunk_ids[p] for p in positions]
+
+    def search(self, query, k=None):
+        """Return the top-k chunks for `query` as dicts (best first)"""
+        k = k or self.top_k
+        if self.vector_store is None:
+            ranked = self._lexical_ids(query, k)
+            scores = {}
+        else:
+            # reciprocal rank fusion of the BM25 and cosine rankings
+            scores = {}
+            for ranking in (self._lexical_ids(query, 3 * k), self._semantic_ids(query, 3 * k)):
+                for rank, rowid in enumerate(ranking):
+                    scores[rowid] = scores.get(rowid, 0.0) + 1.0 / (self.RRF_K + rank + 1)
+            ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        if not ranked:
+            return []
+        placeholders = ",".join("?" * len(ranked))
+        rows = self._rows(
+            f"SELECT rowid, text, kind, origin, source_id, start, end FROM chunks WHERE rowid IN ({placeholders})",
+            ranked,
+        )
+        by_id = {row[0]: row for row in rows}
+        results = []
+        for position, rowid in enumerate(ranked):
+            _, text, kind, origin, source_id, start, end = by_id[rowid]
+            results.append({
+                "text": text, "kind": kind, "origin": origin, "source_id": source_id,
+                "start": start, "end": end, "score": scores.get(rowid, -position),
+            })
+        return results
+
+    def render(self, query, k=None):
+        """
+        Prompt text for `query`: the corpus digest (if any), every pinned source in
+        full, then the top-k retrieved passages grouped by source in document order.
+        With retrieval disabled and no digest every source is rendered in full.
+        """
+        if not self.retrieval and not self.digest:
+            return str(self)
+        parts = [f"Digest of the sources:\n{self.digest}"] if self.digest else []
+        parts.extend(f"{source.kind}:\n{source.text()}" for source in self.sources if source.pinned)
+        passages = sorted(self.search(query, k), key=lambda p: (p["source_id"], p["start"])) if self.retrieval else []
+        if passages:
+            parts.append("Relevant passages retrieved from the sources:")
+            for passage in passages:
+                parts.append(f"[{passage['kind']} | {passage['origin']}]\n{passage['text'].strip()}")
+        return "\n\n".join(parts)
+
+    def preview(self, max_chars=1000):
+        """The first `max_chars` characters of the full layout, reading only what is needed"""
+        parts, remaining = [], max_chars
+        for source in self.sources:
+            if remaining <= 0:
+                break
+            part = f"{source.kind}:\n{source.text(max_bytes=4 * remaining)}"[:remaining]
+            parts.append(part)
+            remaining -= len(part) + 2
+        return "\n\n".join(parts)[:max_chars]
+
+    def summary(self):
+        """One line per source: kind, origin, size and estimated tokens"""
+        return "\n".join(
+            f"- {source.kind} ({source.origin}): {source.length:,} bytes, ~{source.n_tokens:,} tokens"
+            for source in self.sources
+        )
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __str__(self):
+        """All sources in full, in the same layout BrowsingAgent used before indexing"""
+        return "\n\n".join(f"{source.kind}:\n{source.text()}" for source in self.sources)
+
+
+def render_sources(sources, query, k=None):
+    """Prompt text for `sources`: top-k passages for an index, or the string itself"""
+    if hasattr(sources, "render"):
+        return sources.render(query, k)
+    return sources
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import threading
+from cache_utils import content_hash
+
+
+def estimate_tokens(text):
+    """Rough LLM token count (~4 characters per token for English text and code)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+class Source:
+    """
+    Handle to one gathered source. Only the metadata lives in memory; the text sits
+    in the SourceStore spool file and is read back by byte range when text() is called.
+    """
+
+    __slots__ = ("kind", "origin", "offset", "length", "sha256", "n_tokens", "pinned", "store")
+
+    def __init__(self, kind, origin, offset, length, sha256, n_tokens, pinned, store):
+        self.kind = kind
+        self.origin = origin
+        self.offset = offset
+        self.length = length
+        self.sha256 = sha256
+        self.n_tokens = n_tokens
+        self.pinned = pinned
+        self.store = store
+
+    def text(self, max_bytes=None):
+        """Materialize the content (or only its first `max_bytes` bytes)"""
+        length = self.length if max_bytes is None else min(self.length, max_bytes)
+        return self.store.read(self.offset, length)
+
+    def __repr__(self):
+        return f"Source(kind={self.kind!r}, origin={self.origin!r}, bytes={self.length}, tokens~{self.n_tokens})"
+
+
+class SourceStore:
+    """
+    Append-only spool file holding the content of every Source. The file is an
+    anonymous temporary file by default, so it disappears with the process.
+    """
+
+    def __init__(self, path=None):
+        if path:
+            self.file = open(path, "a+b")
+        else:
+            self.file = tempfile.TemporaryFile()
+        self.lock = threading.Lock()
+        self.file.seek(0, os.SEEK_END)
+        self.size = self.file.tell()
+
+    def add(self, kind, origin, text, pinned=False):
+        data = text.encode("utf-8", errors="replace")
+        with self.lock:
+            offset = self.size
+            self.file.seek(offset)
+            self.file.write(data)
+            self.file.flush()
+            self.size += len(data)
+        return Source(kind, origin, offset, len(data), content_hash(data), estimate_tokens(text), pinned, self)
+
+    def read(self, offset, length):
+        with self.lock:
+            self.file.seek(offset)
+            data = self.file.read(length)
+        # a max_bytes cut may split a multi-byte character
+        return data.decode("utf-8", errors="ignore")
+
+    def close(self):
+        self.file.close()
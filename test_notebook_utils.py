@@ -0,0 +1,37 @@
+import json
+from notebook_utils import iter_notebook_cells, notebook_to_text
+
+
+def make_notebook(source, outputs):
+    # nbformat writes cell keys sorted, so "outputs" comes before "source"
+    cell = {"cell_type": "code", "execution_count": 1, "metadata": {}, "outputs": outputs, "source": source}
+    return json.dumps({"cells": [cell], "metadata": {}, "nbformat": 4, "nbformat_minor": 5}, sort_keys=True)
+
+
+def test_large_html_output_keeps_source():
+    """A 30KB text/html output (e.g. a DataFrame) must not use up the budget of the cell's source"""
+    html = "<table>" + "<tr><td>1</td></tr>" * 2000 + "</table>"
+    output = {"output_type": "execute_result", "execution_count": 1, "metadata": {},
+              "data": {"text/html": [html], "text/plain": ["   a\n0  1"]}}
+    notebook = make_notebook(["import pandas as pd\n", "df = pd.DataFrame({'a': [1]})\n", "df"], [output])
+
+    cell = next(iter_notebook_cells(notebook, max_cell_chars=20000))
+    assert "".join(cell["source"]).startswith("import pandas as pd")
+    assert cell["outputs"][0]["data"]["text/html"] == [""]
+
+    text = notebook_to_text(notebook, max_cell_chars=20000)
+    assert "df = pd.DataFrame" in text
+    assert "0  1" in text
+
+
+def test_cell_budget_marks_truncation():
+    """Strings emptied by the cell budget are announced by one marker instead of vanishing"""
+    lines = [f"x_{i} = {i}\n" for i in range(2000)]
+    notebook = make_notebook(lines, [{"output_type": "stream", "name": "stdout", "text": ["y" * 50000]}])
+
+    cell = next(iter_notebook_cells(notebook, max_string_chars=20000, max_cell_chars=5000))
+    source = "".join(cell["source"])
+    assert source.startswith("x_0 = 0")
+    assert source.count("...[cell truncated]") == 1
+    assert len(source) <= 5000 + len("...[cell truncated]")
+    assert cell["_truncated_chars"] > 0
@@ -7,9 +7,16 @@ from bs4 import BeautifulSoup
 import requests
 from llm_utils import query_llm
 import prompts
-import PyPDF2
 import io
 import json
+import notebook_utils
+from rate_limit import get_scheduler, request_topic
+from config import FILES_CONFIG, PDF_SUMMARY_CONFIG
+from digest import SourceDigester
+import pdf_utils
+import file_explorer
+from file_index import get_file_index
+import schema_sniffer
 
 
 def save_output(report, code, execution_result, iteration):
@@ -73,9 +80,13 @@ def extract_code_only(text):
 def quick_duckduckgo_search(query, max_results=3):
     print(f"Performing quick DuckDuckGo search for: '{query}'")
     try:
-        with DDGS() as ddgs:
-            results = ddgs.text(query)
-            top_results = list(results)[:max_results]
+        def run_search():
+            with DDGS() as ddgs:
+                return list(ddgs.text(query))[:max_results]
+
+        # goes through the shared scheduler, which paces DuckDuckGo and backs off on rate-limit errors
+        with request_topic(query):
+            top_results = get_scheduler().call("duckduckgo.com", run_search)
 
         raw_text = "\n\n".join(
             f"{i+1}. {r['title']}\n    {r['href']}\n    {r.get('body', '').strip()}"
@@ -96,33 +107,99 @@ def quick_duckduckgo_search(query, max_results=3):
         return f"DuckDuckGo search failed: {e}"
 
 
-def extract_pdf_text(pdf_path):
+def extract_pdf_texts(pdf_paths, sections=None):
+    """
+    Extract text from several PDF files in parallel (see pdf_utils.extract_pdfs).
+    References, acknowledgements, supplementary material and running headers/footers are
+    dropped; pass `sections` (e.g. ["abstract", "methods"]) to keep only those sections.
+    Returns a list of dictionaries with filename and extracted text, in the order of `pdf_paths`.
+    """
+    texts, errors = pdf_utils.extract_pdfs(pdf_paths, verbose=len(pdf_paths) > 1, sections=sections)
+    results = []
+    for pdf_path in pdf_paths:
+        if pdf_path in errors:
+            print(f"PyPDF2 failed for {pdf_path}: {errors[pdf_path]}")
+            content = f"Error extracting text from PDF: {errors[pdf_path]}"
+        else:
+            content = texts[pdf_path].strip()
+        results.append({"filename": os.path.basename(pdf_path), "content": content})
+    return results
+
+
+def extract_pdf_text(pdf_path, sections=None):
     """
-    Extract text from a PDF file using multiple methods for better coverage.
+    Extract text from a PDF file; the pages of large files are extracted in parallel.
     Returns a dictionary with filename and extracted text.
     """
-    try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-        
-        return {
-            "filename": os.path.basename(pdf_path),
-            "content": text.strip()
-        }
-    except Exception as e:
-        print(f"PyPDF2 failed for {pdf_path}: {e}")
-        return {
-            "filename": os.path.basename(pdf_path),
-            "content": f"Error extracting text from PDF: {e}"
-        }
+    return extract_pdf_texts([pdf_path], sections)[0]
+
+
+def iter_pdf_files(paths):
+    """Yield PDF file paths from a list of files and directories (directories are walked recursively)"""
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Warning: PDF file not found: {path}")
+            continue
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for filename in sorted(files):
+                    if filename.lower().endswith('.pdf'):
+                        yield os.path.join(root, filename)
+        else:
+            yield path
 
 
-def process_pdfs(pdf_paths):
+def summarize_pdfs(pdf_files, verbose=True, sections=None):
+    """
+    Map-reduce summaries of a PDF collection.
+    Papers are processed PDF_SUMMARY_CONFIG["batch_papers"] at a time: the chunk summaries of a batch
+    run concurrently across the LLM endpoint pool and are reduced per paper, then the paper
+    summaries are reduced into a collection overview. Paper summaries are cached by the PDF's
+    content hash, so a paper is only read and summarized once across runs and topics.
+    Returns the overview and a list of (filename, summary).
+    """
+    digester = SourceDigester(verbose=verbose)
+    batch_size = PDF_SUMMARY_CONFIG["batch_papers"]
+    summaries = []
+    for start in range(0, len(pdf_files), batch_size):
+        batch = pdf_files[start:start + batch_size]
+        # the summary depends on which part of the paper was kept
+        selection = ",".join(sorted({section_name(name) for name in sections})) if sections else "default"
+        keys = [digester.cache_key(f"{pdf_utils.pdf_hash(path)}:{selection}") for path in batch]
+        results = {}
+        missing = []
+        for path, key in zip(batch, keys):
+            cached = digester.cache.get(key)
+            if cached is not None:
+                results[path] = cached["digest"]
+            else:
+                missing.append(path)
+        documents = []
+        for path, extracted in zip(missing, extract_pdf_texts(missing, sections) if missing else []):
+            content = extracted["content"]
+            if content.startswith("Error extracting text from PDF"):
+                results[path] = content  # not cached, so the paper is retried next time
+            else:
+                documents.append((path, content))
+        if verbose:
+            print(f"Summarizing PDFs {start + 1}-{start + len(batch)} of {len(pdf_files)} ({len(documents)} not cached)")
+        digests = digester.digest_texts([(path, content) for path, content in documents])
+        del documents
+        for path, key in zip(batch, keys):
+            if path in digests:
+                results[path] = digests[path]
+                digester.cache.set(key, {"kind": "PDF", "origin": path, "digest": digests[path]})
+            summaries.append((os.path.basename(path), results[path]))
+    overview = digester.summarize_collection([f"PDF: {name}\n{summary}" for name, summary in summaries])
+    return overview, summaries
+
+
+def process_pdfs(pdf_paths, summarize=None, sections=None):
     """
     Process multiple PDF files and return their extracted text.
+    With summarize=True (the default for more than PDF_SUMMARY_CONFIG["summarize_above"] files)
+    each paper is replaced by its map-reduce summary and the collection gets an overview.
+    `sections` restricts the text to the given paper sections (see pdf_sections.SECTION_HEADINGS).
     """
     if not pdf_paths:
         return ""
@@ -135,22 +212,24 @@ def process_pdfs(pdf_paths):
     #     else:
     #         print(f"Warning: PDF file not found: {pdf_path}")
 
-    def iter_pdf_files(paths):
-        for path in paths:
-            if not os.path.exists(path):
-                print(f"Warning: PDF file not found: {path}")
-                continue
-            if os.path.isdir(path):
-                for root, _, files in os.walk(path):
-                    for filename in sorted(files):
-                        if filename.lower().endswith('.pdf'):
-                            yield os.path.join(root, filename)
-            else:
-                yield path
-
-    for pdf_path in iter_pdf_files(pdf_paths):
-        content = extract_pdf_text(pdf_path)
-        pdf_contents.append(content)
+    pdf_files = list(iter_pdf_files(pdf_paths))
+    if summarize is None:
+        summarize = len(pdf_files) > PDF_SUMMARY_CONFIG["summarize_above"]
+    if summarize and pdf_files:
+        try:
+            overview, summaries = summarize_pdfs(pdf_files, sections=sections)
+            formatted_pdfs = "\n\n".join(
+                f"PDF: {filename} (summary)\n"
+                f"{'='*50}\n"
+                f"{summary}\n"
+                f"{'='*50}"
+                for filename, summary in summaries
+            )
+            return f"PDF collection overview ({len(summaries)} papers):\n{overview}\n\n{formatted_pdfs}"
+        except Exception as e:
+            print(f"PDF summarization failed, including the full text instead: {e}")
+
+    pdf_contents = extract_pdf_texts(pdf_files, sections) if pdf_files else []
 
 
     
@@ -231,19 +310,18 @@ def extract_huggingface_content(url):
         # Convert blob URL to resolve URL
         resolve_url = url.replace('/blob/', '/resolve/')
         
+        # Stream notebooks cell by cell instead of downloading and parsing them whole
+        if url.endswith('.ipynb'):
+            return notebook_utils.notebook_to_text(resolve_url, include_outputs=False)
+        
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(resolve_url, headers=headers, timeout=10)
+        response = get_scheduler().get(resolve_url, headers=headers, timeout=10)
         if response.status_code == 200:
             content = response.text
-            
-            # Try to parse as Jupyter notebook
-            if url.endswith('.ipynb'):
-                return parse_jupyter_notebook(content)
-            else:
-                return content[:2000] + "..." if len(content) > 2000 else content
+            return content[:2000] + "..." if len(content) > 2000 else content
         else:
             print(f"Failed to fetch HuggingFace content: {response.status_code}")
             return None
@@ -263,7 +341,7 @@ def extract_github_content(url):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(raw_url, headers=headers, timeout=10)
+        response = get_scheduler().get(raw_url, headers=headers, timeout=10)
         if response.status_code == 200:
             content = response.text
             return content[:2000] + "..." if len(content) > 2000 else content
@@ -283,7 +361,7 @@ def extract_basic_content(url):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(url, headers=headers, timeout=10)
+        response = get_scheduler().get(url, headers=headers, timeout=10)
         if response.status_code == 200:
             soup = BeautifulSoup(response.content, 'html.parser')
             text_content = soup.get_text()
@@ -298,76 +376,55 @@ def extract_basic_content(url):
 
 
 def parse_jupyter_notebook(content):
-    """Parse Jupyter notebook content"""
+    """Parse Jupyter notebook content (JSON text or a local .ipynb path), streaming it cell by cell"""
     try:
-        notebook = json.loads(content)
-        cells = notebook.get('cells', [])
-        
-        extracted_text = []
-        for i, cell in enumerate(cells):
-            cell_type = cell.get('cell_type', '')
-            source = cell.get('source', [])
-            
-            if isinstance(source, list):
-                text = ''.join(source)
-            else:
-                text = str(source)
-            
-            if cell_type == 'markdown':
-                extracted_text.append(f"## Cell {i+1} (Markdown)\n{text}\n")
-            elif cell_type == 'code':
-                extracted_text.append(f"## Cell {i+1} (Code)\n```python\n{text}\n```\n")
-        
-        return '\n'.join(extracted_text)
+        return notebook_utils.notebook_to_text(content, include_outputs=False)
     except Exception as e:
         print(f"Error parsing notebook: {e}")
         return content
 
 
-def explore_files_directory(directory_path):
+def sniff_data_files(directory_path, files):
+    """
+    Describe up to FILES_CONFIG["sniff_files"] data files (spread across formats) from their headers:
+    dimensions, column names and dtypes. Schemas are cached in the file index while a file is unchanged.
+    Returns {relative path: one-line description}.
+    """
+    candidates = [f for f in files if schema_sniffer.is_sniffable(f.path)]
+    selected = file_explorer.sample_listing(candidates, FILES_CONFIG["sniff_files"])
+    if not selected:
+        return {}
+    index = get_file_index() if FILES_CONFIG["index"] else None
+    schemas = index.get_schemas(directory_path, selected) if index else {}
+    missing = [f for f in selected if f.path not in schemas]
+    if missing:
+        sniffed = schema_sniffer.sniff_files([os.path.join(directory_path, f.path) for f in missing])
+        found = {f.path: sniffed[os.path.join(directory_path, f.path)] for f in missing if os.path.join(directory_path, f.path) in sniffed}
+        if index:
+            index.set_schemas(directory_path, missing, found)
+        schemas.update(found)
+    return {path: schema_sniffer.format_schema(schema) for path, schema in schemas.items()}
+
+
+def explore_files_directory(directory_path, ignore=None, max_depth=None, max_files=None):
     """
-    Explore a directory and return a simple file listing for LLM analysis.
+    Explore a directory and return a bounded file report for LLM analysis:
+    totals, per-extension and per-directory summaries with sample paths, and a capped file listing.
+    The walk uses parallel os.scandir calls; see FILES_CONFIG for the ignore globs and limits.
+    With FILES_CONFIG["index"] the tree is kept in a persistent index, so only directories that
+    changed since the last run are re-listed and the report says which files were added, removed or changed.
     """
     try:
         if not os.path.exists(directory_path):
             return f"Error: Directory {directory_path} does not exist."
-        
-        file_list = []
-        
-        # Walk through the directory and collect file information
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, directory_path)
-                
-                # Get file size
-                try:
-                    file_size = os.path.getsize(file_path)
-                    size_str = f"{file_size:,} bytes"
-                    if file_size > 1024*1024:
-                        size_str = f"{file_size/(1024*1024):.1f} MB"
-                    elif file_size > 1024:
-                        size_str = f"{file_size/1024:.1f} KB"
-                except:
-                    size_str = "Unknown size"
-                
-                file_list.append({
-                    'path': relative_path,
-                    'size': size_str,
-                    'extension': os.path.splitext(file)[1].lower()
-                })
-        
-        # Create a simple report for LLM analysis
-        report = f"FILES DIRECTORY EXPLORATION\n"
-        report += f"Directory: {directory_path}\n"
-        report += f"Total files found: {len(file_list)}\n\n"
-        report += f"FILE LISTING:\n"
-        report += "-" * 50 + "\n"
-        
-        for file_info in file_list:
-            report += f"{file_info['path']} ({file_info['size']})\n"
-        
-        return report
-        
+
+        changes = None
+        if FILES_CONFIG["index"]:
+            result, changes = get_file_index().scan(directory_path, ignore=ignore, max_depth=max_depth, max_files=max_files)
+        else:
+            result = file_explorer.scan_directory(directory_path, ignore=ignore, max_depth=max_depth, max_files=max_files)
+        schemas = sniff_data_files(directory_path, result.files)
+        return file_explorer.format_report(directory_path, result, changes=changes, schemas=schemas)
+
     except Exception as e:
         return f"Error exploring files directory: {str(e)}"
\ No newline at end of file
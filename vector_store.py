@@ -0,0 +1,125 @@
+import json
+import os
+import re
+import threading
+import numpy as np
+from cache_utils import content_hash
+from config import CACHE_DIR, LLM_CONFIG, RETRIEVAL_CONFIG
+from llm_utils import embed_texts
+
+
+class VectorStore:
+    """
+    Persistent embedding store.
+
+    Vectors are L2-normalised float32 rows appended to `vectors.f32` and read back
+    as a memory-mapped (n, dim) matrix; `meta.json` is the sidecar holding the
+    model name, the dimension and the content hash of each row. Texts are keyed by
+    the hash of (model, text), so chunks that were embedded in an earlier run are
+    reused instead of being sent to the embedding model again.
+    """
+
+    def __init__(self, directory=None, model=None, batch_size=None):
+        self.model = model or LLM_CONFIG["embedding_model"]
+        self.batch_size = batch_size or RETRIEVAL_CONFIG["embedding_batch_size"]
+        self.directory = directory or os.path.join(CACHE_DIR, "vectors", re.sub(r"[^\w.-]", "_", self.model))
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.lock = threading.Lock()
+        self.dim = None
+        self.hashes = []
+        self.row_of = {}
+        self.matrix = None
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = meta.get("dim")
+            self.hashes = meta.get("hashes", [])
+        if self.dim and os.path.exists(self.vectors_path):
+            rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            self.hashes = self.hashes[:rows]
+        else:
+            self.hashes = []
+        # rows written without their metadata (e.g. an interrupted run) are cut off, so that the
+        # next rows appended line up with their hashes again
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) > len(self.hashes) * 4 * (self.dim or 0):
+            os.truncate(self.vectors_path, len(self.hashes) * 4 * (self.dim or 0))
+        self.row_of = {h: i for i, h in enumerate(self.hashes)}
+        self._map()
+
+    def _map(self):
+        if self.hashes:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.hashes), self.dim))
+        else:
+            self.matrix = None
+
+    def _save_meta(self):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "dim": self.dim, "hashes": self.hashes}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _key(self, text):
+        return content_hash(f"{self.model}\n{text}")
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_texts(self, texts):
+        """
+        Make sure every text has a vector and return their row numbers (np.int64 array).
+        Only texts whose hash is not stored yet are embedded, in batches.
+        """
+        keys = [self._key(text) for text in texts]
+        with self.lock:
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self.row_of and key not in missing:
+                    missing[key] = text
+            if missing:
+                vectors = self._normalize(embed_texts(list(missing.values()), model=self.model, batch_size=self.batch_size))
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dimension changed from {self.dim} to {vectors.shape[1]}")
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vectors.tobytes())
+                for key in missing:
+                    self.row_of[key] = len(self.hashes)
+                    self.hashes.append(key)
+                self._save_meta()
+                self._map()
+            return np.array([self.row_of[key] for key in keys], dtype=np.int64)
+
+    def embed_query(self, text):
+        """Normalised embedding of a query (not stored)"""
+        text = text[:RETRIEVAL_CONFIG["query_chars"]]
+        return self._normalize(embed_texts([text], model=self.model, batch_size=1))[0]
+
+    def search(self, query_vector, k, rows=None):
+        """
+        Top-k cosine search as a single matrix-vector product.
+        `rows` restricts the search to a subset of stored rows (e.g. the current corpus).
+        Returns (positions, scores) where positions index into `rows` (or the full matrix).
+        """
+        if self.matrix is None:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        scores = matrix @ np.asarray(query_vector, dtype=np.float32)
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def __len__(self):
+        return len(self.hashes)